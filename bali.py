@@ -13,16 +13,32 @@ Authors: Katherine Young <kayoung@mit.edu>
 from __future__ import print_function, absolute_import, division
 
 #import bali  
+import bisect
+import collections
+import difflib
+import fnmatch
+import glob
 import io
 import os 
 import re
+import concurrent.futures
 #import weakref
 import unittest
 import copy
 import random
 import enum
+import functools
+import numbers
 
 import music21 # @UnresolvedImport
+import numpy # @UnresolvedImport
+
+import profiling
+
+# Raise analysisVersion whenever a change makes the analyses give different
+# numbers for the same corpus, so that results kept on disk (such as
+# report.ResultCache) are not taken for current ones.
+analysisVersion = 2
 
 class BaliException(Exception):
     pass
@@ -30,13 +46,752 @@ class BaliException(Exception):
 class IncorrectBeatNumberException(BaliException):
     pass
 
+class AlignmentException(BaliException):
+    pass
+
 class BeatLevel(enum.IntEnum):
     pulse = 1
     double = 2
     guntang = 4
     twoBeat = 8
     fourBeat = 16
-    
+
+_bitCount = getattr(int, 'bit_count', lambda mask: bin(mask).count('1'))
+
+def popcount(mask):
+    '''
+    The number of bits set in the integer mask.
+
+    >>> import bali
+    >>> bali.popcount(0b10110)
+    3
+    '''
+    return _bitCount(mask)
+
+@functools.lru_cache(maxsize=None)
+def slotMask(start, stop, step=1):
+    '''
+    An integer with bits start, start + step, ... (up to but not including
+    stop) set.  Bit i stands for stroke i of a pattern, bit 0 being the
+    stroke before the first beat, so set operations on these masks answer
+    questions about positions.  The second half of a 16-slot cycle:
+
+    >>> import bali
+    >>> bin(bali.slotMask(9, 17))
+    '0b11111111000000000'
+    '''
+    mask = 0
+    for i in range(start, stop, step):
+        mask |= 1 << i
+    return mask
+
+def beatLevelMask(beatLevel, numSlots=16):
+    '''
+    The mask of the slots from 1 to numSlots that fall on a beat of
+    beatLevel, that is, whose number is a multiple of it.
+
+    >>> import bali
+    >>> bin(bali.beatLevelMask(bali.BeatLevel.guntang))
+    '0b10001000100010000'
+    >>> bali.beatLevelMask(bali.BeatLevel.pulse) == bali.slotMask(1, 17)
+    True
+    '''
+    if beatLevel < len(_onBeatMasks) and numSlots < _maxTableSlots:
+        return _onBeatMasks[beatLevel] & ((2 << numSlots) - 2)
+    return slotMask(int(beatLevel), numSlots + 1, int(beatLevel))
+
+_maxTableSlots = 1024
+# _onBeatMasks[level]: every slot up to _maxTableSlots that is a multiple of level
+_onBeatMasks = [0] + [slotMask(level, _maxTableSlots, level) for level in range(1, 17)]
+
+def secondsFromTimestamp(title):
+    '''
+    Returns the number of seconds in a minute:second:centisecond time stamp
+    at the start of a title, or None if the title does not start with one.
+
+    >>> import bali
+    >>> bali.secondsFromTimestamp('00:06:13')
+    6.13
+    >>> bali.secondsFromTimestamp('01:28:27')
+    88.27
+    >>> bali.secondsFromTimestamp('   00:37:58 *angkat')
+    37.58
+    >>> bali.secondsFromTimestamp('03:30 *angkat')
+    210.0
+    >>> bali.secondsFromTimestamp('time') is None
+    True
+    '''
+    m = re.match(r'\s*(\d+):(\d\d)(?::(\d\d))?', title or '')
+    if m is None:
+        return None
+    minutes, seconds, centiseconds = m.groups()
+    total = int(minutes) * 60 + int(seconds)
+    if centiseconds is not None:
+        total += int(centiseconds) / 100
+    return round(float(total), 2)
+
+def timestampFromSeconds(seconds):
+    '''
+    The inverse of secondsFromTimestamp.
+
+    >>> import bali
+    >>> bali.timestampFromSeconds(88.27)
+    '01:28:27'
+    >>> bali.timestampFromSeconds(8.75)
+    '00:08:75'
+    '''
+    centiseconds = int(round(seconds * 100))
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    return '{0:02d}:{1:02d}:{2:02d}'.format(minutes, seconds, centiseconds)
+
+# the fewest seconds a slot can take between two time stamps of an
+# improvisation; stamps closer together than that are misread
+minSecondsPerSlot = 0.005
+
+class Stroke(object):
+    '''
+    One entry in the stroke vocabulary: a symbol used in the drum or gong
+    lines, its integer code, a description, the instruments it is played
+    on, and (where there is one) its Balinese name.
+
+    >>> import bali
+    >>> stroke = bali.strokeVocabulary['e']
+    >>> stroke
+    <bali.Stroke e: Lanang high stroke>
+    >>> stroke.code, stroke.balineseName, sorted(stroke.drums)
+    (1, 'peng', ['Lanang'])
+    '''
+    def __init__(self, code, symbol, description, drums=(), balineseName=''):
+        self.code = code
+        self.symbol = symbol
+        self.description = description
+        self.drums = frozenset(drums)
+        self.balineseName = balineseName
+
+    def __repr__(self):
+        return '<bali.Stroke {0}: {1}>'.format(self.symbol, self.description)
+
+
+class StrokeVocabulary(object):
+    '''
+    The registry of every stroke symbol, and a tokenizer that splits drum and
+    gong lines into strokes with one compiled regular expression.
+
+    Multi-character strokes ('D.', 'pu') are matched before single characters,
+    so strokes written without a space between them ('D.`', 'pu-') come apart;
+    the en-dash is read as the metronome '-'; numbers in the gong line are
+    beat numbers; a stroke in parentheses in the middle of a line marks where a
+    drummer comes in and is not a slot of its own.  Anything else unknown is
+    kept, one character at a time, with code 0.
+
+    >>> import bali
+    >>> vocab = bali.strokeVocabulary
+    >>> vocab.drumTokens('(o)D o d D.` `  _(D)_ ?')
+    ['o', 'D', 'o', 'd', 'D.', '`', '`', '_', '_', '?']
+    >>> vocab.gongTokens('(G)- - - pu- - – G')
+    ['-', '-', '-', 'pu', '-', '-', '-', 'G']
+    >>> vocab.gongTokens('(10)- ● - 9 - ● – 10')
+    ['-', '●', '-', '9', '-', '●', '-', '10']
+    >>> vocab.encode(['e', 'D.', 'pu', '12', 'x']).tolist()
+    [1, 5, 12, 23, 0]
+    >>> vocab.symbols[vocab.encode(['o', 'D.'])].tolist()
+    ['o', 'D.']
+    >>> 'D.' in vocab, 'x' in vocab
+    (True, False)
+    >>> sorted(vocab.symbolsForDrum('Lanang'))
+    ['T', 'U', 'e']
+    '''
+    unknownCode = 0
+    beatNumberSymbol = '#'
+
+    def __init__(self):
+        self.strokes = []
+        self._bySymbol = {}
+        self._aliases = {}
+        self._tokenRe = None
+        self._symbols = None
+        self.register('', 'not a known stroke')
+
+    def register(self, symbol, description, drums=(), balineseName='', aliases=()):
+        '''
+        Adds a stroke to the vocabulary with the next code and returns it.
+        aliases are other ways of writing the same stroke.
+        '''
+        if symbol in self._bySymbol:
+            raise BaliException('Stroke {0!r} is already registered'.format(symbol))
+        stroke = Stroke(len(self.strokes), symbol, description, drums, balineseName)
+        self.strokes.append(stroke)
+        self._bySymbol[symbol] = stroke
+        for alias in aliases:
+            self._aliases[alias] = symbol
+        self._tokenRe = None
+        self._symbols = None
+        return stroke
+
+    def __getitem__(self, symbolOrCode):
+        if isinstance(symbolOrCode, str):
+            return self._bySymbol[symbolOrCode]
+        return self.strokes[symbolOrCode]
+
+    def __contains__(self, symbol):
+        return symbol != '' and symbol in self._bySymbol
+
+    def __iter__(self):
+        return iter(self.strokes[1:])
+
+    def __len__(self):
+        return len(self.strokes) - 1
+
+    @property
+    def symbols(self):
+        '''
+        A numpy array of the symbols indexed by code, for decoding code arrays.
+        '''
+        if self._symbols is None:
+            self._symbols = numpy.array([s.symbol for s in self.strokes])
+        return self._symbols
+
+    def code(self, symbol):
+        '''
+        Returns the code of a symbol: beat numbers share the code of '#' and
+        anything unknown is 0.
+        '''
+        stroke = self._bySymbol.get(symbol)
+        if stroke is not None:
+            return stroke.code
+        if symbol.isdigit():
+            return self._bySymbol[self.beatNumberSymbol].code
+        return self.unknownCode
+
+    def encode(self, tokens):
+        '''
+        Returns a numpy array of the codes of a list of tokens.
+        '''
+        code = self.code
+        return numpy.array([code(t) for t in tokens], dtype=numpy.uint8)
+
+    def symbolsForDrum(self, drumType):
+        '''
+        Returns the set of symbols played only on drumType ('Lanang', 'Wadon', or 'Gong').
+        '''
+        return frozenset(s.symbol for s in self if s.drums == frozenset([drumType]))
+
+    def tokenize(self, line):
+        '''
+        Splits a line (without its (x) prefix) into tokens in one pass.
+        '''
+        if self._tokenRe is None:
+            symbols = [s.symbol for s in self if s.symbol != self.beatNumberSymbol]
+            symbols.extend(self._aliases)
+            symbols.sort(key=len, reverse=True)
+            self._tokenRe = re.compile(r'\(\S\)|\d+|'
+                                       + '|'.join(re.escape(s) for s in symbols)
+                                       + r'|\S')
+        aliases = self._aliases
+        return [aliases.get(t, t) for t in self._tokenRe.findall(line)
+                if not (len(t) == 3 and t[0] == '(' and t[2] == ')')]
+
+    def drumTokens(self, drumPattern):
+        '''
+        Splits a drum line into its strokes; the stroke in the (x) prefix
+        comes first.  Lines without the prefix start with the stroke before
+        the first beat.
+        '''
+        if drumPattern.startswith('(') and drumPattern[2:3] == ')':
+            return [drumPattern[1]] + self.tokenize(drumPattern[3:])
+        return self.tokenize(drumPattern)
+
+    def gongTokens(self, gongPattern):
+        '''
+        Splits a gong line, after its (G) or (4) prefix, into one token per slot.
+        '''
+        if gongPattern.startswith('('):
+            gongPattern = gongPattern[gongPattern.find(')') + 1:]
+        return self.tokenize(gongPattern)
+
+
+# the strokes written in the drum and gong lines, as
+# (symbol, description, drums, Balinese name); the beat markers are added after
+_lineStrokes = (
+        ('e', 'Lanang high stroke', ('Lanang',), 'peng'),
+        ('T', 'Lanang low stroke', ('Lanang',), 'tut'),
+        ('d', 'Wadon stroke, quieter', ('Wadon',), 'dit'),
+        ('D', 'Wadon bass stroke on big drum, louder', ('Wadon',), 'dag'),
+        ('D.', 'dampened Wadon bass stroke on big drum', ('Wadon',), ''),
+        ('o', 'Wadon high stroke', ('Wadon',), 'kom'),
+        ('L', 'left hand Wadon stroke', ('Wadon',), ''), #not supposed to be there, lowercase l
+        ('_', 'ghost stroke', ('Lanang', 'Wadon'), ''),
+        ('r', 'right hand ghost stroke', ('Lanang', 'Wadon'), ''),
+        ('l', 'left hand ghost stroke', ('Lanang', 'Wadon'), ''),
+        ('G', 'gong stroke', ('Gong',), 'gong'),
+        ('pu', 'pung stroke', ('Gong',), 'pung'),
+        ('?', 'unclear stroke', ('Lanang', 'Wadon', 'Gong'), ''),
+        ('U', 'taking and giving cue for dancer/singer/end of line in Lanang', ('Lanang',), ''),
+        ('C', 'right hand pitched stroke', ('Lanang', 'Wadon'), ''),
+        ('-', 'beat in gong, metronome', ('Gong',), ''),
+        ('P', 'left hand slap stroke', ('Lanang', 'Wadon'), ''),
+        ('n', 'kempyang', ('Gong',), 'kempyang'),
+        ('t', 'guntang', ('Gong', 'Lanang', 'Wadon'), 'guntang'),
+        ('K', 'left hand slap stroke on Wadon', ('Wadon',), ''),
+        ('`', 'nothing', ('Lanang', 'Wadon'), ''),
+        )
+strokeVocabulary = StrokeVocabulary()
+for _symbol, _description, _drums, _name in _lineStrokes:
+    strokeVocabulary.register(_symbol, _description, _drums, _name,
+                              aliases=('\u2013',) if _symbol == '-' else ())
+strokeVocabulary.register('●', 'beat marker between beat numbers in taught gong lines', ('Gong',))
+strokeVocabulary.register('#', 'beat number in gong line', ('Gong',))
+del _symbol, _description, _drums, _name
+
+# every stroke symbol that can appear in the drum (and gong) lines, with its description
+strokeDescriptions = dict((symbol, description)
+                          for symbol, description, unused_drums, unused_name in _lineStrokes)
+
+# General MIDI percussion key and velocity for each stroke that makes a sound;
+# all other strokes become rests.
+strokePitches = {'e': (63, 90), # open high conga
+                 'T': (64, 90), # low conga
+                 'U': (62, 80), # mute high conga
+                 'C': (60, 80), # high bongo
+                 't': (61, 70), # low bongo
+                 'P': (39, 90), # hand clap
+                 'o': (65, 90), # high timbale
+                 'd': (66, 60), # low timbale
+                 'D': (35, 100), # acoustic bass drum
+                 'D.': (41, 90), # low floor tom
+                 'L': (66, 80), # low timbale
+                 'K': (37, 90), # side stick
+                 'G': (52, 100), # chinese cymbal
+                 'pu': (47, 90), # low-mid tom
+                 'n': (80, 70), # mute triangle
+                 }
+
+_noteTemplates = {}
+
+def streamFromDrumPattern(drumPattern):
+    '''
+    Returns a music21 Part with one sixteenth note (or rest) for each stroke
+    of a drum pattern after the stroke before the first beat, on the General
+    MIDI percussion channel, using the keys in bali.strokePitches.
+
+    The Pitch and Duration of each kind of stroke are made once and shared by
+    all of its notes, and the Parts of the most recent drumPatterns are kept
+    (bali._streamCache, an AnalysisMemo), so the same Part is returned for the
+    same drumPattern.  Treat it as read-only (or deepcopy it before changing it).
+
+    >>> import bali
+    >>> part = bali.streamFromDrumPattern('(_)_ _ e e _ e _ e _ e _ e _ e T _')
+    >>> part.highestTime
+    4.0
+    >>> [(n.offset, n.pitch.midi) for n in part.notes][:3]
+    [(0.5, 63), (0.75, 63), (1.25, 63)]
+    >>> part is bali.streamFromDrumPattern('(_)_ _ e e _ e _ e _ e _ e _ e T _')
+    True
+    >>> len(bali._streamCache) <= bali._streamCache.maxSize
+    True
+    '''
+    part = _streamCache.get(drumPattern)
+    if part is not None:
+        return part
+    pattern = Pattern()
+    pattern.drumPattern = drumPattern
+
+    part = music21.stream.Part()
+    percussion = music21.instrument.Percussion()
+    percussion.midiChannel = 9
+    part.insert(0, percussion)
+    offset = 0.0
+    for stroke in pattern.strokes[1:]:
+        part.coreInsert(offset, _noteForStroke(stroke))
+        offset += 0.25
+    part.coreElementsChanged()
+    _streamCache.put(drumPattern, part)
+    return part
+
+def _noteForStroke(stroke):
+    '''
+    Returns a new Note or Rest for a stroke, built from the template Pitch
+    and Duration for that kind of stroke.
+    '''
+    if stroke not in _noteTemplates:
+        sixteenth = music21.duration.Duration(0.25)
+        if stroke in strokePitches:
+            midiNumber, velocity = strokePitches[stroke]
+            _noteTemplates[stroke] = (music21.pitch.Pitch(midi=midiNumber),
+                                      sixteenth, velocity)
+        else:
+            _noteTemplates[stroke] = (None, sixteenth, None)
+    templatePitch, templateDuration, velocity = _noteTemplates[stroke]
+    if templatePitch is None:
+        return music21.note.Rest(duration=templateDuration)
+    n = music21.note.Note(templatePitch, duration=templateDuration)
+    n.volume.velocity = velocity
+    return n
+
+def _parseOneFile(job):
+    '''
+    Parses one file in a worker process for FileParser._parseFiles.  job is
+    (kind, path), kind being 'taught' or 'transcribed'; returns a FileParser
+    holding the patterns of that file alone.
+    '''
+    kind, path = job
+    fp = FileParser()
+    fp.fileReader = CorpusReader(glob.escape(path))
+    if kind == 'taught':
+        fp.parseTaught(fp.fileReader.taught)
+    else:
+        fp.parseTranscribed(fp.fileReader.transcribed)
+    return fp
+
+def _writeMidiFiles(group):
+    '''
+    Writes one MIDI file for each path in group, a tuple of (drumPattern,
+    list of paths).  Run in the worker processes of FileParser.exportMidi.
+    '''
+    drumPattern, paths = group
+    data = _midiCache.get(drumPattern)
+    if data is None:
+        part = streamFromDrumPattern(drumPattern)
+        data = music21.midi.translate.streamToMidiFile(part).writestr()
+        _midiCache.put(drumPattern, data)
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(data)
+    return len(paths)
+
+class AnalysisMemo(object):
+    '''
+    A least-recently-used memo of at most maxSize results of Pattern
+    analyses, keyed by (strokes, name of analysis, arguments).  The results
+    depend only on the strokes, so one memo (bali.analysisMemo) is shared
+    by every Pattern: a taught pattern repeated many times in the
+    transcriptions, or the same scrambled strokes in two surrogate
+    batches, is measured once.
+
+    >>> import bali
+    >>> memo = bali.AnalysisMemo(maxSize=2)
+    >>> memo.put('a', 1)
+    >>> memo.put('b', 2)
+    >>> memo.get('a')
+    1
+    >>> memo.put('c', 3)
+    >>> memo.get('b', 'missing')
+    'missing'
+    >>> memo.stats()
+    {'size': 2, 'maxSize': 2, 'hits': 1, 'misses': 1, 'hitRate': 0.5}
+    '''
+    def __init__(self, maxSize=100000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Forgets every result and resets the statistics.
+        '''
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries),
+                'maxSize': self.maxSize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else None}
+
+analysisMemo = AnalysisMemo()
+# the music21 Parts of streamFromDrumPattern and the MIDI files of exportMidi
+_streamCache = AnalysisMemo(maxSize=1000)
+_midiCache = AnalysisMemo(maxSize=1000)
+_missing = object()
+
+def memoizedAnalysis(method):
+    '''
+    Decorator for Pattern methods whose result depends only on the strokes,
+    the number of slots (numSlots), and the arguments: results are kept in
+    bali.analysisMemo.  List and
+    dict results are copied on the way out so callers can change them.
+    Calls with unhashable arguments are not memoized.
+
+    Two patterns with the same strokes share their results:
+
+    >>> import bali
+    >>> fp = bali.FileParser()
+    >>> bali.analysisMemo.clear()
+    >>> pattern = fp.taught[1]
+    >>> other = pattern.copy()
+    >>> other.title = 'same strokes, other title'
+    >>> pattern.percentOnBeat('e'), other.percentOnBeat('e')
+    (85.7..., 85.7...)
+    >>> bali.analysisMemo.stats()['hits'], bali.analysisMemo.stats()['misses']
+    (1, 1)
+
+    Changing the strokes changes the key:
+
+    >>> other.drumPattern = '(_)e _ _ _ _ _ _ _ _ _ _ _ _ _ _ _'
+    >>> other.percentOnBeat('e')
+    0.0
+    >>> other.removeSingleStrokes('e').strokes[:2]
+    ['_', ',']
+    '''
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **keywords):
+        key = (self.strokeKey, self.numSlots, name, args,
+               tuple(sorted(keywords.items())) if keywords else ())
+        try:
+            result = analysisMemo.get(key, _missing)
+        except TypeError:
+            return method(self, *args, **keywords)
+        if result is _missing:
+            result = method(self, *args, **keywords)
+            analysisMemo.put(key, result)
+        if isinstance(result, (list, dict)):
+            return copy.copy(result)
+        return result
+    return wrapper
+
+class RunLabel(enum.IntEnum):
+    none = 0
+    single = 1
+    firstOfDouble = 2
+    secondOfDouble = 3
+    longer = 4
+
+class StrokeRuns(object):
+    '''
+    A run-length encoding of the strokes of a list of patterns over a
+    class of strokes: typeOfStroke is a string, and a stroke is in the
+    class if it is part of that string ('Dd' takes in both D and d).  A run
+    is a stretch of consecutive strokes of the class within one pattern.
+    Everything is computed for all the patterns at once, on the
+    concatenated strokes:
+
+    * labels -- a RunLabel for each stroke (none if it is not in the class)
+    * runLength -- the length of the run each stroke is in (0 if none)
+    * isRunStart, isRunEnd -- booleans for the first and last stroke of each run
+    * starts, lengths -- the position and length of every run
+    * offsets -- the strokes of patterns[i] are offsets[i]:offsets[i + 1]
+
+    >>> import bali
+    >>> fp = bali.FileParser()
+    >>> fp.taught[4]
+    <bali.Taught Pak Dewa Lanang 10:(_)e e T e _ _ _ _ e e _ e _ e _ _>
+    >>> runs = bali.StrokeRuns(fp.taught, 'e')
+    >>> [bali.RunLabel(x).name for x in runs.labelsOf(4)[:5]]
+    ['none', 'firstOfDouble', 'secondOfDouble', 'none', 'single']
+    >>> runs.lengths[:4].tolist()
+    [1, 1, 1, 1]
+    >>> int((runs.labels == bali.RunLabel.single).sum())
+    97
+
+    A run never continues from one pattern into the next:
+
+    >>> a = bali.Taught()
+    >>> a.drumPattern = '(_)_ _ e e'
+    >>> b = bali.Taught()
+    >>> b.drumPattern = '(e)e _ e _'
+    >>> runs = bali.StrokeRuns([a, b], 'e')
+    >>> runs.labels.tolist()
+    [0, 0, 0, 2, 3, 2, 3, 0, 1, 0]
+    >>> runs.starts.tolist(), runs.lengths.tolist()
+    ([3, 5, 8], [2, 2, 1])
+    '''
+    def __init__(self, patterns, typeOfStroke='e'):
+        strokeLists = [p.strokeKey for p in patterns]
+        counts = numpy.array([len(strokes) for strokes in strokeLists], dtype=numpy.int64)
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        tokens = numpy.array([s for strokes in strokeLists for s in strokes] or [''])
+        self._label(tokens[:int(offsets[-1])], offsets, typeOfStroke)
+
+    @classmethod
+    def fromTokens(cls, tokens, offsets, typeOfStroke='e'):
+        '''
+        The runs of strokes already concatenated into a numpy array of
+        strings, tokens, with the strokes of pattern i at offsets[i]:offsets[i + 1].
+
+        >>> import bali, numpy
+        >>> tokens = numpy.array(['_', 'e', 'e', 'e', 'T', 'e'])
+        >>> bali.StrokeRuns.fromTokens(tokens, numpy.array([0, 3, 6])).labels.tolist()
+        [0, 2, 3, 1, 0, 1]
+        '''
+        runs = cls.__new__(cls)
+        runs._label(tokens, numpy.asarray(offsets, dtype=numpy.int64), typeOfStroke)
+        return runs
+
+    def _label(self, tokens, offsets, typeOfStroke):
+        self.typeOfStroke = typeOfStroke
+        self.offsets = offsets
+        counts = numpy.diff(offsets)
+        total = int(offsets[-1])
+
+        # a stroke t is in the class if t in typeOfStroke, so compare with
+        # every non-empty substring of typeOfStroke rather than sort the tokens
+        substrings = set(typeOfStroke[i:j] for i in range(len(typeOfStroke))
+                         for j in range(i + 1, len(typeOfStroke) + 1))
+        member = numpy.isin(tokens[:total], sorted(substrings))
+
+        firsts = self.offsets[:-1][counts > 0]
+        lasts = self.offsets[1:][counts > 0] - 1
+        previous = numpy.zeros(total, dtype=bool)
+        previous[1:] = member[:-1]
+        previous[firsts] = False
+        following = numpy.zeros(total, dtype=bool)
+        following[:-1] = member[1:]
+        following[lasts] = False
+
+        self.isRunStart = member & ~previous
+        self.isRunEnd = member & ~following
+        self.starts = numpy.flatnonzero(self.isRunStart)
+        self.lengths = numpy.flatnonzero(self.isRunEnd) - self.starts + 1
+        self.runLength = numpy.zeros(total, dtype=numpy.int64)
+        self.runLength[member] = numpy.repeat(self.lengths, self.lengths)
+
+        labels = numpy.zeros(total, dtype=numpy.uint8)
+        labels[self.runLength == 1] = RunLabel.single
+        isDouble = self.runLength == 2
+        labels[isDouble & self.isRunStart] = RunLabel.firstOfDouble
+        labels[isDouble & self.isRunEnd] = RunLabel.secondOfDouble
+        labels[self.runLength > 2] = RunLabel.longer
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return '<bali.StrokeRuns %r: %d runs in %d patterns>' % (self.typeOfStroke,
+                                                                len(self.starts), len(self))
+
+    def labelsOf(self, index):
+        '''
+        The RunLabels of the strokes of pattern number index.
+        '''
+        return self.labels[self.offsets[index]:self.offsets[index + 1]]
+
+    def positionsOf(self, index, where):
+        '''
+        The stroke numbers within pattern number index where the boolean
+        array where (over all the strokes) is True.
+        '''
+        start = self.offsets[index]
+        return (numpy.flatnonzero(where[start:self.offsets[index + 1]])).tolist()
+
+class StrokeSequences(object):
+    '''
+    The distinct stroke sequences (Pattern.strokeKey) of a list of patterns,
+    each stored once together with the first pattern that has it and the
+    number of patterns that have it, so that a statistic can be computed
+    once per sequence and weighted by its count.  The patterns themselves
+    are not changed; intern makes patterns share the stored tuples.
+
+    >>> import bali
+    >>> fp = bali.FileParser()
+    >>> numPatterns = len(fp.transcribed)
+    >>> sequences = fp.transcribedSequences
+    >>> sequences
+    <bali.StrokeSequences ... sequences>
+    >>> len(sequences) < numPatterns
+    True
+    >>> sum(count for pattern, count in sequences) == len(fp.transcribed)
+    True
+    >>> a, b = [p for p in fp.transcribed if p.multiplicity > 1][:2]
+    >>> a.strokeKey is sequences.sequence(a)
+    True
+
+    Building a table does not touch the patterns:
+
+    >>> copies = [a.copy(), a.copy()]
+    >>> for c in copies:
+    ...     c.drumPattern += ' '
+    >>> keys = [c.strokeKey for c in copies]
+    >>> keys[0] == keys[1], keys[0] is keys[1]
+    (True, False)
+    >>> len(bali.StrokeSequences(copies))
+    1
+    >>> copies[1].strokeKey is keys[1]
+    True
+
+    Iterating gives (first pattern, count) in order of first appearance:
+
+    >>> pattern, count = next(iter(sequences))
+    >>> pattern is fp.transcribed[0], count == fp.transcribed[0].multiplicity
+    (True, True)
+    '''
+    def __init__(self, patterns=()):
+        self._counts = {} # strokes -> count
+        self._representatives = {} # strokes -> first pattern
+        for p in patterns:
+            self.add(p)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        for key, pattern in self._representatives.items():
+            yield pattern, self._counts[key]
+
+    def __repr__(self):
+        return '<bali.StrokeSequences %d sequences>' % len(self)
+
+    def add(self, pattern):
+        '''
+        Counts pattern.
+        '''
+        key = pattern.strokeKey
+        if key in self._counts:
+            self._counts[key] += 1
+        else:
+            self._counts[key] = 1
+            self._representatives[key] = pattern
+
+    def intern(self, patterns):
+        '''
+        Makes the strokeKey of each of patterns (which must have been added)
+        the stored tuple, so that patterns with the same strokes share one.
+        FileParser does this for the patterns it reads.
+        '''
+        for p in patterns:
+            p._strokesCache = (p.drumPattern, self.sequence(p))
+
+    def sequence(self, pattern):
+        '''
+        Returns the stored tuple of strokes equal to pattern's, or None.
+        '''
+        p = self._representatives.get(pattern.strokeKey)
+        return None if p is None else p.strokeKey
+
+    def count(self, strokes):
+        '''
+        Returns how many of the patterns have strokes (a tuple of strokes).
+        '''
+        return self._counts.get(strokes, 0)
+
 class Pattern(object):
     '''
     Represents one drum pattern.
@@ -67,6 +822,33 @@ class Pattern(object):
         self.comments = ""
         self.indexInFile = -1 # -1 means undefined. otherwise 0 to ...
         self.fileParser = None # the FileParser object.
+        self.sourceFile = None # path of the file the pattern was read from
+        self.indexInSourceFile = -1 # indexInFile within that file alone
+
+    @property
+    def multiplicity(self):
+        '''
+        The number of patterns of the same kind (taught or transcribed) in
+        the FileParser with the same strokes as this one, or 1 if the
+        pattern has no FileParser.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> fp.taught[0].multiplicity
+        1
+        >>> max(p.multiplicity for p in fp.transcribed)
+        8
+        '''
+        fp = self.fileParser
+        if fp is None:
+            return 1
+        if isinstance(self, Taught):
+            sequences = fp.taughtSequences
+        else:
+            sequences = fp.transcribedSequences
+        if sequences is None:
+            return 1
+        return sequences.count(self.strokeKey)
       
     def copy(self):
         '''
@@ -85,10 +867,25 @@ class Pattern(object):
         >>> pattern
         <bali.Taught Pak Tama Lanang 0 (intro):(_)_ _ e e _ e _ e _ e _ e _ e T _>
         
+        The copy shares the FileParser of the original rather than copying
+        the whole corpus along with it, and likewise the ImprovInGong and
+        DualDrummer a transcribed pattern belongs to:
+        
+        >>> pCopy.fileParser is pattern.fileParser
+        True
+        >>> transcribed = fp.transcribed[100]
+        >>> transcribed.copy().improvInGong is transcribed.improvInGong
+        True
         '''  
-        return copy.deepcopy(self)
+        memo = {}
+        for container in (self.fileParser,
+                          getattr(self, 'improvInGong', None),
+                          getattr(self, 'dualDrummer', None)):
+            if container is not None:
+                memo[id(container)] = container
+        return copy.deepcopy(self, memo)
     
-    def shuffleStrokes(self):
+    def shuffleStrokes(self, randomGenerator=None):
         '''
         returns a new Pattern object based on this one where the
         strokes have been scrambled.
@@ -107,13 +904,24 @@ class Pattern(object):
         False
         >>> p2strokes.count('e')
         4
+        
+        A random.Random object can be given to make the shuffle reproducible:
+        
+        >>> import random
+        >>> p3 = pattern.shuffleStrokes(random.Random(5))
+        >>> p4 = pattern.shuffleStrokes(random.Random(5))
+        >>> p3.strokes == p4.strokes
+        True
         '''
+        if randomGenerator is None:
+            randomGenerator = random
         p2 = self.copy()
         oldStrokes = p2.strokes
-        random.shuffle(oldStrokes)
+        randomGenerator.shuffle(oldStrokes)
         p2.strokes = oldStrokes
         return p2
       
+    @profiling.hotPath('strokes')
     def _getStrokes(self):
         '''
         >>> import bali
@@ -121,15 +929,161 @@ class Pattern(object):
         >>> pattern = fp.taught[1]
         >>> pattern.strokes
         ['_', '_', '_', 'e', 'e', '_', 'e', '_', 'e', '_', 'e', '_', 'e', '_', 'e', 'T', '_']
+
+        Transcribed lines that continue from the line before have no (x) at the
+        start; their first stroke is the one before the first beat:
+
+        >>> pattern = bali.Transcribed()
+        >>> pattern.drumPattern = '` ` ` r _ o d'
+        >>> pattern.strokes
+        ['`', '`', '`', 'r', '_', 'o', 'd']
+
+        Strokes written without a space between them are still separate strokes:
+
+        >>> pattern.drumPattern = '(o)D o d D.` `'
+        >>> pattern.strokes
+        ['o', 'D', 'o', 'd', 'D.', '`', '`']
+        '''
+        return list(self.strokeKey)
+
+    @property
+    def strokeKey(self):
+        '''
+        The strokes as a tuple, cached until the drumPattern changes: the
+        key of the pattern's content in bali.analysisMemo.  Patterns
+        themselves compare by identity; compare their strokeKeys to find
+        patterns with the same strokes.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> fp.taught[1].strokeKey[:4]
+        ('_', '_', '_', 'e')
+        '''
+        dp = self.drumPattern
+        cached = self.__dict__.get('_strokesCache')
+        if cached is None or cached[0] != dp:
+            cached = (dp, tuple(strokeVocabulary.drumTokens(dp)))
+            self._strokesCache = cached
+        return cached[1]
+
+    @property
+    def strokeMasks(self):
+        '''
+        A dict of stroke to an integer mask of the positions where it is
+        played (bit i set for self.strokes[i]); cached until the drumPattern
+        changes.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> masks = fp.taught[1].strokeMasks
+        >>> bin(masks['e'])
+        '0b101010101011000'
+        >>> bin(masks['T'])
+        '0b1000000000000000'
+        '''
+        return self._maskCache()[1]
+
+    def _maskCache(self):
+        '''
+        (drumPattern, strokeMasks, number of strokes), rebuilt when the
+        drumPattern changes.
         '''
         dp = self.drumPattern
-        dpPreface = dp[0:3]
-        beatZero = dpPreface[1]
-        dpReal = dp[3:]
-        postBeatZeroStrokes = dpReal.split()
-        allStrokes = [beatZero] + postBeatZeroStrokes
+        cached = self.__dict__.get('_strokeMasksCache')
+        if cached is None or cached[0] != dp:
+            masks = {}
+            strokes = self.strokeKey
+            for i, stroke in enumerate(strokes):
+                masks[stroke] = masks.get(stroke, 0) | (1 << i)
+            cached = (dp, masks, len(strokes))
+            self._strokeMasksCache = cached
+        return cached
+
+    def positionMask(self, typeOfStroke='e', anyOf=False):
+        '''
+        The mask of the positions of typeOfStroke.  If anyOf is True,
+        typeOfStroke is a string of strokes (as in firstOrThirdBeat('Dd')) and
+        the positions of all of them are combined.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.taught[-1]
+        >>> pattern
+        <bali.Taught Pak Tama Wadon Variant 3:(_)o o D _ _ _ o o D _ d D _ _ o _>
+        >>> bin(pattern.positionMask('D'))
+        '0b1001000001000'
+        >>> bin(pattern.positionMask('Dd', anyOf=True))
+        '0b1101000001000'
+        '''
+        masks = self.strokeMasks
+        if not anyOf:
+            return masks.get(typeOfStroke, 0)
+        mask = 0
+        for stroke, strokeMask in masks.items():
+            if stroke in typeOfStroke:
+                mask |= strokeMask
+        return mask
+
+    def runMasks(self, typeOfStroke='e', anyOf=False):
+        '''
+        Splits the positions of typeOfStroke (see positionMask) by the run of
+        consecutive strokes they are in: a dict of masks of the 'single'
+        strokes, the 'firstOfDouble' and 'secondOfDouble' strokes of runs of
+        exactly two, and the strokes of 'longer' runs.
+
+        >>> import bali
+        >>> pattern = bali.Taught()
+        >>> pattern.drumPattern = '(_)e e _ e _ e e e _ _ _ _ _ _ _ _'
+        >>> masks = pattern.runMasks('e')
+        >>> [bin(masks[k]) for k in ('single', 'firstOfDouble', 'secondOfDouble', 'longer')]
+        ['0b10000', '0b10', '0b100', '0b111000000']
+        '''
+        mask = self.positionMask(typeOfStroke, anyOf)
+        starts = mask & ~(mask << 1)
+        ends = mask & ~(mask >> 1)
+        single = starts & ends
+        firstOfDouble = starts & ~ends & (ends >> 1)
+        secondOfDouble = firstOfDouble << 1
+        return {'single': single,
+                'firstOfDouble': firstOfDouble,
+                'secondOfDouble': secondOfDouble,
+                'longer': mask & ~(single | firstOfDouble | secondOfDouble)}
+
+    def _iterateMask(self, maxBeat=None):
+        '''
+        The mask of the positions iterateStrokes(maxBeat) goes through: by
+        default the slots 1 to self.numSlots.  Like iterateStrokes it raises
+        an IndexError if the pattern is shorter than maxBeat.
+        '''
+        if maxBeat is None:
+            lastSlot = self.numSlots
+        else:
+            lastSlot = int(maxBeat * 4)
+            numStrokes = self._maskCache()[2]
+            if numStrokes <= lastSlot:
+                raise IndexError('pattern has only %d strokes' % numStrokes)
+        return (2 << lastSlot) - 2 # slots 1 to lastSlot
+
+    @property
+    def strokeCodes(self):
+        '''
+        The strokes as a numpy array of codes in bali.strokeVocabulary.
 
-        return allStrokes
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> codes = fp.taught[1].strokeCodes
+        >>> codes[:5].tolist()
+        [8, 8, 8, 1, 1]
+        >>> bali.strokeVocabulary.symbols[codes[:5]].tolist()
+        ['_', '_', '_', 'e', 'e']
+        '''
+        dp = self.drumPattern
+        cached = self.__dict__.get('_strokeCodesCache')
+        if cached is None or cached[0] != dp:
+            cached = (dp, strokeVocabulary.encode(self.strokes))
+            cached[1].flags.writeable = False
+            self._strokeCodesCache = cached
+        return cached[1]
 
     def _setStrokes(self, newStrokes):
         '''
@@ -168,11 +1122,109 @@ class Pattern(object):
         Gets or sets the list of Strokes.
     ''')
 
+    def _gongTokens(self):
+        '''
+        The gong line split into one token per slot, starting with the slot
+        in its (x) prefix; cached until the gongPattern changes.
+        '''
+        gp = self.gongPattern or ''
+        cached = self.__dict__.get('_gongCache')
+        if cached is None or cached[0] != gp:
+            tokens = strokeVocabulary.gongTokens(gp)
+            if gp.startswith('(') and ')' in gp:
+                tokens = [gp[1:gp.find(')')]] + tokens
+            cached = (gp, tokens, {})
+            self._gongCache = cached
+        return cached
+
+    def _gongArray(self, name, build):
+        '''
+        Returns the cached array name made by build(tokens), padded or cut
+        to the number of strokes; the cache is forgotten when the gong or
+        drum line changes.
+        '''
+        gp, tokens, arrays = self._gongTokens()
+        numStrokes = len(self.strokes)
+        key = (name, numStrokes)
+        if key not in arrays:
+            tokens = tokens[:numStrokes] + [''] * (numStrokes - len(tokens))
+            arr = build(tokens)
+            arr.flags.writeable = False
+            arrays[key] = arr
+        return arrays[key]
+
+    @property
+    def gongEvents(self):
+        '''
+        The gong line as a numpy array of codes in bali.strokeVocabulary,
+        aligned slot for slot with .strokes: the first event is the one in
+        the prefix, as with the strokes.  Beat numbers all have the code of
+        '#' (their values are in .gongBeatNumbers).  A gong line shorter than
+        the drum line is padded with code 0.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.transcribed[0]
+        >>> pattern.gongPattern[:18]
+        '(G)- - - pu- - - G'
+        >>> events = pattern.gongEvents
+        >>> len(events) == len(pattern.strokes)
+        True
+        >>> bali.strokeVocabulary.symbols[events[:9]].tolist()
+        ['G', '-', '-', '-', 'pu', '-', '-', '-', 'G']
+        >>> pattern.strokes[8]
+        'e'
+        '''
+        return self._gongArray('events', strokeVocabulary.encode)
+
+    @property
+    def gongBeatNumbers(self):
+        '''
+        A numpy array, aligned with .strokes, of the beat numbers written in
+        the gong line, and 0 where there is none.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.taught[1]
+        >>> pattern.gongBeatNumbers.tolist()
+        [4, 0, 0, 0, 1, 0, 0, 0, 2, 0, 0, 0, 3, 0, 0, 0, 4]
+        '''
+        return self._gongArray('beatNumbers',
+                               lambda tokens: numpy.array([int(t) if t.isdigit() else 0
+                                                           for t in tokens], dtype=int))
+
+    def gongPhase(self, gongStroke='G'):
+        '''
+        Returns a numpy array, aligned with .strokes, of how many slots each
+        stroke comes after the last gongStroke ('G' for the gong, 'pu' for the
+        pung...) in the gong line, or -1 before the first one.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.transcribed[0]
+        >>> pattern.gongPhase()[:10].tolist()
+        [0, 1, 2, 3, 4, 5, 6, 7, 0, 1]
+        >>> pattern.gongPhase('pu')[:10].tolist()
+        [-1, -1, -1, -1, 0, 1, 2, 3, 4, 5]
+
+        Strokes at the same gong phase can then be picked out at once:
+
+        >>> import numpy
+        >>> strokes = numpy.array(pattern.strokes)
+        >>> strokes[pattern.gongPhase() == 0].tolist()
+        ['r', 'e', 'e', 'r', 'r']
+        '''
+        events = self.gongEvents
+        slots = numpy.arange(len(events))
+        isStroke = events == strokeVocabulary.code(gongStroke)
+        last = numpy.maximum.accumulate(numpy.where(isStroke, slots, -1))
+        return numpy.where(last >= 0, slots - last, -1)
+
     def beatLength(self):
         '''
         The beatLength of a Pattern is defined as the last
-        thing (hopefully a number) in the Gong Pattern.
-       
+        beat number in the Gong Pattern.
+
         >>> import bali
         >>> fp = bali.FileParser()
         >>> pattern = fp.taught[1]
@@ -183,17 +1235,60 @@ class Pattern(object):
         >>> pattern.gongPattern = '(6)- ● - 1 - ● - 2 - ● - 3 - ● – 4 - ● – 5 - ● – 6'
         >>> pattern.beatLength()
         6
+        >>> pattern.gongPattern = '(12)- ● - 1 - ● - 2 - ● - 3 - ● – 4 - ● – 12'
+        >>> pattern.beatLength()
+        12
+
+        Gong lines without beat numbers (like those of the transcribed
+        patterns) are one beat for every four slots:
+
+        >>> fp.transcribed[0].beatLength()
+        8
+        '''
+        unused_gp, tokens, unused_arrays = self._gongTokens()
+        for token in reversed(tokens[1:]):
+            if token.isdigit():
+                return int(token)
+        if len(tokens) <= 1:
+            raise IncorrectBeatNumberException('There is no gong line to take the length from')
+        return (len(tokens) - 1) // 4
+
+    @property
+    def numSlots(self):
         '''
-        gp = self.gongPattern
-        lastLetter = gp[-1]
-        lastNumber = int(lastLetter)
-        return lastNumber
-   
-    def iterateStrokes(self, maxBeat=4.0):
+        The number of slots after the (x) stroke that the analyses look at:
+        four for each beat of beatLength(), but no more than there are
+        strokes (some transcribed drum lines are shorter than their gong
+        lines).  Without a gong line, every stroke after the (x) stroke.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> fp.taught[1].numSlots
+        16
+        >>> fp.transcribed[0].numSlots
+        32
+        >>> short = fp.transcribed[4]
+        >>> len(short.strokes), short.beatLength(), short.numSlots
+        (32, 8, 31)
+        '''
+        unused_gp, unused_tokens, arrays = self._gongTokens()
+        numStrokes = len(self.strokeKey)
+        key = ('numSlots', numStrokes)
+        if key not in arrays:
+            numSlots = max(0, numStrokes - 1)
+            try:
+                numSlots = min(numSlots, 4 * self.beatLength())
+            except IncorrectBeatNumberException:
+                pass
+            arrays[key] = numSlots
+        return arrays[key]
+
+    def iterateStrokes(self, maxBeat=None):
         '''
         Use only in a for loop: goes through
         each stroke and tells you what the beat is
-        and then what the stroke letter is.
+        and then what the stroke letter is.  By default it goes to the end
+        of the gong cycle (numSlots); maxBeat stops it earlier.
 
         >>> import bali
         >>> fp = bali.FileParser()
@@ -205,6 +1300,8 @@ class Pattern(object):
         0.75 e
         1.0 e
         '''
+        if maxBeat is None:
+            maxBeat = self.numSlots / 4
         beat = 0.25
         strokeNumber = 1
         stroke = self.strokes
@@ -249,55 +1346,11 @@ class Pattern(object):
         bali.BaliException: I do not know how to deal with this stroke
         '''
         
-        strokeDict = {'e': 'Lanang high stroke',
-                      'T': 'Lanang low stroke',
-                      'd': 'Wadon stroke, quieter',
-                      'D': 'Wadon bass stroke on big drum, louder',
-                      'D.': 'dampened Wadon bass stroke on big drum',
-                      'o': 'Wadon high stroke',
-                      'L': 'left hand Wadon stroke', #not supposed to be there, lowercase l
-                      '_': 'ghost stroke',
-                      'r': 'right hand ghost stroke',
-                      'l': 'left hand ghost stroke',
-                      'G': 'gong stroke',
-                      'pu': 'pung stroke',
-                      '?': 'unclear stroke',
-                      'U': 'taking and giving cue for dancer/singer/end of line in Lanang',
-                      'C': 'right hand pitched stroke',
-                      '-': 'beat in gong, metronome',
-                      'P': 'left hand slap stroke',
-                      'n': 'kempyang',
-                      't': 'guntang',
-                      'K': 'left hand slap stroke on Wadon',
-                      '`': 'nothing'}
-
-        if stroke in strokeDict:
-            return strokeDict[stroke]
+        if stroke in strokeDescriptions:
+            return strokeDescriptions[stroke]
         else:
             raise BaliException('I do not know how to deal with this stroke')
 
-        unused_strokeNames = {'e': 'peng',
-                      'T': 'tut', # doot
-                      'd': 'dit',
-                      'D': 'dag', #or deg
-                      'D.': '', #
-                      'o': 'kom',
-                      'L': 'left hand Wadon stroke', #not supposed to be there, lowercase l
-                      '_': 'ghost stroke',
-                      'r': 'right hand ghost stroke',
-                      'l': 'left hand ghost stroke',
-                      'G': 'gong stroke',
-                      'pu': 'pung stroke',
-                      '?': 'unclear stroke',
-                      'U': 'taking and giving cue for dancer/singer/end of line in Lanang',
-                      'C': 'right hand pitched stroke',
-                      '-': 'beat in gong, metronome',
-                      'P': 'left hand slap stroke',
-                      'n': 'kempyang',
-                      't': 'guntang',
-                      'K': 'left hand slap stroke on Wadon',
-                      '`': 'nothing'}
-
     def consecutiveStrokes(self):
         '''
         Finds all consecutive patterns (like oo) and returns copy of pattern
@@ -473,6 +1526,8 @@ class Pattern(object):
         else:
             raise IncorrectBeatNumberException("Wrong beat")
         
+    @profiling.hotPath('percentOnBeat')
+    @memoizedAnalysis
     def percentOnBeat(self, typeOfStroke='e', beatLevel=BeatLevel.double):
         '''
         Returns percent of a certain type of stroke that occurs on the beat
@@ -494,20 +1549,23 @@ class Pattern(object):
         20.0
         >>> pattern2.percentOnBeat('o', bali.BeatLevel.fourBeat)
         0.0
+
+        The whole of a transcribed line is measured, however many beats it has:
+
+        >>> pattern3 = fp.transcribed[0]
+        >>> pattern3.beatLength(), pattern3.beatsInPattern('e')
+        (8, 15)
+        >>> pattern3.percentOnBeat('e')
+        86.6...
         '''
-        numberOnBeat = 0
-        numberOfStroke = 0
-        for beat, stroke in self.iterateStrokes():
-            if stroke != typeOfStroke:
-                continue
-            numberOfStroke += 1
-            if (beat * 4/beatLevel) % 1 == 0:
-                numberOnBeat += 1
-    
+        mask = self.positionMask(typeOfStroke) & self._iterateMask()
+        numberOfStroke = popcount(mask)
         if numberOfStroke == 0:
             return 0.0
-        return (numberOnBeat * 100) / numberOfStroke
+        return (popcount(mask & beatLevelMask(beatLevel, self.numSlots)) * 100) / numberOfStroke
 
+    @profiling.hotPath('beatsInPattern')
+    @memoizedAnalysis
     def beatsInPattern(self, typeOfStroke='e'):
         '''
         Returns number of a certain type of stroke in a single pattern
@@ -524,16 +1582,12 @@ class Pattern(object):
         >>> pattern2.beatsInPattern('o')
         5
         '''
-        numberOfStroke = 0
-        for stroke in self.iterateStrokes():
-            if stroke[1] != typeOfStroke:
-                continue
-            numberOfStroke += 1
-            
+        numberOfStroke = popcount(self.positionMask(typeOfStroke) & self._iterateMask())
         if numberOfStroke == 0:
             return 0.0
         return numberOfStroke
     
+    @memoizedAnalysis
     def firstOrThirdBeat(self, typeOfStroke='e'):
         '''
         Returns how many strokes of a certain type land on first or third beat
@@ -561,17 +1615,12 @@ class Pattern(object):
         >>> pattern3.firstOrThirdBeat('Dd')['first']
         1
         '''
-        firstBeat = 0
-        thirdBeat = 0
-        for beat, stroke in self.iterateStrokes():
-            if stroke not in typeOfStroke:
-                continue
-            if (beat - .25) % 1 == 0:
-                firstBeat += 1
-            elif (beat - .75) % 1 == 0:
-                thirdBeat += 1
-        return {'first': firstBeat, 'third': thirdBeat}
+        mask = self.positionMask(typeOfStroke, anyOf=True) & self._iterateMask()
+        stop = self.numSlots + 1
+        return {'first': popcount(mask & slotMask(1, stop, 4)),
+                'third': popcount(mask & slotMask(3, stop, 4))}
 
+    @memoizedAnalysis
     def secondOrFourthBeat(self, typeOfStroke='Dd'):
         '''
         Returns how many strokes of a certain type land on second or fourth beat
@@ -593,16 +1642,10 @@ class Pattern(object):
         1
         '''
         
-        secondBeat = 0
-        fourthBeat = 0
-        for beat, stroke in self.iterateStrokes():
-            if stroke not in typeOfStroke:
-                continue
-            if (beat - .5) % 1 == 0:
-                secondBeat += 1
-            elif beat % 1 == 0:
-                fourthBeat += 1
-        return {'second': secondBeat, 'fourth': fourthBeat}   
+        mask = self.positionMask(typeOfStroke, anyOf=True) & self._iterateMask()
+        stop = self.numSlots + 1
+        return {'second': popcount(mask & slotMask(2, stop, 4)),
+                'fourth': popcount(mask & slotMask(4, stop, 4))}   
 
 
     def whenLanangOffT(self, beatDivision='first'):
@@ -647,21 +1690,22 @@ class Pattern(object):
  
         firstHalf = 0
         secondHalf = 0
+        beats = self.numSlots / 4
         pattern = self.removeConsecutiveStrokes('T')
         for beat, stroke in zip(self.iterateStrokes(), pattern.strokes[1:]):
             if stroke != 'T':
                 continue
             if beatDivision == 'first':
                 if (beat[0] - .25) % 1 == 0:
-                    if (beat[0] / 4) < 0.5:
+                    if (beat[0] / beats) < 0.5:
                         firstHalf += 1
-                    if (beat[0] / 4) >= 0.5:
+                    if (beat[0] / beats) >= 0.5:
                         secondHalf += 1
             elif beatDivision == 'third':
                 if (beat[0] - .75) % 1 == 0:
-                    if (beat[0] / 4) < 0.5:
+                    if (beat[0] / beats) < 0.5:
                         firstHalf += 1
-                    if (beat[0] / 4) >= 0.5:
+                    if (beat[0] / beats) >= 0.5:
                         secondHalf += 1  
         return {'first half': firstHalf, 'second half': secondHalf}       
                 
@@ -709,21 +1753,22 @@ class Pattern(object):
         
         firstHalf = 0
         secondHalf = 0
+        beats = self.numSlots / 4
         pattern = self.removeConsecutiveStrokes('Dd')
         for beat, stroke in zip(self.iterateStrokes(), pattern.strokes[1:]):
             if stroke != 'D' and stroke != 'd':
                 continue
             if beatDivision == 'first':
                 if (beat[0] - .25) % 1 == 0 or (beat[0] - .75) % 1 == 0:
-                    if (beat[0] / 4) < 0.5:
+                    if (beat[0] / beats) < 0.5:
                         firstHalf += 1
-                    if (beat[0] / 4) >= 0.5:
+                    if (beat[0] / beats) >= 0.5:
                         secondHalf += 1
             elif beatDivision == 'third':
                 if (beat[0] - .75) % 1 == 0 or (beat[0] - .75) % 1 == 0:
-                    if (beat[0] / 4) < 0.5:
+                    if (beat[0] / beats) < 0.5:
                         firstHalf += 1
-                    if (beat[0] / 4) >= 0.5:
+                    if (beat[0] / beats) >= 0.5:
                         secondHalf += 1               
         return {'first half': firstHalf, 'second half': secondHalf}  
     
@@ -733,6 +1778,9 @@ class Pattern(object):
         Returns drum pattern with all single strokes of a given type removed.
         Type of stroke is a string with all strokes to be removed.
         The single strokes are replaced with ','
+
+        A stroke is single if the strokes on either side of it (within the
+        pattern) are not in typeOfStroke; see StrokeRuns.
         
     
         >>> import bali, taught_questions
@@ -767,23 +1815,30 @@ class Pattern(object):
         <bali.Taught Pak Tama Wadon Variant 3:(_)o o D _ _ _ o o D _ d D _ _ , _>
         >>> removed3.percentOnBeat('o')
         50.0
+
+        With several strokes, d D counts as a double stroke:
+
+        >>> pattern2.removeSingleStrokes('Dd')
+        <bali.Taught Pak Tama Wadon Variant 3:(_)o o , _ _ _ o o , _ d D _ _ o _>
         '''
-        newDrumPatternList = copy.deepcopy(self.strokes)
-        for i in range(len(self.strokes)):
-            if i == 0:
-                if self.strokes[i + 1] not in typeOfStroke and self.strokes[i] in typeOfStroke:
-                    newDrumPatternList[i] = ','
-            if 0 < i < len(self.strokes) - 1:
-                if self.strokes[i] != self.strokes[i + 1] and self.strokes[i] in typeOfStroke:
-                    if self.strokes[i - 1] != typeOfStroke:
-                        newDrumPatternList[i] = ','
-            else:
-                if self.strokes[i - 1] not in typeOfStroke and self.strokes[i] in typeOfStroke:
-                    newDrumPatternList[i] = ','
-        newDrumPattern = copy.deepcopy(self)
-        newDrumPattern.strokes = newDrumPatternList
-        
+        return self._withStrokes(self._singleStrokesRemoved(typeOfStroke))
+
+    def _withStrokes(self, newStrokes):
+        '''
+        Returns a copy of the pattern (sharing its FileParser) with newStrokes.
+        '''
+        with profiling.timed('remove copy'):
+            newDrumPattern = self.copy()
+        newDrumPattern.strokes = newStrokes
         return newDrumPattern
+
+    @memoizedAnalysis
+    def _singleStrokesRemoved(self, typeOfStroke='e'):
+        runs = StrokeRuns([self], typeOfStroke)
+        newDrumPatternList = self.strokes
+        for i in runs.positionsOf(0, runs.labels == RunLabel.single):
+            newDrumPatternList[i] = ','
+        return newDrumPatternList
         
     def removeConsecutiveStrokes(self, typeOfStroke='e', removeFirst=True, removeSecond=False):
         '''
@@ -861,20 +1916,41 @@ class Pattern(object):
         
         TODO: Leslie -- how to deal with across a repetition boundary
         '''
-        newDrumPatternList = copy.deepcopy(self.strokes)
-        for i in range(1, len(self.strokes) - 1):
-            if removeFirst is True:
-                if self.strokes[i] in typeOfStroke and self.strokes[i + 1] in typeOfStroke:
-                    newDrumPatternList[i] = '.'
-            if removeSecond is True:
-                if (self.strokes[i] in typeOfStroke and self.strokes[i + 1] in typeOfStroke) or self.strokes[i] == '.':
-                    newDrumPatternList[i+1] = '.'
-    
-        newDrumPattern = copy.deepcopy(self)
-        newDrumPattern.strokes = newDrumPatternList
-        
-        return newDrumPattern
+        return self._withStrokes(self._consecutiveStrokesRemoved(typeOfStroke, removeFirst,
+                                                                 removeSecond))
+
+    @memoizedAnalysis
+    def _consecutiveStrokesRemoved(self, typeOfStroke, removeFirst, removeSecond):
+        runs = StrokeRuns([self], typeOfStroke)
+        remove = numpy.zeros(len(runs.labels), dtype=bool)
+        inRun = runs.runLength > 1
+        if removeFirst is True:
+            remove |= inRun & ~runs.isRunEnd
+        if removeSecond is True:
+            remove |= inRun & ~runs.isRunStart
+        newDrumPatternList = self.strokes
+        for i in runs.positionsOf(0, remove):
+            newDrumPatternList[i] = '.'
+        return newDrumPatternList
+
 
+    def toStream(self):
+        '''
+        Returns the pattern as a music21 Part of sixteenth notes on the
+        percussion channel; see bali.streamFromDrumPattern.  Patterns with the
+        same drumPattern share the same (read-only) Part.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> part = fp.taught[1].toStream()
+        >>> len(part.notes)
+        8
+        >>> part.notes[-1].pitch.midi
+        64
+        >>> fp.taught[1].copy().toStream() is part
+        True
+        '''
+        return streamFromDrumPattern(self.drumPattern)
 
     def __repr__(self):
         return '<{0}.{1} {2}:{3}>'.format(self.__module__, self.__class__.__name__,
@@ -884,19 +1960,111 @@ class Pattern(object):
 class FileParser(object):
     '''
     Reads both files on disk (FileReader) and separates them into taught and transcribed patterns.
+
+    corpus can also be a directory or a glob of many pattern files (see
+    CorpusReader); each file is then parsed separately, in up to processes
+    worker processes at once, and the patterns are numbered across all the files.
+    Either way every pattern knows the file it came from:
+
+    >>> import bali, os
+    >>> fp = bali.FileParser()
+    >>> os.path.basename(fp.transcribed[0].sourceFile), fp.transcribed[0].indexInSourceFile
+    ('all_patterns.txt', 0)
+
+    Here the transcriptions are split into one file per session and parsed
+    in two processes; the patterns are the same as before:
+
+    >>> import io, numpy, shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> shutil.copy(fp.fileReader._taught, directory)
+    '...taught_patterns.txt'
+    >>> lines = fp.fileReader.transcribed
+    >>> secondSession = [i for i, line in enumerate(lines) if line.startswith('=====')][1]
+    >>> for name, part in (('all_patterns_1.txt', lines[:secondSession]),
+    ...                    ('all_patterns_2.txt', lines[secondSession:])):
+    ...     with io.open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+    ...         unused = f.write('\\n'.join(part))
+    >>> split = bali.FileParser(directory, processes=2)
+    >>> len(split.taught) == len(fp.taught), len(split.transcribed) == len(fp.transcribed)
+    (True, True)
+    >>> all(a.drumPattern == b.drumPattern for a, b in zip(split.transcribed, fp.transcribed))
+    True
+    >>> p = split.transcribedSessions[1].subsessionsByPlayer[0].improvsInGong[0].patterns[0]
+    >>> os.path.basename(p.sourceFile), p.indexInSourceFile, p.indexInFile == fp.transcribedSessions[1].subsessionsByPlayer[0].improvsInGong[0].patterns[0].indexInFile
+    ('all_patterns_2.txt', 0, True)
+    >>> p.fileParser is split
+    True
+    >>> numpy.allclose(split.strokeOnsets, fp.strokeOnsets, equal_nan=True)
+    True
+
+    After a reload the new patterns know their file too:
+
+    >>> path = split.fileReader.transcribedFiles[1]
+    >>> with io.open(path, 'a', encoding='utf-8') as f:
+    ...     unused = f.write('\\n\\n99:00:00\\n(G)- - - G\\n(e)e e e e\\n')
+    >>> split.reloadTranscribed()
+    <bali.TranscribedChanges 1 added, 0 removed, 0 changed>
+    >>> p = split.transcribed[-1]
+    >>> firstInFile = [q.sourceFile for q in split.transcribed].index(path)
+    >>> os.path.basename(p.sourceFile), p.indexInSourceFile == p.indexInFile - firstInFile
+    ('all_patterns_2.txt', True)
+    >>> with io.open(path, encoding='utf-8') as f:
+    ...     f.read().splitlines()[p.lineInSourceFile]
+    '(G)- - - G'
+
+    Each file is parsed again on its own, so a block before the first
+    heading of a file does not join the last improvisation of the file
+    before; the result is what reading the files afresh gives:
+
+    >>> with io.open(path, encoding='utf-8') as f:
+    ...     text = f.read()
+    >>> with io.open(path, 'w', encoding='utf-8') as f:
+    ...     unused = f.write('00:00:01\\n(G)- - - G\\n(e)e e e e\\n\\n' + text)
+    >>> split.reloadTranscribed()
+    <bali.TranscribedChanges 1 added, 0 removed, 0 changed>
+    >>> def layout(parser):
+    ...     return [(p.title, p.sourceFile, p.indexInSourceFile, p.lineInSourceFile,
+    ...              p.improvInGong and p.improvInGong.typeOfGong) for p in parser.transcribed]
+    >>> fresh = bali.FileParser(directory, processes=1)
+    >>> layout(split) == layout(fresh), split.alignmentErrors == fresh.alignmentErrors
+    (True, True)
+
+    The sessions and DualDrummers are read the same way, whichever is asked for first:
+
+    >>> fresh = bali.FileParser(directory, processes=1)
+    >>> len(fresh.sessions)
+    2
+    >>> os.path.basename(fresh.transcribed[0].sourceFile)
+    'all_patterns_1.txt'
+    >>> fresh.alignmentErrors[0]
+    'all_patterns_1.txt: 05:22:12 (Batel Marah): ...'
     '''
-    def __init__(self):
-        self.fileReader = FileReader()
-        #time.sleep(1)
+    def __init__(self, corpus=None, processes=None):
+        if corpus is None:
+            self.fileReader = FileReader()
+        elif os.path.isdir(corpus) and all(os.path.exists(os.path.join(corpus, f))
+                                           for f in FileReader.fileNames):
+            self.fileReader = FileReader(corpus)
+        else:
+            self.fileReader = CorpusReader(corpus)
+        self.processes = processes
         self.taughtPatterns = []
         self.transcribedPatterns = []
+        self.transcribedSessions = []
+        self.transcribedDualDrummers = []
+        self.alignmentErrors = []
+        self.strokeOnsets = None # onset in seconds of every transcribed stroke
+        self.taughtSequences = None # StrokeSequences of the taught patterns
+        self.transcribedSequences = None # StrokeSequences of the transcribed patterns
+        self.strokeOffsets = None # where each transcribed pattern starts in strokeOnsets
+        self._transcribedBlocks = [] # (blockKey, patterns) for each time block, for reloading
 
     @property
     def taught(self):
         if len(self.taughtPatterns) > 0:
             return self.taughtPatterns
         else:
-            self.parseTaught(self.fileReader.taught)
+            self._parseFiles('taught')
             return self.taughtPatterns
 
     def separatePatternsByDrum(self):
@@ -914,10 +2082,155 @@ class FileParser(object):
         if self.transcribedPatterns:
             return self.transcribedPatterns
         else:
-            self.parseTranscribed(self.fileReader.transcribed)
+            self._parseFiles('transcribed')
             return self.transcribedPatterns
 
-    def parseTaught(self, lineList):
+    def _parseFiles(self, kind):
+        '''
+        Parses the taught or transcribed files of self.fileReader.  A single
+        file is parsed here; several are parsed in worker processes (unless
+        self.processes is 1) and then merged with _mergeParsed.
+        '''
+        paths = getattr(self.fileReader, kind + 'Files')
+        if len(paths) <= 1:
+            lines = getattr(self.fileReader, kind)
+            if kind == 'taught':
+                self.parseTaught(lines)
+                patterns = self.taughtPatterns
+            else:
+                self.parseTranscribed(lines)
+                patterns = self.transcribedPatterns
+            for p in patterns:
+                p.sourceFile = paths[0] if paths else None
+                p.indexInSourceFile = p.indexInFile
+            return
+
+        jobs = [(kind, path) for path in paths]
+        if self.processes == 1:
+            parsed = [_parseOneFile(job) for job in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(self.processes) as executor:
+                parsed = list(executor.map(_parseOneFile, jobs))
+        self._mergeParsed(kind, list(zip(paths, parsed)))
+
+    def _mergeParsed(self, kind, parsed, previousTimeline=None):
+        '''
+        Adds the patterns of a list of (path, FileParser) -- one FileParser
+        per file -- to this FileParser, numbering them on from the patterns
+        already here, and rebuilds the timeline (reusing the onsets of
+        previousTimeline, as parseTranscribed does).
+        '''
+        for path, sub in parsed:
+            if kind == 'taught':
+                subPatterns, patterns = sub.taughtPatterns, self.taughtPatterns
+            else:
+                subPatterns, patterns = sub.transcribedPatterns, self.transcribedPatterns
+            for p in subPatterns:
+                p.sourceFile = path
+                p.indexInSourceFile = p.indexInFile
+                p.indexInFile = len(patterns)
+                p.fileParser = self
+                patterns.append(p)
+            if kind == 'taught':
+                continue
+            for session in sub.transcribedSessions:
+                session.indexInFile = len(self.transcribedSessions)
+                session.parentFileParser = self
+                self.transcribedSessions.append(session)
+            self.transcribedDualDrummers.extend(sub.transcribedDualDrummers)
+            self.alignmentErrors.extend(os.path.basename(path) + ': ' + error
+                                        for error in sub.alignmentErrors)
+            self._transcribedBlocks.extend(sub._transcribedBlocks)
+        if kind == 'taught':
+            self.taughtSequences = StrokeSequences(self.taughtPatterns)
+            self.taughtSequences.intern(self.taughtPatterns)
+        else:
+            self._buildTimeline(previousTimeline)
+            self.transcribedSequences = StrokeSequences(self.transcribedPatterns)
+            self.transcribedSequences.intern(self.transcribedPatterns)
+
+    @property
+    def sessions(self):
+        '''
+        The Session objects of the transcribed patterns (parsing them first
+        if need be, as .transcribed does).
+        '''
+        self.transcribed # parses the files, each on its own if there are several
+        return self.transcribedSessions
+
+    @property
+    def dualDrummers(self):
+        '''
+        A DualDrummer object for every time block where both drums were
+        transcribed together.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> len(fp.dualDrummers)
+        289
+        >>> fp.dualDrummers[0].strokeArray.shape
+        (2, 33)
+
+        Pairs whose lanang and wadon lines do not have the same number of
+        strokes are not aligned; the reasons are kept in fp.alignmentErrors:
+
+        >>> fp.dualDrummers[94].strokeArray is None
+        True
+        >>> fp.alignmentErrors[0]
+        '05:22:12 (Batel Marah): Lanang has 33 strokes but Wadon has 32'
+        '''
+        self.transcribed # parses the files, each on its own if there are several
+        return self.transcribedDualDrummers
+
+    def exportMidi(self, directory, patterns=None, processes=None):
+        '''
+        Writes a MIDI file for every pattern (by default all the taught and
+        transcribed patterns) into directory, named like 'taught_0001.mid'
+        and 'transcribed_0379.mid' after the index of the pattern in the file,
+        and returns the list of paths.
+
+        Patterns with the same drumPattern are converted once; the conversions
+        are spread across processes (by default one per CPU; with processes=1
+        everything runs in this process).
+
+        >>> import bali, music21, os, tempfile
+        >>> fp = bali.FileParser()
+        >>> directory = tempfile.mkdtemp()
+        >>> paths = fp.exportMidi(directory, fp.taught[:3] + fp.transcribed[:2], processes=2)
+        >>> [os.path.basename(p) for p in paths]
+        ['taught_0000.mid', 'taught_0001.mid', 'taught_0002.mid',
+         'transcribed_0000.mid', 'transcribed_0001.mid']
+        >>> mf = music21.midi.MidiFile()
+        >>> mf.open(paths[1])
+        >>> mf.read()
+        >>> mf.close()
+        >>> len([e for e in mf.tracks[1].events if e.type == music21.midi.ChannelVoiceMessages.NOTE_ON])
+        8
+        '''
+        if patterns is None:
+            patterns = self.taught + self.transcribed
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        groups = {}
+        paths = []
+        for patt in patterns:
+            filename = '{0}_{1:04d}.mid'.format(patt.__class__.__name__.lower(),
+                                                patt.indexInFile)
+            path = os.path.join(directory, filename)
+            paths.append(path)
+            groups.setdefault(patt.drumPattern, []).append(path)
+
+        if processes == 1:
+            for group in groups.items():
+                _writeMidiFiles(group)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+                list(executor.map(_writeMidiFiles, groups.items(), chunksize=16))
+        return paths
+
+    @profiling.hotPath('parseTaught')
+    def parseTaught(self, lineList):
         '''
         Takes a list of lines from a file and an empty list [] and fills that
         list with Taught objects.
@@ -962,79 +2275,795 @@ class FileParser(object):
                 currentDrumPattern = line
             else:
                 currentComments = line
+        self.taughtSequences = StrokeSequences(self.taughtPatterns)
+        self.taughtSequences.intern(self.taughtPatterns)
         
-    def parseTranscribed(self, lineList):
+    @profiling.hotPath('parseTranscribed')
+    def parseTranscribed(self, lineList, previousBlocks=None, previousTimeline=None):
         '''
-        Takes a list of lines from a file and an empty list [] and fills that
-        list with Pattern objects.
+        Takes a list of lines from a file and fills self.transcribedPatterns
+        with Transcribed objects.
 
-        This is not a good way to do this for later.
-        '''
-        currentTitle = ""
-        currentGongPattern = None
-        currentDrumPattern = None
-        currentComments = None
-        currentPatternIndex = 0
-        
-        for line in lineList:
-            if line == '' and currentTitle is None:
+        previousBlocks and previousTimeline are used by reloadTranscribed:
+        a list of (blockKey, patterns) from an earlier parse, whose patterns
+        (and their alignment) are reused for every time block that has not
+        changed, and the timeline of that parse (see _buildTimeline).
+
+        The headings in the file ('=====' session, '====' one drum at a time
+        or together, '===' players, '==' type of gong) are not patterns: they
+        build the Session / SubsessionByPlayer / ImprovInGong hierarchy in
+        self.transcribedSessions that each pattern belongs to.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> fp.transcribed[0]
+        <bali.Transcribed 00:00:08:(r)l r e e T e T e T e T e T e T e T e T e T e T r e e T e T e T r>
+        >>> fp.transcribed[0].drumType
+        'Lanang'
+        >>> session = fp.sessions[0]
+        >>> session
+        <bali.Session Pak Cok and Pak Dewa>
+        >>> session.subsessionsByPlayer[0]
+        <bali.SubsessionByPlayer Lanang: Pak Cok>
+        >>> improv = session.subsessionsByPlayer[0].improvsInGong[0]
+        >>> improv
+        <bali.ImprovInGong Batel>
+        >>> improv.patterns[0] is fp.transcribed[0]
+        True
+
+        Where both drummers play together each time block has a gong line, a
+        lanang line, and a wadon line.  The two drum lines become two
+        Transcribed patterns, paired in a DualDrummer:
+
+        >>> together = session.subsessionsByPlayer[-1]
+        >>> together
+        <bali.SubsessionByPlayer both: Pak Cok (Lanang), Pak Dewa (Wadon)>
+        >>> dd = together.improvsInGong[0].dualDrummers[0]
+        >>> dd.firstDrummerPattern()
+        <bali.Transcribed 00:06:13:(l)_ r e e T e T e T e T e T e T e T e T e T e T r e e T e T e T r>
+        >>> dd.secondDrummerPattern()
+        <bali.Transcribed 00:06:13:` ` ` ` ` ` ` ` ` ` o d D _ _ _ r l r o o _ D _ _ o _ d D _ r o o>
+        >>> dd.secondDrummerPattern().drumType
+        'Wadon'
+
+        The strokes that lead in to an improvisation are sometimes written
+        before its first gong line.  They are not its title: they are kept
+        as the leadIn of the pattern they lead in to.
+
+        >>> tabuhTelu = together.improvsInGong[2]
+        >>> first = tabuhTelu.patterns[0]
+        >>> first.title, first.comments, first.startTime
+        ('02:57:59', None, 177.59)
+        >>> first.leadIn
+        'l _ e _ l _ e _ l _ e _ l _ e'
+        >>> tabuhTelu.patterns[1].leadIn
+        'o _ l _ o _ l'
+        '''
+        self.transcribedSessions = []
+        self.transcribedDualDrummers = []
+        self.alignmentErrors = []
+
+        blocks = [] # (block, improv) for each time block, in order
+        currentSession = None
+        currentSubsession = None
+        currentImprov = None
+        isTogether = False
+        block = None
+
+        for lineNumber, line in enumerate(lineList):
+            if line.startswith('='):
+                blocks.append((block, currentImprov))
+                block = None
+                level = len(line) - len(line.lstrip('='))
+                heading = line.lstrip('=').strip()
+                if level >= 5:
+                    currentSession = Session()
+                    currentSession.nameOfPlayers = heading
+                    currentSession.indexInFile = len(self.transcribedSessions)
+                    currentSession.parentFileParser = self
+                    self.transcribedSessions.append(currentSession)
+                    currentSubsession = None
+                    currentImprov = None
+                    isTogether = False
+                elif level == 4:
+                    isTogether = 'together' in heading.lower()
+                    currentSubsession = None
+                    currentImprov = None
+                elif level == 3:
+                    if currentSession is None:
+                        raise BaliException('Players given before any session: ' + line)
+                    currentSubsession = SubsessionByPlayer()
+                    currentSubsession.setPlayersFromHeading(heading, isTogether)
+                    currentSubsession.indexInSession = len(currentSession.subsessionsByPlayer)
+                    currentSubsession.parentSession = currentSession
+                    currentSession.subsessionsByPlayer.append(currentSubsession)
+                    currentImprov = None
+                else:
+                    if currentSubsession is None:
+                        raise BaliException('Type of gong given before any players: ' + line)
+                    currentImprov = ImprovInGong()
+                    currentImprov.typeOfGong = heading
+                    currentImprov.indexInSubsessionByPlayer = len(
+                                                    currentSubsession.improvsInGong)
+                    currentImprov.parentSubsessionByPlayer = currentSubsession
+                    currentSubsession.improvsInGong.append(currentImprov)
                 continue
-            elif line == '':
+
+            if block is None:
+                if line == '':
+                    continue
+                block = self._newBlock()
+
+            if currentSubsession is not None and not currentSubsession.isSinglePlayer:
+                drumsInBlock = 2
+            else:
+                drumsInBlock = 1
+
+            if line == '':
+                if len(block['drums']) >= drumsInBlock:
+                    blocks.append((block, currentImprov))
+                    block = None
+            elif line.startswith('(G)'):
+                if block['gong'] is not None:
+                    blocks.append((block, currentImprov))
+                    block = self._newBlock()
+                block['gong'] = line
+                block['line'] = lineNumber
+            elif block['gong'] is None:
+                if not self._looksLikeTitle(line) and self._looksLikeDrumLine(line):
+                    # strokes leading in to the first cycle, before its gong line
+                    block['leadIns'].append(line)
+                elif block['title'] is None:
+                    block['title'] = line
+                else:
+                    block['comments'] = line
+            elif block['drums'] and self._looksLikeTitle(line):
+                # the second drum of a together block is missing.
+                blocks.append((block, currentImprov))
+                block = self._newBlock(line)
+            elif len(block['drums']) < drumsInBlock:
+                block['drums'].append(line)
+            else:
+                block['comments'] = line
+
+        blocks.append((block, currentImprov))
+        blocks = [(b, improv) for b, improv in blocks if b is not None and b['drums']]
+
+        keys = [self._blockKey(b) for b, unused in blocks]
+        reused = [None] * len(blocks)
+        if previousBlocks:
+            matcher = difflib.SequenceMatcher(None, [k for k, unused in previousBlocks],
+                                              keys, autojunk=False)
+            for tag, i1, unused_i2, j1, j2 in matcher.get_opcodes():
+                if tag == 'equal':
+                    for offset in range(j2 - j1):
+                        reused[j1 + offset] = previousBlocks[i1 + offset][1]
+
+        self._transcribedBlocks = []
+        for (b, improv), key, oldPatterns in zip(blocks, keys, reused):
+            newPatterns = self._addTranscribedBlock(b, improv, oldPatterns)
+            for p in newPatterns:
+                p.lineInSourceFile = b['line']
+            self._transcribedBlocks.append((key, newPatterns))
+        self._buildTimeline(previousTimeline)
+        self.transcribedSequences = StrokeSequences(self.transcribedPatterns)
+        self.transcribedSequences.intern(self.transcribedPatterns)
+
+    def _buildTimeline(self, previous=None):
+        '''
+        Gives every stroke of every transcribed pattern an onset time in
+        seconds, stored in one float array, self.strokeOnsets; the strokes of
+        pattern number i are self.strokeOnsets[self.strokeOffsets[i]:self.strokeOffsets[i + 1]].
+
+        Each ImprovInGong has its own clock.  The first stroke of a time
+        block is at the time in its title; strokes in between are evenly
+        spaced up to the next block with a time stamp, and the strokes after
+        the last (or before the first) time stamp continue at the nearest
+        speed.  Time stamps that go backwards are ignored.  Improvisations
+        with fewer than two time stamps get nan.
+
+        Stamps closer together than minSecondsPerSlot a slot are misread:
+        00:00:SS stamps are then read as seconds rather than centiseconds,
+        and if the stamps are still too close the improvisation gets nan.
+
+        Here ten seconds pass from the start of pattern 19 to the start of
+        pattern 22, over 64 + 32 + 32 strokes:
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> [p.title for p in fp.transcribed[19:23]]
+        ['01:01:00', '', '', '01:11:00']
+        >>> fp.transcribed[19].onsets[:4]
+        array([61.      , 61.078125, 61.15625 , 61.234375])
+        >>> float(fp.transcribed[19].onsets[-1]), float(fp.transcribed[20].onsets[0])
+        (66.0, 66.0)
+        >>> fp.transcribed[20].onsets[[0, -1]]
+        array([66. , 68.5])
+        >>> len(fp.strokeOnsets) == int(fp.strokeOffsets[-1])
+        True
+
+        The first Batel starts with 00:00:08 ... 00:00:41, a millisecond a
+        slot as centiseconds, so they are read as seconds:
+
+        >>> [p.title.strip() for p in fp.transcribed[:2]]
+        ['00:00:08', '00:00:11']
+        >>> fp.transcribed[0].onsets[[0, -1]]
+        array([ 8., 11.])
+
+        previous is (strokeOnsets, strokeOffsets, places) from an earlier
+        parse, where places maps the id of each pattern of that parse to
+        its (indexInFile, improvInGong) then.  An improvisation made of
+        exactly the same patterns as before keeps its onsets, which are
+        copied rather than computed again.
+        '''
+        counts = numpy.array([len(p.strokes) for p in self.transcribedPatterns], dtype=int)
+        self.strokeOffsets = numpy.zeros(len(counts) + 1, dtype=int)
+        numpy.cumsum(counts, out=self.strokeOffsets[1:])
+        self.strokeOnsets = numpy.full(self.strokeOffsets[-1], numpy.nan)
+        for session in self.transcribedSessions:
+            for subsession in session.subsessionsByPlayer:
+                for improv in subsession.improvsInGong:
+                    if previous is None or not self._copyImprovTimes(improv, previous):
+                        self._timeImprov(improv, counts)
+
+    def _copyImprovTimes(self, improv, previous):
+        '''
+        Copies the onsets of the patterns of improv from the previous
+        timeline if they were all in one improvisation that had no other
+        patterns; returns False (and copies nothing) otherwise.
+        '''
+        oldOnsets, oldOffsets, places = previous
+        oldPlaces = [places.get(id(p)) for p in improv.patterns]
+        if not oldPlaces or None in oldPlaces:
+            return False
+        oldImprov = oldPlaces[0][1]
+        if (oldImprov is None or len(oldImprov.patterns) != len(oldPlaces)
+                or any(place[1] is not oldImprov for place in oldPlaces)):
+            return False
+        offsets = self.strokeOffsets
+        for p, (oldIndex, unused_improv) in zip(improv.patterns, oldPlaces):
+            i = p.indexInFile
+            self.strokeOnsets[offsets[i]:offsets[i + 1]] = oldOnsets[oldOffsets[oldIndex]:
+                                                                     oldOffsets[oldIndex + 1]]
+        return True
+
+    def _timeImprov(self, improv, counts):
+        '''
+        Fills in self.strokeOnsets for the patterns of one ImprovInGong.
+        counts is the number of strokes of each transcribed pattern.
+        '''
+        # the second drum of a together block shares the first one's clock
+        blockStart = {}
+        stamps = [] # (clock, seconds) of each block with a time stamp
+        clock = 0
+        for patt in improv.patterns:
+            dd = patt.dualDrummer
+            if dd is not None and dd.patterns[0] is not patt:
+                blockStart[patt.indexInFile] = blockStart[dd.patterns[0].indexInFile]
+                continue
+            blockStart[patt.indexInFile] = clock
+            seconds = secondsFromTimestamp(patt.title)
+            if seconds is not None:
+                stamps.append((clock, seconds))
+            clock += counts[patt.indexInFile] - 1
+        for patt in improv.patterns:
+            patt.firstTick = blockStart[patt.indexInFile]
+        anchorClocks, anchorTimes = self._timeAnchors(stamps)
+        if len(anchorTimes) < 2:
+            return
+        if self._tooFast(anchorClocks, anchorTimes):
+            # 00:00:SS may be hours, minutes, and seconds
+            anchorClocks, anchorTimes = self._timeAnchors(
+                [(c, s * 100 if s < 1 else s) for c, s in stamps])
+            if len(anchorTimes) < 2 or self._tooFast(anchorClocks, anchorTimes):
+                return
+
+        indices = numpy.array([p.indexInFile for p in improv.patterns], dtype=int)
+        starts = numpy.array([blockStart[i] for i in indices], dtype=int)
+        strokeCounts = counts[indices]
+        # the clock of every stroke: its block's start plus its position in the block
+        positions = numpy.arange(strokeCounts.sum()) - numpy.repeat(
+                                numpy.cumsum(strokeCounts) - strokeCounts, strokeCounts)
+        strokeClocks = numpy.repeat(starts, strokeCounts) + positions
+
+        xp = numpy.array(anchorClocks, dtype=float)
+        fp = numpy.array(anchorTimes)
+        times = numpy.interp(strokeClocks, xp, fp)
+        before = strokeClocks < xp[0]
+        times[before] = fp[0] + (strokeClocks[before] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+        after = strokeClocks > xp[-1]
+        times[after] = fp[-1] + (strokeClocks[after] - xp[-1]) * (
+                                    (fp[-1] - fp[-2]) / (xp[-1] - xp[-2]))
+
+        destination = numpy.concatenate([numpy.arange(self.strokeOffsets[i],
+                                                      self.strokeOffsets[i + 1])
+                                         for i in indices])
+        self.strokeOnsets[destination] = times
+
+    @staticmethod
+    def _timeAnchors(stamps):
+        '''
+        Returns the clocks and times of the (clock, seconds) stamps that go
+        forward in time; the others are ignored.
+
+        >>> import bali
+        >>> bali.FileParser._timeAnchors([(0, 8.0), (32, 11.0), (64, 9.5), (96, 14.0)])
+        ([0, 32, 96], [8.0, 11.0, 14.0])
+        '''
+        anchorClocks = []
+        anchorTimes = []
+        for clock, seconds in stamps:
+            if not anchorTimes or seconds > anchorTimes[-1]:
+                anchorClocks.append(clock)
+                anchorTimes.append(seconds)
+        return anchorClocks, anchorTimes
+
+    @staticmethod
+    def _tooFast(anchorClocks, anchorTimes):
+        '''
+        True if any two successive anchors are less than minSecondsPerSlot
+        apart for each slot between them.
+
+        >>> import bali
+        >>> bali.FileParser._tooFast([0, 32, 64], [0.08, 0.11, 0.23])
+        True
+        >>> bali.FileParser._tooFast([0, 32, 64], [8.0, 11.0, 23.0])
+        False
+        '''
+        secondsPerSlot = numpy.diff(anchorTimes) / numpy.diff(anchorClocks)
+        return bool((secondsPerSlot < minSecondsPerSlot).any())
+
+    @staticmethod
+    def _looksLikeTitle(line):
+        '''
+        True if a line is a time stamp or other title rather than a drum line.
+
+        >>> import bali
+        >>> bali.FileParser._looksLikeTitle('00:37:58 *angkat')
+        True
+        >>> bali.FileParser._looksLikeTitle('time')
+        True
+        >>> bali.FileParser._looksLikeTitle('` ` ` ` ` ` ` ` r _ o d D')
+        False
+        '''
+        return re.match(r'(\d+:\d+|time$|\*)', line) is not None
+
+    @staticmethod
+    def _looksLikeDrumLine(line):
+        '''
+        True if a line is nothing but drum strokes, like the strokes leading
+        in to an improvisation that are written before its first gong line.
+
+        >>> import bali
+        >>> bali.FileParser._looksLikeDrumLine('l _ e _ l _ e _ l _ e _ l _ e')
+        True
+        >>> bali.FileParser._looksLikeDrumLine('02:57:59')
+        False
+        >>> bali.FileParser._looksLikeDrumLine('angsel')
+        False
+        '''
+        tokens = strokeVocabulary.tokenize(line)
+        return bool(tokens) and all(t in strokeVocabulary
+                                    and not strokeVocabulary[t].drums.isdisjoint(('Lanang',
+                                                                                 'Wadon'))
+                                    for t in tokens)
+
+    @staticmethod
+    def _newBlock(title=None):
+        '''
+        An empty time block for parseTranscribed to fill in.
+        '''
+        return {'title': title, 'gong': None, 'drums': [], 'comments': None, 'leadIns': [],
+                'line': -1}
+
+    @staticmethod
+    def _blockKey(block):
+        '''
+        The content of one time block as a hashable key: two blocks with the
+        same key parse to the same patterns.
+
+        >>> import bali
+        >>> block = bali.FileParser._newBlock('00:37:58')
+        >>> block['gong'] = '(G)- - - 1'
+        >>> block['drums'].append('(r)e _ e T')
+        >>> bali.FileParser._blockKey(block)
+        ('00:37:58', '(G)- - - 1', None, (), '(r)e _ e T')
+        '''
+        return ((block['title'], block['gong'], block['comments'], tuple(block['leadIns']))
+                + tuple(block['drums']))
+
+    def _addTranscribedBlock(self, block, improv, oldPatterns=None):
+        '''
+        Makes Transcribed patterns out of one time block (title, gong line,
+        one or two drum lines) and adds them to the corpus and to improv.
+        If oldPatterns (the patterns of an identical block from an earlier
+        parse) are given, they are reused instead of made anew, and so is
+        the DualDrummer that aligned them.
+
+        Returns the list of patterns.
+        '''
+        if block is None or not block['drums']:
+            return []
+        title = block['title'] or ''
+        if title.endswith(':'):
+            title = title[0:len(title) - 1]
+
+        subsession = None
+        if improv is not None:
+            subsession = improv.parentSubsessionByPlayer
+
+        oldDualDrummer = None
+        if oldPatterns is not None and len(oldPatterns) == 2:
+            oldDualDrummer = oldPatterns[0].dualDrummer
+
+        newPatterns = []
+        for i, drumPattern in enumerate(block['drums']):
+            if oldPatterns is not None:
+                patt = oldPatterns[i]
+            else:
                 patt = Transcribed()
-                patt.indexInFile = currentPatternIndex
-                currentPatternIndex += 1
                 patt.fileParser = self
-                
-                if currentTitle.endswith(':'):
-                    currentTitle = currentTitle[0:len(currentTitle) - 1]
-                patt.title = currentTitle
-                patt.gongPattern = currentGongPattern
-                patt.drumPattern = currentDrumPattern
-                patt.comments = currentComments
-                self.transcribedPatterns.append(patt)
-                currentTitle = None
-                currentGongPattern = None
-                currentDrumPattern = None
-                currentComments = None
-            elif currentTitle is None:
-                currentTitle = line
-            elif currentGongPattern is None:
-                currentGongPattern = line
-            elif currentDrumPattern is None:
-                currentDrumPattern = line
+                patt.title = title
+                patt.gongPattern = block['gong']
+                patt.drumPattern = drumPattern
+                patt.comments = block['comments']
+                if i < len(block['leadIns']):
+                    patt.leadIn = block['leadIns'][i]
+            patt.indexInFile = len(self.transcribedPatterns)
+            patt.improvInGong = improv
+            patt.dualDrummer = None
+            if subsession is not None:
+                if subsession.isSinglePlayer:
+                    patt.drumType = subsession.drumType
+                else:
+                    patt.drumType = ('Lanang', 'Wadon')[i]
+                patt.player = subsession.playerName(patt.drumType)
+            self.transcribedPatterns.append(patt)
+            if improv is not None:
+                improv.patterns.append(patt)
+            newPatterns.append(patt)
+
+        if len(newPatterns) == 2:
+            if oldDualDrummer is not None:
+                dd = oldDualDrummer
             else:
-                currentComments = line
+                dd = DualDrummer()
+                dd.title = title
+                dd.gongPattern = block['gong']
+                dd.patterns = newPatterns
+            for patt in newPatterns:
+                patt.dualDrummer = dd
+            if improv is not None:
+                dd.typeOfGong = improv.typeOfGong
+                dd.indexInSubsessionByPlayer = len(improv.dualDrummers)
+                dd.parentSubsessionByPlayer = subsession
+                dd.parentImprovInGong = improv
+                improv.dualDrummers.append(dd)
+            self.transcribedDualDrummers.append(dd)
+            if oldDualDrummer is None or dd.strokeArray is None:
+                try:
+                    dd.alignStrokes()
+                except AlignmentException as ae:
+                    self.alignmentErrors.append(str(ae))
+        return newPatterns
+
+    def reloadTranscribed(self, lineList=None):
+        '''
+        Reads the transcription file again (or takes a new lineList) and
+        makes new Transcribed objects only for the time blocks that have
+        changed since the last parse.  Returns a TranscribedChanges object
+        saying which patterns were added, removed, or changed.
+
+        The lines are all scanned again and the Session / SubsessionByPlayer /
+        ImprovInGong hierarchy is built anew, since any heading may have
+        moved; that is most of the time a reload takes.  What is kept from
+        the last parse is everything that would cost more to redo: the
+        Transcribed objects of unchanged blocks (with their indexInFile and
+        place in the hierarchy updated), so anything computed from them can
+        be kept as well; the DualDrummers that aligned them; and the onsets
+        of every improvisation whose time blocks are all unchanged.
+
+        A corpus of several files (CorpusReader) is read again file by file,
+        each parsed on its own as when first read.  A lineList given here is
+        parsed as one file.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> lines = list(fp.fileReader.transcribed)
+        >>> first = fp.transcribed[0]
+        >>> third = fp.transcribed[2]
+        >>> numPatterns = len(fp.transcribed)
+
+        Change the strokes of one line, delete one block, and reload:
+
+        >>> i = lines.index(first.drumPattern)
+        >>> lines[i] = lines[i].replace('(r)l', '(r)r')
+        >>> second = lines.index('00:00:11')
+        >>> lines[second:second + 3]
+        ['00:00:11', '(G)- - - pu- ... - G', '(r)l l T r e e T r e e T ... r U _ T l']
+        >>> del lines[second:second + 4]
+        >>> changes = fp.reloadTranscribed(lines)
+        >>> changes
+        <bali.TranscribedChanges 0 added, 1 removed, 1 changed>
+        >>> changes.changed
+        [(<bali.Transcribed 00:00:08:(r)l r e e T ...>, <bali.Transcribed 00:00:08:(r)r r e e T ...>)]
+        >>> changes.removed[0].title, changes.removed[0].indexInFile
+        ('00:00:11', -1)
+        >>> len(fp.transcribed) == numPatterns - 1
+        True
+
+        The other patterns are the same objects as before, now one earlier:
+
+        >>> fp.transcribed[1] is third
+        True
+        >>> third.title, third.indexInFile, third.improvInGong
+        ('time', 1, <bali.ImprovInGong Batel>)
+        >>> float(third.onsets[0]) > 0.11
+        True
+
+        Reloading the same lines again changes nothing:
+
+        >>> fp.reloadTranscribed(lines)
+        <bali.TranscribedChanges 0 added, 0 removed, 0 changed>
+        '''
+        fromFiles = lineList is None
+        # several files are parsed each on its own, as when first read
+        eachFile = fromFiles and len(self.fileReader.transcribedFiles) > 1
+        if fromFiles:
+            self.fileReader.clear()
+            lineList = self.fileReader.transcribed
+        if not self.transcribedPatterns:
+            if eachFile:
+                self._parseFiles('transcribed')
+            else:
+                self.parseTranscribed(lineList)
+                self._setTranscribedSources(fromFiles)
+            return TranscribedChanges(added=list(self.transcribedPatterns))
+
+        previousBlocks = self._transcribedBlocks
+        oldPatterns = list(self.transcribedPatterns)
+        previousTimeline = (self.strokeOnsets, self.strokeOffsets,
+                            dict((id(p), (p.indexInFile, p.improvInGong)) for p in oldPatterns))
+        self.transcribedPatterns = []
+        if eachFile:
+            self._reparseFiles(previousBlocks, previousTimeline)
+        else:
+            self.parseTranscribed(lineList, previousBlocks, previousTimeline)
+            self._setTranscribedSources(fromFiles)
+
+        # pair up the blocks that are no longer there with the new ones in their place
+        changes = TranscribedChanges()
+        kept = set(id(p) for p in self.transcribedPatterns)
+        matcher = difflib.SequenceMatcher(None, [k for k, unused in previousBlocks],
+                                          [k for k, unused in self._transcribedBlocks],
+                                          autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            removed = [p for unused, patts in previousBlocks[i1:i2] for p in patts]
+            added = [p for unused, patts in self._transcribedBlocks[j1:j2] for p in patts]
+            numChanged = min(len(removed), len(added))
+            changes.changed.extend(zip(removed[:numChanged], added[:numChanged]))
+            changes.removed.extend(removed[numChanged:])
+            changes.added.extend(added[numChanged:])
+        for p in oldPatterns:
+            if id(p) not in kept:
+                p.indexInFile = -1
+        return changes
+
+    def _reparseFiles(self, previousBlocks, previousTimeline):
+        '''
+        For reloadTranscribed on a corpus of several files: parses every file
+        on its own, reusing the time blocks that file had in previousBlocks,
+        and merges them as _parseFiles does.
+        '''
+        blocksByFile = collections.defaultdict(list)
+        for key, patterns in previousBlocks:
+            path = patterns[0].sourceFile if patterns else None
+            blocksByFile[path].append((key, patterns))
+        parsed = []
+        for path in self.fileReader.transcribedFiles:
+            sub = FileParser()
+            sub.fileReader = CorpusReader(glob.escape(path))
+            sub.parseTranscribed(sub.fileReader.transcribed, blocksByFile.get(path))
+            parsed.append((path, sub))
+        self.transcribedSessions = []
+        self.transcribedDualDrummers = []
+        self.alignmentErrors = []
+        self._transcribedBlocks = []
+        self._mergeParsed('transcribed', parsed, previousTimeline)
+
+    def _setTranscribedSources(self, fromFiles=True):
+        '''
+        After reloadTranscribed of a single file (or of lineList): sets the
+        sourceFile, indexInSourceFile, and lineInSourceFile of every
+        transcribed pattern from its line in the file.  Lines not read from
+        the files can only be placed if there is one file; otherwise only the
+        patterns kept from before keep a sourceFile.
+        '''
+        paths = self.fileReader.transcribedFiles
+        if not fromFiles and len(paths) != 1:
+            return
+        lineStarts = self.fileReader.lineStarts('transcribed') if fromFiles else [0]
+        counts = [0] * len(paths)
+        for p in self.transcribedPatterns:
+            f = max(0, bisect.bisect_right(lineStarts, p.lineInSourceFile) - 1)
+            p.sourceFile = paths[f]
+            p.lineInSourceFile -= lineStarts[f]
+            p.indexInSourceFile = counts[f]
+            counts[f] += 1
+
+class TranscribedChanges(object):
+    '''
+    What FileParser.reloadTranscribed found: lists of the .added and
+    .removed Transcribed patterns, and of (old, new) pairs of patterns
+    that were edited in .changed.
+    '''
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<bali.TranscribedChanges %d added, %d removed, %d changed>' % (
+                            len(self.added), len(self.removed), len(self.changed))
 
 class FileReader(object):
-    def __init__(self):
-        self.directory = os.path.dirname(__file__)
-        self._taught = os.path.join(self.directory, 'taught_patterns.txt')
-        self._transcribed = os.path.join(self.directory, 'all_patterns.txt')
+    '''
+    Reads taught_patterns.txt and all_patterns.txt from directory (by
+    default the directory this module is in).
+    '''
+    fileNames = ('taught_patterns.txt', 'all_patterns.txt')
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.dirname(os.path.abspath(__file__))
+        self.directory = directory
+        self._taught = os.path.join(self.directory, self.fileNames[0])
+        self._transcribed = os.path.join(self.directory, self.fileNames[1])
         self._taughtContents = None
         self._transcribedContents = None
 
+    @property
+    def taughtFiles(self):
+        return [self._taught]
+
+    @property
+    def transcribedFiles(self):
+        return [self._transcribed]
+
     @property
     def taught(self):
         if self._taughtContents is not None:
             return self._taughtContents
-        with io.open(self._taught, encoding='utf-8') as t:
+        with profiling.timed('file read'), io.open(self._taught, encoding='utf-8') as t:
             self._taughtContents = t.readlines()
         
         for i in range(len(self._taughtContents)):
             self._taughtContents[i] = self._taughtContents[i].strip()
         return self._taughtContents
     
+    def clear(self):
+        '''
+        Forgets the contents of both files so that they are read again.
+        '''
+        self._taughtContents = None
+        self._transcribedContents = None
+
+    def lineStarts(self, kind):
+        '''
+        Where each of the taught or transcribed files starts in .taught or
+        .transcribed: here there is one file of each.
+        '''
+        return [0]
+
     @property
     def transcribed(self):
         if self._transcribedContents is not None:
             return self._transcribedContents
-        with io.open(self._transcribed, encoding='utf-8') as t:
+        with profiling.timed('file read'), io.open(self._transcribed, encoding='utf-8') as t:
             self._transcribedContents = t.readlines()
         for i in range(len(self._transcribedContents)):
             self._transcribedContents[i] = self._transcribedContents[i].strip()
 
         return self._transcribedContents
-     
+
+
+class CorpusReader(FileReader):
+    '''
+    Reads a corpus spread over many files: in a directory, the files whose
+    names match taughtPattern (taught patterns) and transcribedPattern
+    (transcriptions); or every file matching a glob, where the files that
+    match taughtPattern are taught patterns and all the others are
+    transcriptions.  .taught and .transcribed give the lines of all the
+    files of each kind, one file after another in sorted order.
+
+    >>> import bali, os, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> for name in ('taught_patterns.txt', 'all_patterns_2.txt', 'all_patterns_1.txt',
+    ...              'notes.txt', 'session3.txt'):
+    ...     with open(os.path.join(directory, name), 'w') as f:
+    ...         unused = f.write(name + '\\n')
+    >>> reader = bali.CorpusReader(directory)
+    >>> [os.path.basename(f) for f in reader.transcribedFiles]
+    ['all_patterns_1.txt', 'all_patterns_2.txt']
+    >>> reader.taught, reader.transcribed
+    (['taught_patterns.txt'], ['all_patterns_1.txt', 'all_patterns_2.txt'])
+    >>> reader.lineStarts('transcribed')
+    [0, 1]
+
+    A glob names the files itself:
+
+    >>> reader = bali.CorpusReader(os.path.join(directory, 'session*.txt'))
+    >>> len(reader.taughtFiles), [os.path.basename(f) for f in reader.transcribedFiles]
+    (0, ['session3.txt'])
+    '''
+    taughtPattern = 'taught*.txt'
+    transcribedPattern = 'all_patterns*.txt'
+
+    def __init__(self, corpus):
+        if os.path.isdir(corpus):
+            directory = corpus
+            paths = [path for pattern in (self.taughtPattern, self.transcribedPattern)
+                     for path in glob.glob(os.path.join(corpus, pattern))]
+        else:
+            directory = os.path.dirname(corpus)
+            paths = glob.glob(corpus)
+        if not paths:
+            raise BaliException('No pattern files in %r' % corpus)
+        super(CorpusReader, self).__init__(directory)
+        paths = sorted(set(paths))
+        self._taughtFiles = [f for f in paths
+                             if fnmatch.fnmatch(os.path.basename(f), self.taughtPattern)]
+        self._transcribedFiles = [f for f in paths if f not in self._taughtFiles]
+        self._taught = self._taughtFiles[0] if self._taughtFiles else None
+        self._transcribed = self._transcribedFiles[0] if self._transcribedFiles else None
+        self._lineStarts = {}
+
+    @property
+    def taughtFiles(self):
+        return self._taughtFiles
+
+    @property
+    def transcribedFiles(self):
+        return self._transcribedFiles
+
+    def _readLines(self, kind):
+        lines = []
+        starts = []
+        for path in getattr(self, kind + 'Files'):
+            starts.append(len(lines))
+            with profiling.timed('file read'), io.open(path, encoding='utf-8') as f:
+                lines.extend(line.strip() for line in f)
+        self._lineStarts[kind] = starts
+        return lines
+
+    def lineStarts(self, kind):
+        '''
+        Where each of the taught or transcribed files starts in .taught or
+        .transcribed.
+        '''
+        getattr(self, kind) # read the files if not read yet
+        return self._lineStarts[kind]
+
+    @property
+    def taught(self):
+        if self._taughtContents is None:
+            self._taughtContents = self._readLines('taught')
+        return self._taughtContents
+
+    @property
+    def transcribed(self):
+        if self._transcribedContents is None:
+            self._transcribedContents = self._readLines('transcribed')
+        return self._transcribedContents
+
+
 class Taught(Pattern):
     @property
     def drumType(self):
@@ -1074,60 +3103,123 @@ class Taught(Pattern):
             return m.group(1)
                       
 class Transcribed(Pattern):
+    def __init__(self):
+        super(Transcribed, self).__init__()
+        self.improvInGong = None # the ImprovInGong this pattern is in
+        self.dualDrummer = None # the DualDrummer if both drums play together
+        self.player = ""
+        self.firstTick = 0 # sixteenths from the start of the ImprovInGong to strokes[0]
+        self.lineInSourceFile = -1 # line of the gong line in sourceFile, from 0
+        self.leadIn = None # strokes written before the first gong line, leading in to this
+        self._drumType = None
+
+    def _getDrumType(self):
+        '''
+        The drum type given by the headings of the file, or inferred from the
+        strokes if there are no headings.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.transcribed[0]
+        >>> pattern.drumType
+        'Lanang'
+        >>> pattern.player
+        'Pak Cok'
+        >>> pattern = bali.Transcribed()
+        >>> pattern.drumPattern = '(o)r o d D o r o o'
+        >>> pattern.drumType
+        'Wadon'
+        '''
+        if self._drumType is not None:
+            return self._drumType
+        return self.drumTypeInfer()
+
+    def _setDrumType(self, drumType):
+        self._drumType = drumType
+
+    drumType = property(_getDrumType, _setDrumType)
+
     def drumTypeInfer(self):
         '''
         Infers type of drum from strokes for transcribed patterns
 
         >>> import bali
         >>> fp = bali.FileParser()
-        >>> pattern = fp.transcribed[4]
+        >>> pattern = fp.transcribed[0]
         >>> pattern.drumTypeInfer()
         'Lanang'
 
-        >>> pattern = fp.transcribed[110]
-        
-        <<< pattern.drumTypeInfer()
+        >>> pattern = fp.transcribed[116]
+        >>> pattern.drumTypeInfer()
         'Wadon'
         '''
         if self.drumPattern is None:
             raise BaliException("Cannot infer drum type when drumPattern is None")
             
-        if any(x in self.drumPattern for x in ['e', 'T', 'U']):
+        strokes = set(self.strokes)
+        if strokes & strokeVocabulary.symbolsForDrum('Lanang'):
             return 'Lanang'
-        if any(x in self.drumPattern for x in ['d', 'D', 'D.', 'o', 'K']):
+        if strokes & strokeVocabulary.symbolsForDrum('Wadon'):
             return 'Wadon'
         else:
             return 'unknown'
     
-    def timeAtBeat(self, patternIndex, beat):
+    @property
+    def startTime(self):
+        '''
+        The time in seconds in the title of this pattern, or None if it
+        has no time stamp.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> fp.transcribed[19].startTime
+        61.0
+        >>> fp.transcribed[2].title, fp.transcribed[2].startTime
+        ('time', None)
+        '''
+        return secondsFromTimestamp(self.title)
+
+    @property
+    def onsets(self):
+        '''
+        A numpy array with the onset time in seconds of each of self.strokes,
+        looked up in the timeline that the FileParser built when parsing.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> pattern = fp.transcribed[21]
+        >>> len(pattern.onsets) == len(pattern.strokes)
+        True
+        >>> pattern.onsets[:3]
+        array([68.5     , 68.578125, 68.65625 ])
+        '''
+        fp = self.fileParser
+        if fp is None or fp.strokeOnsets is None:
+            raise BaliException('Only patterns parsed by a FileParser have onsets')
+        i = self.indexInFile
+        return fp.strokeOnsets[fp.strokeOffsets[i]:fp.strokeOffsets[i + 1]]
+
+    def timeAtBeat(self, beat):
         '''
-        Extracts time at a certain beat, given in 00:00:00 = minute:second:centisecond,
-        extrapolated from time at beginning of current pattern and beginning of next
-        pattern. Only works for patterns with timings at beginning
+        Returns the time in seconds at a certain beat, interpolated from the time
+        stamps around this pattern.  Use timestampFromSeconds to get it in the
+        00:00:00 = minute:second:centisecond notation of the file.
 
         >>> from music21 import *
         >>> import bali
         >>> fp = bali.FileParser()
-        >>> pattern = fp.transcribed[4]
-        >>> pattern.timeAtBeat(4, 2)
-        '0:0:8.75'
+        >>> pattern = fp.transcribed[19]
+        >>> pattern.title
+        '01:01:00'
+        >>> pattern.timeAtBeat(4)
+        62.25
+        >>> bali.timestampFromSeconds(pattern.timeAtBeat(4))
+        '01:02:25'
+        >>> pattern.timeAtBeat(4.125)
+        62.2890625
         '''
-        fp = FileParser()
-        pointInPattern = (len(self.strokes[:beat * 2 * 2])) / (len(self.strokes) - 1)
-        timeFirstPattern = fp.transcribed[patternIndex].title.split(':')
-        timeNextPattern = fp.transcribed[patternIndex + 1].title.split(':')
-        centisecondsFirstPattern = (timeFirstPattern[0] * 6000 + timeFirstPattern[1] * 100
-                                    + timeFirstPattern[2])
-        centisecondsNextPattern = (timeNextPattern[0] * 6000 + timeNextPattern[1] * 100
-                                   + timeNextPattern[2])
-        deltaCentiseconds = pointInPattern * (int(centisecondsNextPattern) - 
-                                                int(centisecondsFirstPattern))
-        newInCentiseconds = int(centisecondsFirstPattern) + deltaCentiseconds
-        newMinutes = int(newInCentiseconds / 6000)
-        newSeconds = int((newInCentiseconds - newMinutes * 6000) / 100)
-        newCentiseconds = newInCentiseconds - newMinutes * 6000 - newSeconds * 100
-        time = ':'.join([str(newMinutes), str(newSeconds), str(newCentiseconds)])
-        return time
+        onsets = self.onsets
+        return float(numpy.interp(beat * 4, numpy.arange(len(onsets)), onsets))
 
     def lastBeatOfLastPattern(self):
         '''
@@ -1138,7 +3230,7 @@ class Transcribed(Pattern):
         >>> from music21 import *
         >>> import bali
         >>> fp = bali.FileParser()
-        >>> pattern = fp.transcribed[5]
+        >>> pattern = fp.transcribed[1]
         >>> pattern.lastBeatOfLastPattern()
         'r'       
         '''
@@ -1159,6 +3251,10 @@ class PatternHolder():
     pass
 
 class Session(PatternHolder):
+    '''
+    Everything played by one pair of drummers, from a '=====' heading in
+    the transcription file.
+    '''
     def __init__(self):
         self.subsessionsByPlayer = []
         self.nameOfPlayers = ""
@@ -1181,8 +3277,17 @@ class Session(PatternHolder):
         '''
         Combines current session object with next session object.
         '''
-    
+
+    def __repr__(self):
+        return '<{0}.{1} {2}>'.format(self.__module__, self.__class__.__name__,
+                                      self.nameOfPlayers)
+
 class SubsessionByPlayer(PatternHolder):
+    '''
+    The part of a session played by one drummer, or by both drummers together,
+    from a '===' heading such as 'Lanang - Pak Cok' or
+    'Pak Dewa Wadon Pak Cok Lanang'.
+    '''
     def __init__(self):
         self.improvsInGong = []
         self.indexInSession = -1
@@ -1190,7 +3295,50 @@ class SubsessionByPlayer(PatternHolder):
         self.drumType = "" # lanang, wadon, or both...
         self.lanangPlayerName = ""
         self.wadonPlayerName = ""
-        self.parentSubsession = None
+        self.parentSession = None
+
+    def setPlayersFromHeading(self, heading, isTogether=False):
+        '''
+        Sets the drumType and player names from the text of a '===' heading.
+
+        >>> import bali
+        >>> sub = bali.SubsessionByPlayer()
+        >>> sub.setPlayersFromHeading('Wadon \u2013 Pak Buda')
+        >>> sub.drumType, sub.wadonPlayerName
+        ('Wadon', 'Pak Buda')
+        >>> sub.setPlayersFromHeading('Pak Buda Wadon Pak Tama Lanang', isTogether=True)
+        >>> sub.isSinglePlayer, sub.drumType, sub.lanangPlayerName, sub.wadonPlayerName
+        (False, 'both', 'Pak Tama', 'Pak Buda')
+        '''
+        if isTogether:
+            self.isSinglePlayer = False
+            self.drumType = 'both'
+            m = re.match(r'(.*?)\s+(Lanang|Wadon)\s+(.*?)\s+(Lanang|Wadon)', heading)
+            if m is None:
+                raise BaliException('Cannot find both players in: ' + heading)
+            names = {m.group(2): m.group(1), m.group(4): m.group(3)}
+            self.lanangPlayerName = names.get('Lanang', '')
+            self.wadonPlayerName = names.get('Wadon', '')
+        else:
+            self.isSinglePlayer = True
+            m = re.match(r'(Lanang|Wadon)\s*[-\u2013]\s*(.*)', heading)
+            if m is None:
+                raise BaliException('Cannot find drum and player in: ' + heading)
+            self.drumType = m.group(1)
+            if self.drumType == 'Lanang':
+                self.lanangPlayerName = m.group(2).strip()
+            else:
+                self.wadonPlayerName = m.group(2).strip()
+
+    def playerName(self, drumType):
+        '''
+        Returns the name of the player of drumType ('Lanang' or 'Wadon')
+        '''
+        if drumType == 'Lanang':
+            return self.lanangPlayerName
+        elif drumType == 'Wadon':
+            return self.wadonPlayerName
+        return ""
 
     def nextSubsessionByPlayer(self):
         '''
@@ -1208,13 +3356,155 @@ class SubsessionByPlayer(PatternHolder):
         '''
         Combines current subsession object with next subsession object.
         '''
+
+    def __repr__(self):
+        if self.isSinglePlayer:
+            players = self.playerName(self.drumType)
+        else:
+            players = '{0} (Lanang), {1} (Wadon)'.format(self.lanangPlayerName,
+                                                        self.wadonPlayerName)
+        return '<{0}.{1} {2}: {3}>'.format(self.__module__, self.__class__.__name__,
+                                           self.drumType, players)
         
 class ImprovInGong(PatternHolder):
+    '''
+    One improvisation over a type of gong (Batel, Tabuh Dua...) from a '=='
+    heading.  .patterns holds its Transcribed patterns in the order of the file;
+    if both drummers play together .dualDrummers pairs them up.
+    '''
     def __init__(self):
         self.typeOfGong = ""
         self.indexInSubsessionByPlayer = -1
         self.patterns = []
+        self.dualDrummers = []
         self.parentSubsessionByPlayer = None
+        self._timeIndexes = {}
+
+    @property
+    def fileParser(self):
+        try:
+            return self.parentSubsessionByPlayer.parentSession.parentFileParser
+        except AttributeError:
+            return None
+
+    @staticmethod
+    def _secondsFrom(time):
+        '''
+        Returns time in seconds, given as a number or a time stamp string.
+        '''
+        if isinstance(time, numbers.Real):
+            return float(time)
+        seconds = None
+        if isinstance(time, str):
+            seconds = secondsFromTimestamp(time)
+        if seconds is None:
+            raise BaliException('Not a time in seconds or a time stamp: {0!r}'.format(time))
+        return seconds
+
+    def _timeIndex(self, drumType=None):
+        '''
+        Returns (onsets, strokeIndices): the onsets of the strokes of this
+        improvisation (of drumType only, if given) sorted by time, and where
+        each of those strokes is in the FileParser's strokeOnsets.
+        As in Pattern.iterateStrokes, the stroke before the first beat of
+        each pattern is left out, since it is the last stroke of the pattern
+        before.  Built the first time it is needed.
+        '''
+        if drumType in self._timeIndexes:
+            return self._timeIndexes[drumType]
+        fp = self.fileParser
+        ranges = [numpy.arange(fp.strokeOffsets[p.indexInFile] + 1,
+                               fp.strokeOffsets[p.indexInFile + 1])
+                  for p in self.patterns
+                  if drumType is None or p.drumType == drumType]
+        if ranges:
+            strokeIndices = numpy.concatenate(ranges)
+        else:
+            strokeIndices = numpy.empty(0, dtype=int)
+        onsets = fp.strokeOnsets[strokeIndices]
+        order = numpy.argsort(onsets, kind='stable')
+        self._timeIndexes[drumType] = (onsets[order], strokeIndices[order])
+        return self._timeIndexes[drumType]
+
+    def strokesBetween(self, start, end, drumType=None):
+        '''
+        Returns a list of (pattern, slice) pairs for the strokes whose onsets
+        are at or after start and before end, in seconds or as time stamps
+        like '1:32' or '01:32:50'; pattern.strokes[slice] are the strokes.
+        Only strokes of drumType are given if it is 'Lanang' or 'Wadon'.
+
+        Each ImprovInGong is its own recording, so times are on its own clock.
+        Finding the strokes is a binary search in the sorted onsets, so it
+        takes time in proportion to the log of the number of strokes plus
+        the number of strokes found.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> improv = fp.sessions[0].subsessionsByPlayer[0].improvsInGong[0]
+        >>> for pattern, strokes in improv.strokesBetween('1:32', '01:36:10'):
+        ...     print(pattern.title, strokes, ''.join(pattern.strokes[strokes]))
+        01:31:77 slice(2, 33, None) rlreeTrlrlreeTreeTeTeTreltrU_rl
+        01:36:00 slice(1, 2, None) T
+
+        >>> for pattern, strokes in improv.strokesBetween(92, 92.5):
+        ...     print(pattern.title, strokes, pattern.onsets[strokes].round(2))
+        01:31:77 slice(2, 6, None) [92.03 92.17 92.3  92.43]
+
+        In sections with both drummers each drum can be asked for alone:
+
+        >>> together = fp.sessions[0].subsessionsByPlayer[-1].improvsInGong[0]
+        >>> for pattern, strokes in together.strokesBetween('00:06:13', '00:06:40'):
+        ...     print(pattern.drumType, pattern.strokes[strokes])
+        Lanang ['_', 'r', 'e']
+        Wadon ['`', '`', '`']
+        >>> together.strokesBetween('00:06:13', '00:06:40', drumType='Wadon')
+        [(<bali.Transcribed 00:06:13:` ` ` ...>, slice(1, 4, None))]
+
+        Any real number is a time in seconds, numpy's included:
+
+        >>> import numpy
+        >>> found = improv.strokesBetween(numpy.int64(92), numpy.float64(92.5))
+        >>> found == improv.strokesBetween(92, 92.5)
+        True
+        >>> improv.strokesBetween('soon', 92.5)
+        Traceback (most recent call last):
+        bali.BaliException: Not a time in seconds or a time stamp: 'soon'
+        '''
+        start = self._secondsFrom(start)
+        end = self._secondsFrom(end)
+        onsets, strokeIndices = self._timeIndex(drumType)
+        low = numpy.searchsorted(onsets, start, side='left')
+        high = numpy.searchsorted(onsets, end, side='left')
+        found = strokeIndices[low:high]
+
+        fp = self.fileParser
+        patternIndices = numpy.searchsorted(fp.strokeOffsets, found, side='right') - 1
+        positions = found - fp.strokeOffsets[patternIndices]
+        slices = {}
+        order = []
+        for patternIndex, position in zip(patternIndices.tolist(), positions.tolist()):
+            if patternIndex not in slices:
+                slices[patternIndex] = [position, position]
+                order.append(patternIndex)
+            else:
+                slices[patternIndex][0] = min(slices[patternIndex][0], position)
+                slices[patternIndex][1] = max(slices[patternIndex][1], position)
+        return [(fp.transcribed[i], slice(slices[i][0], slices[i][1] + 1)) for i in order]
+
+    def patternsBetween(self, start, end, drumType=None):
+        '''
+        Returns the patterns that have any strokes between start and end.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> improv = fp.sessions[0].subsessionsByPlayer[0].improvsInGong[0]
+        >>> improv.patternsBetween('1:32', '1:48')
+        [<bali.Transcribed 01:31:77:...>, <bali.Transcribed 01:36:00:...>,
+         <bali.Transcribed :...>, <bali.Transcribed :...>,
+         <bali.Transcribed 01:42:57:...>, <bali.Transcribed 01:44:66:...>,
+         <bali.Transcribed :...>]
+        '''
+        return [p for p, unused_slice in self.strokesBetween(start, end, drumType)]
 
     def nextImprovInGong(self):
         '''
@@ -1276,6 +3566,10 @@ class ImprovInGong(PatternHolder):
         '''
         pass
 
+    def __repr__(self):
+        return '<{0}.{1} {2}>'.format(self.__module__, self.__class__.__name__,
+                                      self.typeOfGong)
+
 class SingleDrummer(PatternHolder):
     def __init__(self):
         self.typeOfGong = ""
@@ -1284,17 +3578,101 @@ class SingleDrummer(PatternHolder):
         self.parentSubsessionByPlayer = None
 
 class DualDrummer(PatternHolder):
+    '''
+    One time block where both drummers were transcribed together: .patterns
+    holds the lanang pattern and then the wadon pattern, and .strokeArray
+    aligns their strokes slot by slot in a two-row numpy array.
+
+    >>> import bali
+    >>> fp = bali.FileParser()
+    >>> dd = fp.dualDrummers[1]
+    >>> dd
+    <bali.DualDrummer 00:08:82 (Batel)>
+    >>> dd.strokeArray[:, :6]
+    array([['r', 'e', 'e', 'T', 'e', 'T'],
+           ['o', 'd', 'D', 'o', 'r', 'o']], dtype='<U2')
+    '''
     def __init__(self):
         self.typeOfGong = ""
         self.indexInSubsessionByPlayer = -1
         self.patterns = []
         self.parentSubsessionByPlayer = None
+        self.parentImprovInGong = None
+        self.title = ""
+        self.gongPattern = ""
+        self.strokeArray = None
 
     def firstDrummerPattern(self):
-        pass
+        '''
+        Returns the lanang pattern, which is written first.
+        '''
+        return self.patterns[0]
     
     def secondDrummerPattern(self):
-        pass
+        '''
+        Returns the wadon pattern, which is written second.
+        '''
+        return self.patterns[1]
+
+    def alignStrokes(self):
+        '''
+        Sets .strokeArray to a numpy array whose first row is the strokes
+        of the lanang and second row the strokes of the wadon, or raises
+        an AlignmentException if they do not have the same number of strokes.
+
+        >>> import bali
+        >>> lanang = bali.Transcribed()
+        >>> lanang.drumPattern = '(r)e e T r'
+        >>> wadon = bali.Transcribed()
+        >>> wadon.drumPattern = '(o)r o d'
+        >>> dd = bali.DualDrummer()
+        >>> dd.title = '00:01:00'
+        >>> dd.patterns = [lanang, wadon]
+        >>> dd.alignStrokes()
+        Traceback (most recent call last):
+        bali.AlignmentException: 00:01:00 (): Lanang has 5 strokes but Wadon has 4
+        >>> wadon.drumPattern = '(o)r o d D'
+        >>> dd.alignStrokes()
+        >>> dd.strokeArray
+        array([['r', 'e', 'e', 'T', 'r'],
+               ['o', 'r', 'o', 'd', 'D']], dtype='<U2')
+        '''
+        lanangStrokes = self.firstDrummerPattern().strokes
+        wadonStrokes = self.secondDrummerPattern().strokes
+        if len(lanangStrokes) != len(wadonStrokes):
+            self.strokeArray = None
+            raise AlignmentException(
+                '{0} ({1}): Lanang has {2} strokes but Wadon has {3}'.format(
+                    self.title, self.typeOfGong, len(lanangStrokes), len(wadonStrokes)))
+        self.strokeArray = numpy.array([lanangStrokes, wadonStrokes], dtype='<U2')
+
+    def slotsWhere(self, lanangStroke=None, wadonStroke=None):
+        '''
+        Returns the indices of the aligned slots where the lanang plays
+        lanangStroke and the wadon plays wadonStroke (either may be None
+        to mean any stroke).  As elsewhere, a string of several strokes
+        such as 'Dd' matches any of them.
+
+        >>> import bali
+        >>> fp = bali.FileParser()
+        >>> dd = fp.dualDrummers[1]
+        >>> dd.slotsWhere('e', 'o')
+        array([21, 30])
+        >>> dd.slotsWhere('T', 'Dd')
+        array([15, 19, 31])
+        '''
+        if self.strokeArray is None:
+            raise AlignmentException('Strokes of {0} are not aligned'.format(self.title))
+        matches = numpy.ones(self.strokeArray.shape[1], dtype=bool)
+        for row, wanted in enumerate((lanangStroke, wadonStroke)):
+            if wanted is None:
+                continue
+            matches &= numpy.isin(self.strokeArray[row], list(wanted) + [wanted])
+        return numpy.flatnonzero(matches)
+
+    def __repr__(self):
+        return '<{0}.{1} {2} ({3})>'.format(self.__module__, self.__class__.__name__,
+                                            self.title, self.typeOfGong)
         
 
 ###### Tests
@@ -1311,14 +3689,22 @@ class Test(unittest.TestCase):
         lastPattern = fp.taught[-1]
         self.assertEqual(lastPattern.title, 'Pak Tama Wadon Variant 3')
     
-    def xtestDrumTypeInfer(self):
+    def testDrumTypeInfer(self):
         import bali
         
         fp = bali.FileParser()
-        pattern = fp.transcribed[110]
+        pattern = fp.transcribed[116]
         drumTypeInferred = pattern.drumTypeInfer()
         
         self.assertEqual(drumTypeInferred, 'Wadon')
 
 if __name__ == '__main__':
-    music21.mainTest(Test)
+    # python -m bali <command> runs the command line interface (cli.py);
+    # python -m bali --test runs the tests
+    import sys
+    if sys.argv[1:2] == ['--test']:
+        del sys.argv[1]
+        music21.mainTest(Test)
+    else:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
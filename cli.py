@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+'''
+The command line interface, run as ``python -m bali <command>`` (or
+``python cli.py <command>``; ``--test`` instead of a command runs the tests).
+Every command writes one JSON object per line to standard output as soon as
+it is computed, so that large results can be piped into other programs
+without being collected in memory first.
+
+Commands:
+
+* parse -- every pattern with its strokes and labels
+* validate -- the diagnostics of validator.validateCorpus
+* query -- where a motif occurs, a metric of every pattern, or the
+  transcribed strokes in a time range
+* stats -- the weighted percentages of the hypotheses in hypotheses.registry
+* permute -- sequential permutation tests (taught_statistics) of the same hypotheses
+* report -- observed percentages, null quantiles and p-values of every
+  hypothesis on the taught and transcribed patterns, cached on disk (see report.py)
+* serve -- answer the same queries over HTTP (see server.py)
+
+Common options are --corpus (a directory with taught_patterns.txt and
+all_patterns.txt, or a directory or glob of many pattern files; see
+bali.CorpusReader), --workers (number of processes), and --seed.
+'''
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import concurrent.futures
+import functools
+import itertools
+import json
+import math
+import os
+import sys
+
+import bali
+import hypotheses
+import numpy # @UnresolvedImport
+
+commands = ('parse', 'validate', 'query', 'stats', 'permute', 'report', 'serve')
+
+# Pattern methods that query --metric can compute, and the options they take
+metrics = {'percentOnBeat': ('stroke', 'beatLevel'),
+           'beatsInPattern': ('stroke',),
+           'firstOrThirdBeat': ('stroke',),
+           'secondOrFourthBeat': ('stroke',),
+           'beatLength': (),
+           }
+
+_workerParser = None # the FileParser of a worker process
+
+
+def _jsonDefault(obj):
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    if isinstance(obj, numpy.ndarray):
+        return obj.tolist()
+    raise TypeError('cannot write {0!r} as JSON'.format(obj))
+
+
+def _finite(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def writeRecords(records, out=None):
+    '''
+    Writes each dict in records as one line of JSON as soon as it is
+    produced, and returns how many were written.
+
+    >>> import cli
+    >>> cli.writeRecords(iter([{'a': 1}, {'b': float('nan')}]))
+    {"a": 1}
+    {"b": NaN}
+    2
+    '''
+    if out is None:
+        out = sys.stdout
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, sort_keys=True, ensure_ascii=False,
+                             default=_jsonDefault) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+
+def fileParser(corpus=None):
+    '''
+    Returns a FileParser reading the corpus in directory or glob corpus (by
+    default the files that come with this package).
+    '''
+    return bali.FileParser(corpus)
+
+
+def _initWorker(corpus):
+    global _workerParser # pylint: disable=global-statement
+    _workerParser = fileParser(corpus)
+
+
+def _parserFor(corpus):
+    if _workerParser is not None:
+        return _workerParser
+    return fileParser(corpus)
+
+
+def selectPatterns(fp, kind='all', drumType=None):
+    '''
+    Returns the taught, transcribed, or all (taught first) patterns of fp,
+    optionally only those of one drumType.
+    '''
+    patterns = []
+    if kind in ('all', 'taught'):
+        patterns.extend(fp.taught)
+    if kind in ('all', 'transcribed'):
+        patterns.extend(fp.transcribed)
+    if drumType is not None:
+        patterns = [p for p in patterns if p.drumType == drumType]
+    return patterns
+
+
+def patternId(pattern):
+    return {'kind': 'taught' if isinstance(pattern, bali.Taught) else 'transcribed',
+            'index': pattern.indexInFile}
+
+
+def patternRecord(pattern):
+    '''
+    The JSON record of one pattern written by the parse command.
+
+    >>> import bali, cli
+    >>> fp = bali.FileParser()
+    >>> record = cli.patternRecord(fp.transcribed[19])
+    >>> sorted(record)
+    ['comments', 'drumType', 'gongPattern', 'index', 'kind', 'player', 'startTime',
+     'strokes', 'title']
+    >>> record['startTime'], record['player'], record['strokes'][:4]
+    (61.0, 'Pak Cok', ['U', '_', 'P', '_'])
+    '''
+    record = patternId(pattern)
+    record.update({'title': pattern.title,
+                   'drumType': pattern.drumType,
+                   'gongPattern': pattern.gongPattern,
+                   'strokes': pattern.strokes,
+                   'comments': pattern.comments,
+                   })
+    if isinstance(pattern, bali.Taught):
+        record['teacher'] = pattern.teacher
+    else:
+        record['player'] = pattern.player
+        record['startTime'] = _finite(pattern.startTime)
+    return record
+
+
+def parseCommand(args):
+    '''
+    >>> import cli
+    >>> cli.main(['parse', '--kind', 'taught', '--limit', '2'])
+    {"comments": null, "drumType": "Lanang", "gongPattern": "(4)- ● - 1 ... 4", "index": 0,
+     "kind": "taught", "strokes": ["e", "_", "e", ...], "teacher": null, "title": "Lanang Dasar"}
+    {"comments": null, "drumType": "Lanang", ..., "index": 1, ..., "teacher": "Pak Tama",
+     "title": "Pak Tama Lanang 0 (intro)"}
+    0
+    '''
+    fp = fileParser(args.corpus)
+    patterns = selectPatterns(fp, args.kind, args.drum)[:args.limit]
+    writeRecords(patternRecord(p) for p in patterns)
+    return 0
+
+
+def validateCommand(args):
+    '''
+    Writes each diagnostic as soon as its line is checked.  Returns 1 (the
+    exit status) if there are any diagnostics.
+
+    >>> import cli
+    >>> cli.main(['validate', '--limit', '2'])
+    {"check": "implausibleTime", "file": "all_patterns.txt", "line": 13,
+     "message": "0.03 seconds for the 32 slots since line 9"}
+    {"check": "missingPrefix", "file": "all_patterns.txt", "line": 27, ...}
+    1
+    '''
+    import validator
+    fp = fileParser(args.corpus)
+    diagnostics = itertools.islice(validator.iterateCorpus(fp.fileReader), args.limit)
+    written = writeRecords({'file': d.fileName, 'line': d.lineNumber, 'check': d.check,
+                            'message': d.message} for d in diagnostics)
+    return 1 if written else 0
+
+
+def motifRecords(patterns, motif):
+    '''
+    Yields a record for every place in patterns where the list of strokes motif occurs.
+    '''
+    width = len(motif)
+    for p in patterns:
+        strokes = p.strokes
+        for i in range(len(strokes) - width + 1):
+            if strokes[i:i + width] == motif:
+                record = patternId(p)
+                record.update({'slot': i, 'beat': i * 0.25})
+                if isinstance(p, bali.Transcribed):
+                    onsets = p.onsets
+                    record['time'] = _finite(float(onsets[i])) if len(onsets) else None
+                yield record
+
+
+def _metricChunk(corpus, kind, drumType, indices, metric, metricArgs):
+    '''
+    Computes metric for the patterns at indices (in a worker process or not).
+    '''
+    patterns = selectPatterns(_parserFor(corpus), kind, drumType)
+    records = []
+    for i in indices:
+        p = patterns[i]
+        record = patternId(p)
+        record[metric] = getattr(p, metric)(*metricArgs)
+        records.append(record)
+    return records
+
+
+def _chunks(n, numChunks):
+    size = max(1, -(-n // max(1, numChunks)))
+    return [range(start, min(n, start + size)) for start in range(0, n, size)]
+
+
+def betweenRecords(fp, start, end, drumType=None):
+    '''
+    Yields a record for every transcribed pattern with strokes between the
+    times start and end (seconds or time stamps), in every ImprovInGong.
+    '''
+    for session in fp.sessions:
+        for subsession in session.subsessionsByPlayer:
+            for improv in subsession.improvsInGong:
+                for p, slots in improv.strokesBetween(start, end, drumType):
+                    record = patternId(p)
+                    record.update({'improv': improv.typeOfGong,
+                                   'start': slots.start, 'stop': slots.stop,
+                                   'strokes': p.strokes[slots]})
+                    yield record
+
+
+def queryCommand(args):
+    '''
+    Where a motif occurs:
+
+    >>> import cli
+    >>> cli.main(['query', '--motif', 'e e T', '--kind', 'taught', '--limit', '2'])
+    {"beat": 0.75, "index": 2, "kind": "taught", "slot": 3}
+    {"beat": 0.25, "index": 4, "kind": "taught", "slot": 1}
+    0
+
+    A metric of every pattern (with --workers, computed in that many processes):
+
+    >>> cli.main(['query', '--metric', 'percentOnBeat', '--stroke', 'T',
+    ...           '--beat-level', 'guntang', '--kind', 'taught', '--limit', '2'])
+    {"index": 0, "kind": "taught", "percentOnBeat": 0.0}
+    {"index": 1, "kind": "taught", "percentOnBeat": 0.0}
+    0
+
+    The strokes in a time range of the transcriptions:
+
+    >>> cli.main(['query', '--between', '61', '61.2', '--drum', 'Lanang', '--limit', '2'])
+    {"improv": "Batel", "index": 18, "kind": "transcribed", "start": 32, "stop": 33,
+     "strokes": ["U"]}
+    {"improv": "Batel", "index": 19, "kind": "transcribed", "start": 1, "stop": 3,
+     "strokes": ["_", "P"]}
+    0
+    '''
+    fp = fileParser(args.corpus)
+    if args.between is not None:
+        start, end = args.between
+        records = betweenRecords(fp, start, end, args.drum)
+    elif args.motif is not None:
+        patterns = selectPatterns(fp, args.kind, args.drum)
+        records = motifRecords(patterns, bali.strokeVocabulary.tokenize(args.motif))
+    elif args.metric is not None:
+        if args.metric not in metrics:
+            raise bali.BaliException('Unknown metric {0!r}; use one of {1}'.format(
+                                            args.metric, ', '.join(sorted(metrics))))
+        options = {'stroke': args.stroke, 'beatLevel': bali.BeatLevel[args.beat_level]}
+        metricArgs = tuple(options[name] for name in metrics[args.metric])
+        numPatterns = len(selectPatterns(fp, args.kind, args.drum))
+        if args.limit is not None:
+            numPatterns = min(numPatterns, args.limit)
+        chunk = functools.partial(_metricChunk, args.corpus, args.kind, args.drum,
+                                  metric=args.metric, metricArgs=metricArgs)
+        records = _mapRecords(chunk, _chunks(numPatterns, args.workers * 4), args)
+        writeRecords(records)
+        return 0
+    else:
+        raise bali.BaliException('query needs --motif, --metric, or --between')
+    writeRecords(r for i, r in zip(range(args.limit or sys.maxsize), records))
+    return 0
+
+
+def _mapRecords(function, jobs, args):
+    '''
+    Runs function on each job, in args.workers processes if more than one,
+    and yields the records of each job in order as soon as it is done.
+    '''
+    if args.workers <= 1:
+        for job in jobs:
+            for record in function(job):
+                yield record
+        return
+    with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_initWorker,
+                                                initargs=(args.corpus,)) as executor:
+        for records in executor.map(function, jobs):
+            for record in records:
+                yield record
+
+
+def _selectedHypotheses(args):
+    return hypotheses.registry.select(args.hypothesis or None)[:args.limit]
+
+
+def _nameGroups(args):
+    '''
+    The names of the selected hypotheses (at most --limit of them) split into
+    one group per worker.
+    '''
+    names = [h.name for h in _selectedHypotheses(args)]
+    return [tuple(names[i] for i in chunk) for chunk in _chunks(len(names), args.workers)]
+
+
+def statsJob(corpus, kind, names):
+    '''
+    Evaluates the hypotheses called names together in one pass over the taught
+    (or transcribed) patterns and returns a list of their records.
+    '''
+    patterns = getattr(_parserFor(corpus), kind)
+    selected = hypotheses.registry.select(names)
+    observed = hypotheses.BatchEngine(selected).evaluate(patterns)
+    return [{'hypothesis': h.name,
+             'weightedPercent': observed[h.name],
+             'patterns': sum(1 for p in patterns if p.drumType == h.drumType)}
+            for h in selected]
+
+
+def statsCommand(args):
+    '''
+    The selected hypotheses (by default every one in hypotheses.registry, or
+    the first --limit of them) are evaluated together in one pass over the
+    taught (or with --kind the transcribed) patterns, or with --workers split
+    among that many processes.
+
+    >>> import cli
+    >>> cli.main(['stats', '--hypothesis', 'percentOnBeatLanangEDouble',
+    ...           '--hypothesis', 'percentOffBeatLanangTGuntang'])
+    {"hypothesis": "percentOnBeatLanangEDouble", "patterns": 41, "weightedPercent": 56.8...}
+    {"hypothesis": "percentOffBeatLanangTGuntang", "patterns": 41, "weightedPercent": 97.2...}
+    0
+    >>> cli.main(['stats', '--hypothesis', 'percentOffBeatLanangTGuntang',
+    ...           '--kind', 'transcribed'])
+    {"hypothesis": "percentOffBeatLanangTGuntang", "patterns": ..., "weightedPercent": 95.6...}
+    0
+    >>> cli.main(['stats', '--limit', '2'])
+    {"hypothesis": "percentOnBeatLanangEDouble", ...}
+    {"hypothesis": "percentOnBeatLanangEDoubleSingle", ...}
+    0
+    '''
+    job = functools.partial(statsJob, args.corpus, args.kind)
+    writeRecords(_mapRecords(job, _nameGroups(args), args))
+    return 0
+
+
+def permuteRecords(corpus, alpha, maxPermutations, seed, names, kind='taught'):
+    '''
+    Runs the sequential permutation tests of the hypotheses called names
+    together (hypotheses.BatchEngine.iterPermutationTest) on the taught (or
+    transcribed) patterns and yields the record of each as soon as it is
+    decided.
+    '''
+    fp = _parserFor(corpus)
+    engine = hypotheses.BatchEngine(hypotheses.registry.select(names))
+    for name, result in engine.iterPermutationTest(getattr(fp, kind), alpha=alpha,
+                                                   maxPermutations=maxPermutations, seed=seed):
+        yield {'hypothesis': name,
+               'observed': result.observed,
+               'pValue': result.pValue,
+               'confidenceInterval': list(result.confidenceInterval()),
+               'permutations': result.permutations,
+               'significant': result.significant,
+               'seed': seed}
+
+
+def permuteJob(corpus, alpha, maxPermutations, seed, names, kind='taught'):
+    '''
+    The list of permuteRecords, for running in a worker process.
+    '''
+    return list(permuteRecords(corpus, alpha, maxPermutations, seed, names, kind))
+
+
+def permuteCommand(args):
+    '''
+    All the selected hypotheses (at most --limit of them) are tested on the
+    same scrambled corpora, drawn from --seed, and each record is written as
+    soon as its hypothesis is decided.  With --workers the hypotheses are split
+    among that many processes; every process draws the same scrambled corpora
+    from --seed, so with a seed the results do not change.
+
+    >>> import cli
+    >>> cli.main(['permute', '--hypothesis', 'percentOffBeatLanangTGuntang', '--seed', '1'])
+    {"confidenceInterval": [...], "hypothesis": "percentOffBeatLanangTGuntang",
+     "observed": 97.2..., "pValue": 0.0033..., "permutations": 300, "seed": 1,
+     "significant": true}
+    0
+    '''
+    groups = _nameGroups(args)
+    if args.workers <= 1:
+        records = permuteRecords(args.corpus, args.alpha, args.max_permutations, args.seed,
+                                 groups[0] if groups else (), args.kind)
+    else:
+        job = functools.partial(permuteJob, args.corpus, args.alpha, args.max_permutations,
+                                args.seed, kind=args.kind)
+        records = _mapRecords(job, groups, args)
+    writeRecords(records)
+    return 0
+
+
+def reportCommand(args):
+    '''
+    Writes one record per hypothesis and kind of pattern, or with --table
+    the whole report as a table.  --seed defaults to 0 here so that the
+    report can be reproduced (and cached).
+
+    >>> import cli
+    >>> cli.main(['report', '--hypothesis', 'percentOnBeatWadonDGuntang', '--kind', 'taught',
+    ...           '--permutations', '100', '--no-cache', '--table'])
+    hypothesis                               kind        observed  weight  null 5%  null 50% ...
+    percentOnBeatWadonDGuntang               taught         26.00      50 ...
+    0
+    '''
+    import report
+    kinds = report.kinds if args.kind == 'all' else (args.kind,)
+    rows = report.runReport(args.corpus, args.hypothesis or None, kinds, args.permutations,
+                            args.seed, workers=args.workers,
+                            cache=None if args.no_cache else args.cache_dir)
+    rows = rows[:args.limit]
+    if args.table:
+        print(report.formatReport(rows))
+    else:
+        writeRecords(rows)
+    return 0
+
+
+def serveCommand(args):
+    '''
+    Runs the HTTP server of server.py until interrupted.
+    '''
+    import server
+    server.serve(args.corpus, args.host, args.port, args.workers, args.cache_size)
+    return 0
+
+
+def argumentParser():
+    parser = argparse.ArgumentParser(prog='python -m bali',
+                                     description='Query and analyze the Balinese drumming corpus.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--corpus', default=None,
+                        help='directory or glob of the pattern files')
+    common.add_argument('--workers', type=int, default=1, help='number of processes')
+    common.add_argument('--seed', type=int, default=None, help='random seed')
+    common.add_argument('--limit', type=int, default=None,
+                        help='write at most this many records')
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument('--kind', choices=('all', 'taught', 'transcribed'), default='all')
+    selection.add_argument('--drum', choices=('Lanang', 'Wadon'), default=None)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    subparsers.add_parser('parse', parents=[common, selection],
+                          help='write every pattern')
+    subparsers.add_parser('validate', parents=[common],
+                          help='check the corpus files for malformed lines')
+    query = subparsers.add_parser('query', parents=[common, selection],
+                                  help='search for a motif, a metric, or a time range')
+    query.add_argument('--motif', help="strokes to search for, such as 'e e T'")
+    query.add_argument('--metric', help='one of ' + ', '.join(sorted(metrics)))
+    query.add_argument('--stroke', default='e', help='type of stroke for --metric')
+    query.add_argument('--beat-level', default='double',
+                       choices=[level.name for level in bali.BeatLevel])
+    query.add_argument('--between', nargs=2, metavar=('START', 'END'),
+                       help='seconds or mm:ss:cc time stamps')
+    for name, helpText in (('stats', 'weighted percentages of the hypotheses'),
+                           ('permute', 'permutation tests of the hypotheses')):
+        sub = subparsers.add_parser(name, parents=[common], help=helpText)
+        sub.add_argument('--hypothesis', action='append',
+                         help='run only this hypothesis (may be repeated)')
+        sub.add_argument('--kind', choices=('taught', 'transcribed'), default='taught')
+    permute = subparsers.choices['permute']
+    permute.add_argument('--alpha', type=float, default=0.05)
+    permute.add_argument('--max-permutations', type=int, default=1000000)
+    reportParser = subparsers.add_parser('report', parents=[common],
+                                         help='the full statistics report of the hypotheses')
+    reportParser.set_defaults(seed=0)
+    reportParser.add_argument('--hypothesis', action='append',
+                              help='report only this hypothesis (may be repeated)')
+    reportParser.add_argument('--kind', choices=('all', 'taught', 'transcribed'), default='all')
+    reportParser.add_argument('--permutations', type=int, default=1000,
+                              help='number of scrambled corpora for the null distribution')
+    reportParser.add_argument('--cache-dir', default=os.path.join(os.path.expanduser('~'),
+                                                                  '.cache', 'bali'),
+                              help='directory of the cached results')
+    reportParser.add_argument('--no-cache', action='store_true',
+                              help='neither read nor write cached results')
+    reportParser.add_argument('--table', action='store_true',
+                              help='print a table instead of JSON records')
+    serve = subparsers.add_parser('serve', parents=[common],
+                                  help='answer queries over HTTP, keeping the corpus loaded')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--cache-size', type=int, default=256,
+                       help='number of responses to keep')
+    return parser
+
+
+def _timeArgument(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text # a time stamp
+
+
+def main(argv=None):
+    '''
+    Runs the command in argv (by default sys.argv[1:]) and returns its exit status.
+    '''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argumentParser()
+    if not argv:
+        parser.print_help()
+        return 2
+    args = parser.parse_args(argv)
+    if getattr(args, 'between', None) is not None:
+        args.between = [_timeArgument(t) for t in args.between]
+    command = {'parse': parseCommand,
+               'validate': validateCommand,
+               'query': queryCommand,
+               'stats': statsCommand,
+               'permute': permuteCommand,
+               'report': reportCommand,
+               'serve': serveCommand,
+               }[args.command]
+    try:
+        return command(args)
+    except BrokenPipeError:
+        # whatever was reading the output (head, less...) has stopped; not an error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
+
+if __name__ == '__main__':
+    # python cli.py --test runs the tests; anything else is a command
+    if sys.argv[1:2] == ['--test']:
+        del sys.argv[1]
+        import music21
+        music21.mainTest()
+    else:
+        sys.exit(main())
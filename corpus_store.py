@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+'''
+A read-only, memory-mapped store of a whole corpus, for sharing the patterns
+between the processes of a pool without every worker re-parsing the text files.
+
+The store is one binary file holding flat arrays: every stroke of every pattern
+as one uint8 code per stroke, the offset and length of each pattern in that
+buffer, label codes (taught or transcribed, drum type, teacher), and the titles
+and gong patterns as utf-8 text with offsets.  Opening the file maps it into
+memory; the arrays are views of the map, so any number of processes share
+one copy in the operating system's page cache.
+
+StoredPattern objects read their strokes straight from the map and otherwise
+behave like Patterns, so analyses written against the Pattern API run on them
+unchanged.  Pickling a CorpusStore (or a StoredPattern) sends only the path of
+the file; the receiving process opens (once) its own map of it.
+'''
+from __future__ import print_function, absolute_import, division
+
+import io
+import json
+import os
+import struct
+
+import bali
+import numpy # @UnresolvedImport
+
+_magic = b'BALICORP'
+_version = 1
+_alignment = 8
+_kinds = ('taught', 'transcribed')
+_textColumns = ('title', 'gongPattern', 'comments')
+
+_openStores = {} # path -> CorpusStore, so that unpickling reuses one map per process
+
+
+def _aligned(n):
+    return (n + _alignment - 1) // _alignment * _alignment
+
+
+def _encodeCategories(values):
+    categories = sorted(set(values))
+    lookup = dict((v, i) for i, v in enumerate(categories))
+    return categories, numpy.array([lookup[v] for v in values], dtype=numpy.uint8)
+
+
+def _encodeText(strings):
+    encoded = [(s or '').encode('utf-8') for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum([len(e) for e in encoded])
+    return numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8), offsets
+
+
+def writeCorpusStore(path, fileParser=None, patterns=None):
+    '''
+    Writes the patterns (by default all the taught and then all the
+    transcribed patterns of fileParser) to a store at path, and returns the
+    opened CorpusStore.
+
+    >>> import os, tempfile
+    >>> import bali, corpus_store
+    >>> fp = bali.FileParser()
+    >>> path = os.path.join(tempfile.mkdtemp(), 'corpus.bali')
+    >>> store = corpus_store.writeCorpusStore(path, fp)
+    >>> len(store) == len(fp.taught) + len(fp.transcribed)
+    True
+    '''
+    if fileParser is None:
+        fileParser = bali.FileParser()
+    if patterns is None:
+        patterns = fileParser.taught + fileParser.transcribed
+
+    strokeLists = [p.strokes for p in patterns]
+    vocabulary = sorted(set(s for strokes in strokeLists for s in strokes))
+    if len(vocabulary) > 256:
+        raise bali.BaliException(
+            'Cannot store %d different strokes as uint8 codes' % len(vocabulary))
+    codeOf = dict((s, i) for i, s in enumerate(vocabulary))
+
+    lengths = numpy.array([len(s) for s in strokeLists], dtype=numpy.int32)
+    offsets = numpy.zeros(len(patterns), dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(lengths)[:-1]
+    arrays = {
+        'strokes': numpy.array([codeOf[s] for strokes in strokeLists for s in strokes],
+                               dtype=numpy.uint8),
+        'offsets': offsets,
+        'lengths': lengths,
+        'indexInFile': numpy.array([p.indexInFile for p in patterns], dtype=numpy.int32),
+        'hasPrefix': numpy.array([p.drumPattern[:1] == '(' for p in patterns],
+                                 dtype=numpy.uint8),
+        }
+    labels = {}
+    for name, values in (('kind', ['taught' if isinstance(p, bali.Taught) else 'transcribed'
+                                   for p in patterns]),
+                         ('drumType', [p.drumType for p in patterns]),
+                         ('teacher', [(p.teacher if isinstance(p, bali.Taught)
+                                       else getattr(p, 'player', '')) or ''
+                                      for p in patterns])):
+        labels[name], arrays[name] = _encodeCategories(values)
+    for name in _textColumns:
+        arrays[name], arrays[name + 'Offsets'] = _encodeText(
+                                                [getattr(p, name) for p in patterns])
+
+    layout = {}
+    position = 0
+    for name in sorted(arrays):
+        array = arrays[name]
+        layout[name] = [array.dtype.str, position, len(array)]
+        position = _aligned(position + array.nbytes)
+    header = json.dumps({'vocabulary': vocabulary,
+                         'labels': labels,
+                         'arrays': layout}).encode('utf-8')
+    dataStart = _aligned(len(_magic) + 8 + len(header))
+
+    with io.open(path, 'wb') as f:
+        f.write(_magic)
+        f.write(struct.pack('<II', _version, len(header)))
+        f.write(header)
+        for name in sorted(arrays):
+            f.seek(dataStart + layout[name][1])
+            f.write(arrays[name].tobytes())
+        f.truncate(dataStart + position)
+
+    _openStores.pop(os.path.abspath(path), None)
+    return openCorpusStore(path)
+
+
+def openCorpusStore(path):
+    '''
+    Returns the CorpusStore at path, reusing this process's map of it if
+    it is already open.
+    '''
+    path = os.path.abspath(path)
+    store = _openStores.get(path)
+    if store is None:
+        store = CorpusStore(path)
+        _openStores[path] = store
+    return store
+
+
+class CorpusStore(object):
+    '''
+    A memory-mapped corpus written by writeCorpusStore.
+
+    >>> import os, tempfile
+    >>> import bali, corpus_store
+    >>> fp = bali.FileParser()
+    >>> path = os.path.join(tempfile.mkdtemp(), 'corpus.bali')
+    >>> store = corpus_store.writeCorpusStore(path, fp)
+    >>> p = store[1]
+    >>> p
+    <corpus_store.StoredPattern Pak Tama Lanang 0 (intro):(_)_ _ e e _ e _ e _ e _ e _ e T _>
+    >>> p.strokes == fp.taught[1].strokes
+    True
+    >>> p.drumType, p.teacher, p.kind
+    ('Lanang', 'Pak Tama', 'taught')
+    >>> p.percentOnBeat('e') == fp.taught[1].percentOnBeat('e')
+    True
+
+    The strokes are views of the map, not copies:
+
+    >>> codes = store.strokeCodes(1)
+    >>> codes.flags.owndata, codes.flags.writeable
+    (False, False)
+    >>> [store.vocabulary[c] for c in codes[:4]]
+    ['_', '_', '_', 'e']
+
+    Patterns can be selected by label:
+
+    >>> len(store.patterns('taught')) == len(fp.taught)
+    True
+    >>> wadon = store.patterns('transcribed', drumType='Wadon')
+    >>> len(wadon) == len([p for p in fp.transcribed if p.drumType == 'Wadon'])
+    True
+
+    Pickling sends the path only, and unpickling in the same process
+    gets back the same map:
+
+    >>> import pickle
+    >>> len(pickle.dumps(store)) < 500
+    True
+    >>> pickle.loads(pickle.dumps(store)) is store
+    True
+    >>> pickle.loads(pickle.dumps(p)).strokes == p.strokes
+    True
+    '''
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._map = numpy.memmap(self.path, dtype=numpy.uint8, mode='r')
+        if self._map[:len(_magic)].tobytes() != _magic:
+            raise bali.BaliException('%s is not a corpus store' % path)
+        version, headerLength = struct.unpack('<II',
+                                              self._map[len(_magic):len(_magic) + 8].tobytes())
+        if version != _version:
+            raise bali.BaliException('%s is version %d of the corpus store format, not %d'
+                                     % (path, version, _version))
+        headerStart = len(_magic) + 8
+        header = json.loads(self._map[headerStart:headerStart + headerLength]
+                            .tobytes().decode('utf-8'))
+        dataStart = _aligned(headerStart + headerLength)
+
+        self.vocabulary = header['vocabulary']
+        self.labels = header['labels']
+        self.arrays = {}
+        for name, (dtype, offset, count) in header['arrays'].items():
+            dtype = numpy.dtype(dtype)
+            start = dataStart + offset
+            self.arrays[name] = self._map[start:start + count * dtype.itemsize].view(dtype)
+
+    def __len__(self):
+        return len(self.arrays['offsets'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pattern index out of range')
+        return StoredPattern(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield StoredPattern(self, i)
+
+    def __reduce__(self):
+        return (openCorpusStore, (self.path,))
+
+    def __deepcopy__(self, memo):
+        return self # read-only, so copies of StoredPatterns share it
+
+    def __repr__(self):
+        return '<corpus_store.CorpusStore %s: %d patterns>' % (self.path, len(self))
+
+    def strokeCodes(self, index):
+        '''
+        Returns the strokes of pattern index as a read-only array of codes
+        into .vocabulary.
+        '''
+        start = self.arrays['offsets'][index]
+        return self.arrays['strokes'][start:start + self.arrays['lengths'][index]]
+
+    def label(self, name, index):
+        '''
+        Returns the label name ('kind', 'drumType', or 'teacher') of pattern index.
+        '''
+        return self.labels[name][self.arrays[name][index]]
+
+    def text(self, name, index):
+        '''
+        Returns the text column name ('title', 'gongPattern', or 'comments')
+        of pattern index.
+        '''
+        offsets = self.arrays[name + 'Offsets']
+        return self.arrays[name][offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def patterns(self, kind=None, drumType=None):
+        '''
+        Returns a list of StoredPatterns, optionally only those of one kind
+        ('taught' or 'transcribed') and/or one drumType.
+        '''
+        mask = numpy.ones(len(self), dtype=bool)
+        for name, value in (('kind', kind), ('drumType', drumType)):
+            if value is None:
+                continue
+            try:
+                code = self.labels[name].index(value)
+            except ValueError:
+                return []
+            mask &= self.arrays[name] == code
+        return [StoredPattern(self, int(i)) for i in numpy.flatnonzero(mask)]
+
+
+class StoredPattern(bali.Pattern):
+    '''
+    A Pattern whose strokes, title, and labels are read from a CorpusStore.
+
+    Setting an attribute (or the strokes) keeps the new value on this object
+    only; the store itself is never written to.
+
+    >>> import os, tempfile
+    >>> import corpus_store
+    >>> path = os.path.join(tempfile.mkdtemp(), 'corpus.bali')
+    >>> store = corpus_store.writeCorpusStore(path)
+    >>> p = store[4]
+    >>> p
+    <corpus_store.StoredPattern Pak Dewa Lanang 10:(_)e e T e _ _ _ _ e e _ e _ e _ _>
+    >>> p.removeSingleStrokes('e')
+    <corpus_store.StoredPattern Pak Dewa Lanang 10:(_)e e T , _ _ _ _ e e _ , _ , _ _>
+    >>> p.strokes[:4]
+    ['_', 'e', 'e', 'T']
+    >>> store[4].shuffleStrokes().strokes.count('e') == p.strokes.count('e')
+    True
+    '''
+    def __init__(self, store, index):
+        self.store = store
+        self.storeIndex = index
+        self.fileParser = None
+        self._overrides = {}
+
+    def _stored(name, readFromStore, doc):
+        def getter(self):
+            if name in self._overrides:
+                return self._overrides[name]
+            return readFromStore(self)
+
+        def setter(self, value):
+            self._overrides[name] = value
+
+        return property(getter, setter, doc=doc)
+
+    title = _stored('title', lambda self: self.store.text('title', self.storeIndex),
+                    'The title of the pattern.')
+    gongPattern = _stored('gongPattern',
+                          lambda self: self.store.text('gongPattern', self.storeIndex),
+                          'The gong line of the pattern.')
+    comments = _stored('comments', lambda self: self.store.text('comments', self.storeIndex),
+                       'Comments on the pattern.')
+    indexInFile = _stored('indexInFile',
+                          lambda self: int(self.store.arrays['indexInFile'][self.storeIndex]),
+                          'The index of the pattern among the taught or transcribed patterns.')
+    drumType = _stored('drumType', lambda self: self.store.label('drumType', self.storeIndex),
+                       "'Lanang', 'Wadon', or 'unknown'.")
+    teacher = _stored('teacher', lambda self: self.store.label('teacher', self.storeIndex),
+                      'The teacher (or, for transcribed patterns, the player).')
+    kind = _stored('kind', lambda self: self.store.label('kind', self.storeIndex),
+                   "'taught' or 'transcribed'.")
+
+    def _getDrumPattern(self):
+        if 'drumPattern' in self._overrides:
+            return self._overrides['drumPattern']
+        strokes = self._storedStrokes()
+        if self.store.arrays['hasPrefix'][self.storeIndex]:
+            return '(' + strokes[0] + ')' + ' '.join(strokes[1:])
+        return ' '.join(strokes)
+
+    def _setDrumPattern(self, drumPattern):
+        self._overrides['drumPattern'] = drumPattern
+
+    drumPattern = property(_getDrumPattern, _setDrumPattern, doc='''
+        The drum line, rebuilt from the stored strokes with single spaces.
+    ''')
+
+    del _stored
+
+    def _storedStrokes(self):
+        vocabulary = self.store.vocabulary
+        return [vocabulary[c] for c in self.store.strokeCodes(self.storeIndex).tolist()]
+
+    def _getStrokes(self):
+        if 'drumPattern' in self._overrides:
+            return super(StoredPattern, self)._getStrokes()
+        return self._storedStrokes()
+
+    strokes = property(_getStrokes, bali.Pattern._setStrokes, doc='''
+        Gets or sets the list of Strokes.
+    ''')
+
+    def copy(self):
+        copied = StoredPattern(self.store, self.storeIndex)
+        copied._overrides = dict(self._overrides)
+        return copied
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+'''
+The hypotheses of taught_questions and taught_statistics written as data
+rather than as functions: which drum, which type of stroke, the transforms
+applied first, the BeatLevel, and whether the strokes are expected on or
+off the beat.  Every Hypothesis is kept in the registry under its name:
+
+    >>> import hypotheses
+    >>> hypotheses.registry['percentOffBeatLanangTGuntang']
+    <hypotheses.Hypothesis percentOffBeatLanangTGuntang: Lanang 'T' off guntang>
+
+A BatchEngine evaluates any number of hypotheses together: the strokes of
+the corpus are put in one pipeline.StrokeBatch, and each distinct chain of
+transforms is run once over it for all the hypotheses that share it.  The
+permutation tests do the same with a batch of many scrambled copies of the
+corpus at a time, so every hypothesis is tested on the same scrambled corpora.
+'''
+from __future__ import print_function, absolute_import, division
+
+import collections
+
+import numpy # @UnresolvedImport
+
+import bali
+import pipeline
+
+
+class Hypothesis(object):
+    '''
+    A hypothesis: in the patterns of drumType, after transforms (a sequence
+    of (method name, arguments) pairs as in pipeline.Plan.fromSteps), the
+    strokes of typeOfStroke land on the beat at beatLevel, or off it if
+    offBeat is True.  beatLevel can be a BeatLevel or its name.
+
+    >>> import bali, hypotheses
+    >>> h = hypotheses.Hypothesis('percentOnBeatWadonDGuntang', 'Wadon', 'D', 'guntang',
+    ...                           transforms=[('removeConsecutiveStrokes', ('Dd',))])
+    >>> h
+    <hypotheses.Hypothesis percentOnBeatWadonDGuntang: Wadon 'D' on guntang
+        after removeConsecutiveStrokes>
+    >>> h.plan
+    <pipeline.Plan removeConsecutiveStrokes('Dd', True, False) |
+        percentOnBeat('D', guntang) beatsInPattern('D')>
+
+    percents() gives the (percent, weight) of every pattern of the drum, as
+    the functions of taught_questions do, and statistic() the weighted
+    percentage of them all:
+
+    >>> fp = bali.FileParser()
+    >>> h.percents(fp.taught)[4]
+    (33.3..., 3)
+    >>> h.statistic(fp.taught)
+    26.0
+
+    spec is the hypothesis as plain data, for writing out or as a key:
+
+    >>> h.spec
+    ('percentOnBeatWadonDGuntang', 'Wadon', 'D', 'guntang', False,
+     (('removeConsecutiveStrokes', ('Dd', True, False)),))
+    '''
+    def __init__(self, name, drumType, typeOfStroke, beatLevel=bali.BeatLevel.double,
+                 offBeat=False, transforms=()):
+        if isinstance(beatLevel, str):
+            beatLevel = bali.BeatLevel[beatLevel]
+        self.name = name
+        self.drumType = drumType
+        self.typeOfStroke = typeOfStroke
+        self.beatLevel = bali.BeatLevel(beatLevel)
+        self.offBeat = offBeat
+        plan = pipeline.Plan.fromSteps(transforms)
+        self.transforms = plan.transforms
+        self.plan = plan.percentOnBeat(typeOfStroke, self.beatLevel).beatsInPattern(typeOfStroke)
+
+    @property
+    def spec(self):
+        return (self.name, self.drumType, self.typeOfStroke, self.beatLevel.name,
+                self.offBeat, self.transforms)
+
+    def __eq__(self, other):
+        if not isinstance(other, Hypothesis):
+            return NotImplemented
+        return self.spec == other.spec
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.spec)
+
+    def __repr__(self):
+        msg = '<hypotheses.Hypothesis %s: %s %r %s %s' % (self.name, self.drumType,
+                                                         self.typeOfStroke,
+                                                         'off' if self.offBeat else 'on',
+                                                         self.beatLevel.name)
+        if self.transforms:
+            msg += ' after ' + ', '.join(name for name, unused_args in self.transforms)
+        return msg + '>'
+
+    def percents(self, patterns):
+        '''
+        Returns a list of (percent, weight) for each pattern of self.drumType,
+        where weight is the number of strokes measured.
+        '''
+        percents = []
+        for p in patterns:
+            if p.drumType != self.drumType:
+                continue
+            percent, weight = self.plan(p)
+            if self.offBeat:
+                percent = 100 - percent
+            percents.append((percent, weight))
+        return percents
+
+    def statistic(self, patterns):
+        '''
+        The weighted percentage of the hypothesis on patterns (nan if none of
+        them has a stroke of typeOfStroke).
+        '''
+        return BatchEngine([self]).evaluate(patterns)[self.name]
+
+
+def distinctPatterns(patterns):
+    '''
+    Returns the first of patterns with each drum and stroke sequence
+    (bali.StrokeSequences) and a numpy array of how many of patterns have it.
+    The scrambled copies of permutation tests cannot be shared this way:
+    every pattern is scrambled on its own.
+
+    >>> import bali, hypotheses
+    >>> fp = bali.FileParser()
+    >>> distinct, multiplicities = hypotheses.distinctPatterns(fp.transcribed)
+    >>> len(distinct) < len(fp.transcribed), int(multiplicities.sum()) == len(fp.transcribed)
+    (True, True)
+    '''
+    byDrum = collections.OrderedDict()
+    for p in patterns:
+        if p.drumType not in byDrum:
+            byDrum[p.drumType] = bali.StrokeSequences()
+        byDrum[p.drumType].add(p)
+    distinct = []
+    multiplicities = []
+    for sequences in byDrum.values():
+        for p, count in sequences:
+            distinct.append(p)
+            multiplicities.append(count)
+    return distinct, numpy.array(multiplicities, dtype=float)
+
+
+def nullBatchSize(numStrokes, strokesPerBatch=2 ** 20):
+    '''
+    How many scrambled copies of a corpus of numStrokes strokes to put in
+    one batch, so that a batch holds about strokesPerBatch strokes.
+
+    >>> import hypotheses
+    >>> hypotheses.nullBatchSize(1071), hypotheses.nullBatchSize(10 ** 7)
+    (979, 1)
+    '''
+    return max(1, strokesPerBatch // max(1, numStrokes))
+
+
+def countExceedances(null, observed, alternative='greater'):
+    '''
+    The number of values in the array null at least as large as observed
+    (at most as large if alternative is 'less').  Values that differ from
+    observed only by rounding count as ties; nan never counts.
+
+    >>> import numpy, hypotheses
+    >>> null = numpy.array([50.0, 0.1 + 0.2, numpy.nan, 10.0])
+    >>> hypotheses.countExceedances(null, 0.3)
+    3
+    >>> hypotheses.countExceedances(null, 0.3, 'less')
+    1
+    '''
+    tolerance = 1e-9 * max(1.0, abs(observed))
+    if alternative == 'greater':
+        return int((null >= observed - tolerance).sum())
+    return int((null <= observed + tolerance).sum())
+
+
+class Registry(object):
+    '''
+    Hypotheses by name, in the order they were registered.
+
+    >>> import hypotheses
+    >>> reg = hypotheses.Registry()
+    >>> h = reg.register(hypotheses.Hypothesis('lanangE', 'Lanang', 'e'))
+    >>> reg.names
+    ['lanangE']
+    >>> 'lanangE' in reg, len(reg)
+    (True, 1)
+    >>> reg.register(hypotheses.Hypothesis('lanangE', 'Lanang', 'T'))
+    Traceback (most recent call last):
+    bali.BaliException: There is already a hypothesis called 'lanangE'
+    >>> reg.select(['wadonO'])
+    Traceback (most recent call last):
+    bali.BaliException: Unknown hypothesis 'wadonO'; use one of lanangE
+    '''
+    def __init__(self):
+        self._byName = collections.OrderedDict()
+
+    def register(self, hypothesis):
+        if hypothesis.name in self._byName:
+            raise bali.BaliException('There is already a hypothesis called %r'
+                                     % hypothesis.name)
+        self._byName[hypothesis.name] = hypothesis
+        return hypothesis
+
+    def __getitem__(self, name):
+        return self._byName[name]
+
+    def __contains__(self, name):
+        return name in self._byName
+
+    def __iter__(self):
+        return iter(self._byName.values())
+
+    def __len__(self):
+        return len(self._byName)
+
+    @property
+    def names(self):
+        return list(self._byName)
+
+    def select(self, names=None):
+        '''
+        Returns the hypotheses with the given names, or all of them if names is None.
+        '''
+        if names is None:
+            return list(self)
+        for name in names:
+            if name not in self._byName:
+                raise bali.BaliException('Unknown hypothesis {0!r}; use one of {1}'.format(
+                                                    name, ', '.join(sorted(self._byName))))
+        return [self._byName[name] for name in names]
+
+
+registry = Registry()
+
+# taught_questions
+registry.register(Hypothesis('percentOnBeatLanangEDouble', 'Lanang', 'e', 'double'))
+registry.register(Hypothesis('percentOnBeatLanangEDoubleSingle', 'Lanang', 'e', 'double',
+                             transforms=[('removeConsecutiveStrokes', ('e', True, True))]))
+registry.register(Hypothesis('percentOffBeatWadonODoubleSingle', 'Wadon', 'o', 'double', True,
+                             transforms=[('removeConsecutiveStrokes', ('o', True, True))]))
+registry.register(Hypothesis('percentOffBeatLanangEGuntangSecondDouble', 'Lanang', 'e',
+                             'guntang', True,
+                             transforms=[('removeSingleStrokes', ('e',)),
+                                         ('removeConsecutiveStrokes', ('e',))]))
+registry.register(Hypothesis('percentOnBeatWadonOGuntangSecondDouble', 'Wadon', 'o',
+                             'guntang',
+                             transforms=[('removeSingleStrokes', ('o',)),
+                                         ('removeConsecutiveStrokes', ('o',))]))
+registry.register(Hypothesis('percentOffBeatLanangTGuntang', 'Lanang', 'T', 'guntang', True))
+registry.register(Hypothesis('percentOnBeatWadonDGuntang', 'Wadon', 'D', 'guntang',
+                             transforms=[('removeConsecutiveStrokes', ('Dd',))]))
+# the miscellaneous tests of taught_statistics
+registry.register(Hypothesis('percentOffBeatLanangTDouble', 'Lanang', 'T', 'double', True))
+registry.register(Hypothesis('percentOnBeatWadonDDouble', 'Wadon', 'D', 'double'))
+
+
+class BatchEngine(object):
+    '''
+    Evaluates many hypotheses (by default every one in the registry) in one
+    pass over a corpus.
+
+    >>> import bali, hypotheses
+    >>> fp = bali.FileParser()
+    >>> engine = hypotheses.BatchEngine()
+    >>> engine
+    <hypotheses.BatchEngine 9 hypotheses, 6 passes>
+    >>> observed = engine.evaluate(fp.taught)
+    >>> round(observed['percentOnBeatLanangEDouble'], 4)
+    56.8702
+    >>> round(observed['percentOffBeatWadonODoubleSingle'], 4)
+    90.7692
+
+    These are the numbers of taught_questions:
+
+    >>> import taught_questions
+    >>> observed['percentOnBeatWadonDGuntang']
+    26.0
+    >>> taught_questions.percentOnBeatWadonDGuntang().weighedTotalPercentage()
+    26.0
+
+    The permutation tests of all of them are run together by
+    permutationTest; see there.
+    '''
+    def __init__(self, hypotheses=None):
+        if hypotheses is None:
+            hypotheses = list(registry)
+        self.hypotheses = list(hypotheses)
+        # one plan for each chain of transforms, measuring everything its
+        # hypotheses need; and for each hypothesis, its plan and columns
+        self._plans = collections.OrderedDict()
+        self._columns = []
+        for h in self.hypotheses:
+            measures = self._plans.setdefault(h.transforms, [])
+            columns = []
+            for measure in h.plan.measures:
+                if measure not in measures:
+                    measures.append(measure)
+                columns.append(measures.index(measure))
+            self._columns.append((h.transforms, columns[0], columns[1]))
+        self._plans = collections.OrderedDict(
+            (transforms, pipeline.Plan(transforms, measures))
+            for transforms, measures in self._plans.items())
+
+    def __repr__(self):
+        return '<hypotheses.BatchEngine %d hypotheses, %d passes>' % (len(self.hypotheses),
+                                                                      len(self._plans))
+
+    def _sums(self, batch, drumTypes, copies=1, multiplicities=1):
+        '''
+        Returns two arrays, the numerators and the denominators (the total
+        weights) of the weighted percentage of each hypothesis (rows) on each
+        of copies consecutive corpora in batch (columns).  drumTypes is the
+        drum of every pattern of one corpus, and multiplicities how many
+        times each pattern counts.
+        '''
+        values = {}
+        for transforms, plan in self._plans.items():
+            values[transforms] = plan.evaluate(batch).reshape(copies, len(drumTypes), -1)
+        num = numpy.empty((len(self.hypotheses), copies))
+        denom = numpy.empty((len(self.hypotheses), copies))
+        for row, (h, (transforms, percentColumn, weightColumn)) in enumerate(
+                                                    zip(self.hypotheses, self._columns)):
+            percent = values[transforms][:, :, percentColumn]
+            weight = values[transforms][:, :, weightColumn]
+            if h.offBeat:
+                percent = 100 - percent
+            use = drumTypes == h.drumType
+            weight = weight * multiplicities
+            num[row] = numpy.where(use, percent * weight, 0.0).sum(axis=1)
+            denom[row] = numpy.where(use, weight, 0.0).sum(axis=1)
+        return num, denom
+
+    def _statistics(self, batch, drumTypes, copies=1, multiplicities=1):
+        num, denom = self._sums(batch, drumTypes, copies, multiplicities)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(denom > 0, num / denom, numpy.nan)
+
+    def evaluate(self, patterns):
+        '''
+        Returns an OrderedDict of the weighted percentage of each hypothesis
+        on patterns, by name.  Patterns of one drum with the same strokes are
+        measured once and weighted by how many of them there are
+        (distinctPatterns).
+        '''
+        patterns, multiplicities = distinctPatterns(patterns)
+        drumTypes = numpy.array([p.drumType for p in patterns], dtype=object)
+        statistics = self._statistics(pipeline.StrokeBatch(patterns), drumTypes,
+                                      multiplicities=multiplicities)
+        return collections.OrderedDict((h.name, float(statistics[i, 0]))
+                                       for i, h in enumerate(self.hypotheses))
+
+    def weights(self, patterns):
+        '''
+        Returns an OrderedDict of the total weight (the number of strokes
+        measured) of each hypothesis on patterns, by name.
+
+        >>> import bali, hypotheses
+        >>> fp = bali.FileParser()
+        >>> hypotheses.BatchEngine().weights(fp.taught)['percentOffBeatLanangTGuntang']
+        111.0
+        '''
+        patterns, multiplicities = distinctPatterns(patterns)
+        drumTypes = numpy.array([p.drumType for p in patterns], dtype=object)
+        unused_num, denom = self._sums(pipeline.StrokeBatch(patterns), drumTypes,
+                                       multiplicities=multiplicities)
+        return collections.OrderedDict((h.name, float(denom[i, 0]))
+                                       for i, h in enumerate(self.hypotheses))
+
+    def nullDistribution(self, patterns, permutations=1000, seed=None, batchSize=None,
+                         batches=None):
+        '''
+        Returns an array of the weighted percentage of each hypothesis
+        (rows) on each of permutations scrambled copies of patterns (columns).
+
+        The copies are made batchSize at a time (by default as many as fit
+        in about a million strokes, see nullBatchSize).  With a seed, batch
+        number k is drawn from its own generator, seeded with (seed, k), so
+        that a range of batches can be computed on its own, in another
+        process, and give the same columns:
+
+        >>> import bali, numpy, hypotheses
+        >>> fp = bali.FileParser()
+        >>> engine = hypotheses.BatchEngine([hypotheses.registry['percentOnBeatWadonDGuntang']])
+        >>> null = engine.nullDistribution(fp.taught, permutations=500, seed=1, batchSize=100)
+        >>> null.shape
+        (1, 500)
+        >>> 20 < float(null.mean()) < 30
+        True
+        >>> first = engine.nullDistribution(fp.taught, 500, 1, 100, batches=range(2))
+        >>> rest = engine.nullDistribution(fp.taught, 500, 1, 100, batches=range(2, 5))
+        >>> first.shape, bool((numpy.hstack([first, rest]) == null).all())
+        ((1, 200), True)
+        '''
+        patterns = list(patterns)
+        drumTypes = numpy.array([p.drumType for p in patterns], dtype=object)
+        batch = pipeline.StrokeBatch(patterns)
+        if batchSize is None:
+            batchSize = nullBatchSize(len(batch))
+        if batches is None:
+            batches = range(-(-permutations // batchSize))
+        if seed is None:
+            randomGenerator = numpy.random.default_rng()
+        columns = [numpy.empty((len(self.hypotheses), 0))]
+        for k in batches:
+            copies = min(batchSize, permutations - k * batchSize)
+            if seed is not None:
+                randomGenerator = numpy.random.default_rng([seed, k])
+            columns.append(self._statistics(batch.shuffled(copies, randomGenerator),
+                                            drumTypes, copies))
+        return numpy.concatenate(columns, axis=1)
+
+    def iterPermutationTest(self, patterns, alpha=0.05, confidence=0.99, alternative='greater',
+                            batchSize=100, maxPermutations=1000000, seed=None):
+        '''
+        The sequential permutation test of
+        taught_statistics.sequentialPermutationTest for every hypothesis at
+        once: each batch of scrambled corpora is made once and measured for
+        all the hypotheses not yet decided, and batches double in size until
+        every hypothesis is decided or maxPermutations is reached.  Yields
+        the name and taught_statistics.SequentialTestResult of each
+        hypothesis as soon as it is decided (the undecided ones last, in
+        order).  The scrambled corpora do not depend on which hypotheses are
+        tested together, so each result is the same as when testing that
+        hypothesis alone with the same seed.
+
+        >>> import bali, hypotheses
+        >>> fp = bali.FileParser()
+        >>> engine = hypotheses.BatchEngine(hypotheses.registry.select(
+        ...              ['percentOnBeatWadonDGuntang', 'percentOffBeatLanangTGuntang']))
+        >>> for name, result in engine.iterPermutationTest(fp.taught, seed=1):
+        ...     print(name, result.permutations)
+        percentOnBeatWadonDGuntang 100
+        percentOffBeatLanangTGuntang 300
+        '''
+        import taught_statistics
+        if alternative not in ('greater', 'less'):
+            raise bali.BaliException("alternative must be 'greater' or 'less'")
+        patterns = list(patterns)
+        drumTypes = numpy.array([p.drumType for p in patterns], dtype=object)
+        batch = pipeline.StrokeBatch(patterns)
+        randomGenerator = numpy.random.default_rng(seed)
+        observed = self._statistics(batch, drumTypes)[:, 0]
+        results = [taught_statistics.SequentialTestResult(float(value), alpha, confidence)
+                   for value in observed]
+        undecided = list(range(len(self.hypotheses)))
+        permutations = 0
+        while undecided and permutations < maxPermutations:
+            copies = min(batchSize, maxPermutations - permutations)
+            engine = BatchEngine([self.hypotheses[i] for i in undecided])
+            null = engine._statistics(batch.shuffled(copies, randomGenerator),
+                                      drumTypes, copies)
+            for row, i in enumerate(undecided):
+                results[i].exceedances += countExceedances(null[row], observed[i], alternative)
+                results[i].permutations += copies
+            permutations += copies
+            for i in undecided:
+                if results[i].significant is not None:
+                    yield self.hypotheses[i].name, results[i]
+            undecided = [i for i in undecided if results[i].significant is None]
+            batchSize *= 2
+        for i in undecided:
+            yield self.hypotheses[i].name, results[i]
+
+    def permutationTest(self, patterns, alpha=0.05, confidence=0.99, alternative='greater',
+                        batchSize=100, maxPermutations=1000000, seed=None):
+        '''
+        Runs iterPermutationTest to the end and returns an OrderedDict of
+        taught_statistics.SequentialTestResult by name, in the order of the
+        hypotheses.
+
+        >>> import bali, hypotheses
+        >>> fp = bali.FileParser()
+        >>> engine = hypotheses.BatchEngine(hypotheses.registry.select(
+        ...              ['percentOffBeatLanangTGuntang', 'percentOnBeatWadonDGuntang']))
+        >>> results = engine.permutationTest(fp.taught, seed=1)
+        >>> results['percentOffBeatLanangTGuntang']
+        <taught_statistics.SequentialTestResult p=0.0033 after 300 permutations: significant>
+        >>> results['percentOnBeatWadonDGuntang'].significant
+        False
+        '''
+        results = dict(self.iterPermutationTest(patterns, alpha, confidence, alternative,
+                                                batchSize, maxPermutations, seed))
+        return collections.OrderedDict((h.name, results[h.name]) for h in self.hypotheses)
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+'''
+Interlocking (composite rhythm) analysis of the sections where the lanang and
+wadon drummers were transcribed together.
+
+All the aligned DualDrummer stroke arrays of a FileParser are stacked into one
+array, so that every metric is computed for every ImprovInGong (or Session) at
+once with numpy rather than by looping over patterns.  Slots where either
+drum was not transcribed (the '`' padding of a DualDrummer) are left out of
+every metric.
+'''
+from __future__ import print_function, absolute_import, division
+
+import collections
+
+import bali
+import numpy # @UnresolvedImport
+
+# strokes that do not make a sound of their own: ghost strokes, nothing, unclear,
+# and the markers left by removeSingleStrokes and removeConsecutiveStrokes
+nonOnsetStrokes = ('_', 'r', 'l', '`', '?', '.', ',')
+
+
+class InterlockAnalyzer(object):
+    '''
+    Holds the aligned strokes of every DualDrummer in a FileParser
+    (except for the stroke before the first beat, as in Pattern.iterateStrokes)
+    and computes interlocking metrics grouped by ImprovInGong or by Session.
+
+    >>> import bali, interlock
+    >>> fp = bali.FileParser()
+    >>> ia = interlock.InterlockAnalyzer(fp)
+    >>> ia.lanang.shape == ia.wadon.shape
+    True
+    >>> ia.lanang[:8]
+    array(['_', 'r', 'e', 'e', 'T', 'e', 'T', 'e'], dtype='<U2')
+    >>> ia.wadon[:8]
+    array(['`', '`', '`', '`', '`', '`', '`', '`'], dtype='<U2')
+    >>> ia.slot[:6]
+    array([1, 2, 3, 4, 5, 6])
+    >>> ia.improvs[0]
+    <bali.ImprovInGong Batel>
+    >>> ia.sessions
+    [<bali.Session Pak Cok and Pak Dewa>, <bali.Session Pak Tama and Pak Buda>]
+    '''
+    def __init__(self, fileParser=None):
+        if fileParser is None:
+            fileParser = bali.FileParser()
+        self.fileParser = fileParser
+        self.improvs = []
+        self.sessions = []
+
+        rows = []
+        slots = []
+        improvIds = []
+        sessionIds = []
+        for dd in fileParser.dualDrummers:
+            if dd.strokeArray is None:
+                continue
+            improv = dd.parentImprovInGong
+            session = improv.parentSubsessionByPlayer.parentSession
+            if not self.improvs or self.improvs[-1] is not improv:
+                self.improvs.append(improv)
+            if not self.sessions or self.sessions[-1] is not session:
+                self.sessions.append(session)
+            strokes = dd.strokeArray[:, 1:]
+            numSlots = strokes.shape[1]
+            rows.append(strokes)
+            slots.append(numpy.arange(1, numSlots + 1))
+            improvIds.append(numpy.full(numSlots, len(self.improvs) - 1))
+            sessionIds.append(numpy.full(numSlots, len(self.sessions) - 1))
+
+        if rows:
+            allStrokes = numpy.concatenate(rows, axis=1)
+        else:
+            allStrokes = numpy.empty((2, 0), dtype='<U2')
+        self.lanang = allStrokes[0]
+        self.wadon = allStrokes[1]
+        self.slot = numpy.concatenate(slots) if slots else numpy.empty(0, dtype=int)
+        self.improvId = (numpy.concatenate(improvIds) if improvIds
+                         else numpy.empty(0, dtype=int))
+        self.sessionId = (numpy.concatenate(sessionIds) if sessionIds
+                          else numpy.empty(0, dtype=int))
+
+        self.lanangOnset = ~numpy.isin(self.lanang, nonOnsetStrokes)
+        self.wadonOnset = ~numpy.isin(self.wadon, nonOnsetStrokes)
+        # slots where both drums were transcribed
+        self.bothTranscribed = (self.lanang != '`') & (self.wadon != '`')
+        self._sums = {} # by -> _groupSums(by)
+
+    def _groups(self, by):
+        if by == 'improv':
+            return self.improvs, self.improvId
+        elif by == 'session':
+            return self.sessions, self.sessionId
+        raise bali.BaliException("by must be 'improv' or 'session'")
+
+    def _percentByGroup(self, groupIds, numerator, denominator, numGroups):
+        '''
+        Sums two boolean masks within each group and returns 100 * num / denom,
+        with nan for groups where the denominator is zero.
+        '''
+        num = numpy.bincount(groupIds, weights=numerator, minlength=numGroups)
+        denom = numpy.bincount(groupIds, weights=denominator, minlength=numGroups)
+        return self._percent(num, denom)
+
+    def _percent(self, num, denom):
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return 100 * num / denom
+
+    def _groupSums(self, by):
+        '''
+        Counts within each group every kind of slot that compositeDensity,
+        fillRate, simultaneousOnBeat and simultaneousRate are ratios of, in
+        one pass over the slots where both drums were transcribed, and
+        returns a dict of arrays (one count per group) by kind.  Cached for
+        each way of grouping.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> sums = ia._groupSums('session')
+        >>> bool((sums['slots'] == sum(sums['slots', j] for j in range(4))).all())
+        True
+        >>> int(sums['slots'].sum()) == int(ia.bothTranscribed.sum())
+        True
+        '''
+        if by in self._sums:
+            return self._sums[by]
+        groups, groupIds = self._groups(by)
+        transcribed = self.bothTranscribed
+        lanangOnset = self.lanangOnset & transcribed
+        wadonOnset = self.wadonOnset & transcribed
+        lanangGaps = transcribed & ~lanangOnset
+        wadonGaps = transcribed & ~wadonOnset
+        both = lanangOnset & wadonOnset
+        subdivision = (self.slot - 1) % 4
+
+        columns = collections.OrderedDict()
+        columns['slots'] = transcribed
+        for j in range(4):
+            columns['slots', j] = transcribed & (subdivision == j)
+            columns['composite', j] = columns['slots', j] & (lanangOnset | wadonOnset)
+        columns['lanangGaps'] = lanangGaps
+        columns['wadonFills'] = lanangGaps & wadonOnset
+        columns['wadonGaps'] = wadonGaps
+        columns['lanangFills'] = wadonGaps & lanangOnset
+        columns['both'] = both
+        for level in bali.BeatLevel:
+            columns['bothOnBeat', int(level)] = both & (self.slot % int(level) == 0)
+
+        counts = numpy.zeros((len(groups), len(columns)))
+        if len(groupIds):
+            numpy.add.at(counts, groupIds, numpy.column_stack(list(columns.values())))
+        sums = dict((key, counts[:, i]) for i, key in enumerate(columns))
+        self._sums[by] = sums
+        return sums
+
+    def compositeDensity(self, by='improv'):
+        '''
+        Returns a dict mapping each ImprovInGong (or Session if by='session')
+        to an array of four percentages: how often at least one of the drums
+        sounds on the first, second, third, and fourth subdivision of the beat.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> density = ia.compositeDensity()
+        >>> density[ia.improvs[0]].round(1)
+        array([80. , 66.9, 92.9, 75.1])
+        >>> density = ia.compositeDensity(by='session')
+        >>> density[ia.sessions[1]].round(1)
+        array([69.2, 74. , 85.9, 60.9])
+        '''
+        groups = self._groups(by)[0]
+        sums = self._groupSums(by)
+        num = numpy.column_stack([sums['composite', j] for j in range(4)])
+        denom = numpy.column_stack([sums['slots', j] for j in range(4)])
+        return dict(zip(groups, self._percent(num, denom).reshape(len(groups), 4)))
+
+    def fillRate(self, by='improv', filler='Wadon'):
+        '''
+        Returns a dict mapping each group to the percentage of slots where
+        one drum is silent that the other drum fills: by default how often
+        the wadon sounds when the lanang does not.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> round(ia.fillRate()[ia.improvs[0]], 1)
+        59.7
+        >>> round(ia.fillRate(filler='Lanang')[ia.improvs[0]], 1)
+        48.6
+        '''
+        groups = self._groups(by)[0]
+        sums = self._groupSums(by)
+        if filler == 'Wadon':
+            fills, gaps = sums['wadonFills'], sums['lanangGaps']
+        elif filler == 'Lanang':
+            fills, gaps = sums['lanangFills'], sums['wadonGaps']
+        else:
+            raise bali.BaliException("filler must be 'Lanang' or 'Wadon'")
+        return dict(zip(groups, self._percent(fills, gaps).tolist()))
+
+    def simultaneousOnBeat(self, beatLevel=bali.BeatLevel.double, by='improv'):
+        '''
+        The two-drum version of Pattern.percentOnBeat: of all the slots where
+        both drums sound at once, returns the percentage that are on the beat
+        at beatLevel, for each group.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> improv = ia.improvs[0]
+        >>> round(ia.simultaneousOnBeat(bali.BeatLevel.pulse)[improv], 1)
+        100.0
+        >>> round(ia.simultaneousOnBeat(bali.BeatLevel.double)[improv], 1)
+        26.1
+        >>> round(ia.simultaneousOnBeat(bali.BeatLevel.guntang)[improv], 1)
+        10.3
+        '''
+        groups = self._groups(by)[0]
+        sums = self._groupSums(by)
+        percents = self._percent(sums['bothOnBeat', int(beatLevel)], sums['both'])
+        return dict(zip(groups, percents.tolist()))
+
+    def simultaneousRate(self, by='improv'):
+        '''
+        Returns the percentage of all slots where both drums sound at once,
+        for each group.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> round(ia.simultaneousRate()[ia.improvs[0]], 1)
+        27.0
+        '''
+        groups = self._groups(by)[0]
+        sums = self._groupSums(by)
+        return dict(zip(groups, self._percent(sums['both'], sums['slots']).tolist()))
+
+    def alternationScore(self, by='improv', lanangStroke='e', wadonStroke='o'):
+        '''
+        Looks only at the slots where both drums are transcribed and either
+        the lanang plays lanangStroke (peng) or the wadon plays wadonStroke
+        (kom), but not both, and returns the percentage of successive such
+        slots that switch drums.  100 means pengs and koms strictly take
+        turns; 0 means they never do.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> round(ia.alternationScore()[ia.improvs[0]], 1)
+        36.9
+        '''
+        groups, groupIds = self._groups(by)
+        isLanang = self.lanang == lanangStroke
+        isWadon = self.wadon == wadonStroke
+        events = numpy.flatnonzero((isLanang ^ isWadon) & self.bothTranscribed)
+        eventIsLanang = isLanang[events]
+        eventGroup = groupIds[events]
+        sameGroup = eventGroup[1:] == eventGroup[:-1]
+        switches = (eventIsLanang[1:] != eventIsLanang[:-1]) & sameGroup
+        percents = self._percentByGroup(eventGroup[1:], switches, sameGroup, len(groups))
+        return dict(zip(groups, percents.tolist()))
+
+    def summary(self, by='improv'):
+        '''
+        Returns a list with one dict of all the interlocking metrics for each
+        group.  The slots are counted once (_groupSums) for all the metrics
+        but alternationScore, which follows the pengs and koms in order.
+
+        >>> import bali, interlock
+        >>> ia = interlock.InterlockAnalyzer(bali.FileParser())
+        >>> summary = ia.summary(by='session')
+        >>> len(summary)
+        2
+        >>> sorted(summary[0].keys())
+        ['alternation', 'compositeDensity', 'fillByLanang', 'fillByWadon', 'group',
+         'simultaneous', 'simultaneousOnBeat']
+        >>> sorted(summary[0]['simultaneousOnBeat'].keys())
+        ['double', 'fourBeat', 'guntang', 'pulse', 'twoBeat']
+        '''
+        groups = self._groups(by)[0]
+        density = self.compositeDensity(by)
+        fillByWadon = self.fillRate(by, 'Wadon')
+        fillByLanang = self.fillRate(by, 'Lanang')
+        simultaneous = self.simultaneousRate(by)
+        onBeat = dict((level.name, self.simultaneousOnBeat(level, by))
+                      for level in bali.BeatLevel)
+        alternation = self.alternationScore(by)
+        summary = []
+        for group in groups:
+            summary.append({'group': group,
+                            'compositeDensity': density[group],
+                            'fillByWadon': fillByWadon[group],
+                            'fillByLanang': fillByLanang[group],
+                            'simultaneous': simultaneous[group],
+                            'simultaneousOnBeat': dict((name, values[group])
+                                                       for name, values in onBeat.items()),
+                            'alternation': alternation[group],
+                            })
+        return summary
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+'''
+Lazy transform-and-measure plans.  A chain such as
+
+    pattern.removeSingleStrokes('o').removeConsecutiveStrokes('o').percentOnBeat('o', guntang)
+
+makes two new Patterns to get one number.  The same chain written as a Plan
+
+    plan = Plan().removeSingleStrokes('o').removeConsecutiveStrokes('o').percentOnBeat('o', guntang)
+
+only records the steps.  Calling plan(pattern) then runs them all in one
+pass over the pattern's stroke masks (Pattern.strokeMasks), and
+plan.evaluate(patterns) runs them over the concatenated strokes of a whole
+list of patterns (a StrokeBatch) with numpy (bali.StrokeRuns); neither makes
+any Pattern.
+Plans never change, so one plan can be kept and run on any corpus or
+batch of scrambled patterns.
+'''
+from __future__ import print_function, absolute_import, division
+
+import numpy # @UnresolvedImport
+
+import bali
+
+transformNames = ('removeSingleStrokes', 'removeConsecutiveStrokes')
+measureNames = ('percentOnBeat', 'beatsInPattern')
+
+
+class Plan(object):
+    '''
+    A sequence of transforms followed by one or more measures.
+
+    >>> import bali, pipeline
+    >>> fp = bali.FileParser()
+    >>> guntang = bali.BeatLevel.guntang
+    >>> plan = pipeline.Plan().removeSingleStrokes('o').removeConsecutiveStrokes('o')
+    >>> plan = plan.percentOnBeat('o', guntang)
+    >>> plan
+    <pipeline.Plan removeSingleStrokes('o') removeConsecutiveStrokes('o', True, False) | percentOnBeat('o', guntang)>
+
+    It gives the same numbers as the chain of Pattern methods:
+
+    >>> pattern = fp.taught[-1]
+    >>> plan(pattern)
+    50.0
+    >>> pattern.removeSingleStrokes('o').removeConsecutiveStrokes('o').percentOnBeat('o', guntang)
+    50.0
+    >>> wadon = [p for p in fp.taught if p.drumType == 'Wadon']
+    >>> values = plan.evaluate(wadon)
+    >>> values.tolist() == [plan(p) for p in wadon]
+    True
+    >>> values.tolist() == [p.removeSingleStrokes('o').removeConsecutiveStrokes('o')
+    ...                      .percentOnBeat('o', guntang) for p in wadon]
+    True
+
+    With more than one measure, calling a plan gives a tuple and evaluate
+    gives one column per measure:
+
+    >>> both = plan.beatsInPattern('o')
+    >>> both(fp.taught[-1])
+    (50.0, 2)
+    >>> both.evaluate(wadon).shape == (len(wadon), 2)
+    True
+
+    The strokes after the transforms, for checking:
+
+    >>> plan.strokes(pattern) == pattern.removeSingleStrokes('o').removeConsecutiveStrokes('o').strokes
+    True
+    '''
+    def __init__(self, transforms=(), measures=()):
+        self.transforms = tuple(transforms)
+        self.measures = tuple(measures)
+
+    @classmethod
+    def fromSteps(cls, steps):
+        '''
+        Makes a plan from a sequence of (method name, arguments) pairs, as in
+        the transforms of a hypotheses.Hypothesis.
+
+        >>> import pipeline
+        >>> pipeline.Plan.fromSteps([('removeConsecutiveStrokes', ('o', True, True)),
+        ...                          ('percentOnBeat', ('o',))])
+        <pipeline.Plan removeConsecutiveStrokes('o', True, True) | percentOnBeat('o', double)>
+        '''
+        plan = cls()
+        for name, args in steps:
+            if name not in transformNames and name not in measureNames:
+                raise bali.BaliException('Cannot plan %r' % name)
+            plan = getattr(plan, name)(*args)
+        return plan
+
+    def __eq__(self, other):
+        if not isinstance(other, Plan):
+            return NotImplemented
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def key(self):
+        return (self.transforms, self.measures)
+
+    def __repr__(self):
+        def show(steps):
+            return ' '.join('%s(%s)' % (name, ', '.join(a.name if isinstance(a, bali.BeatLevel)
+                                                         else repr(a) for a in args))
+                            for name, args in steps)
+        return '<pipeline.Plan %s>' % ' | '.join(x for x in (show(self.transforms),
+                                                              show(self.measures)) if x)
+
+    def _withTransform(self, step):
+        if self.measures:
+            raise bali.BaliException('Transforms must come before measures')
+        return Plan(self.transforms + (step,), self.measures)
+
+    def removeSingleStrokes(self, typeOfStroke='e'):
+        return self._withTransform(('removeSingleStrokes', (typeOfStroke,)))
+
+    def removeConsecutiveStrokes(self, typeOfStroke='e', removeFirst=True, removeSecond=False):
+        return self._withTransform(('removeConsecutiveStrokes',
+                                    (typeOfStroke, removeFirst, removeSecond)))
+
+    def percentOnBeat(self, typeOfStroke='e', beatLevel=bali.BeatLevel.double):
+        return Plan(self.transforms,
+                    self.measures + (('percentOnBeat', (typeOfStroke, bali.BeatLevel(beatLevel))),))
+
+    def beatsInPattern(self, typeOfStroke='e'):
+        return Plan(self.transforms, self.measures + (('beatsInPattern', (typeOfStroke,)),))
+
+    # one pattern, on its stroke masks
+
+    def _transformedMasks(self, pattern):
+        unused_dp, masks, numStrokes = pattern._maskCache()
+        masks = dict(masks)
+        for name, args in self.transforms:
+            typeOfStroke = args[0]
+            members = [s for s in masks if s and s in typeOfStroke]
+            classMask = 0
+            for s in members:
+                classMask |= masks[s]
+            starts = classMask & ~(classMask << 1)
+            ends = classMask & ~(classMask >> 1)
+            single = starts & ends
+            if name == 'removeSingleStrokes':
+                removed, mark = single, ','
+            else:
+                unused, removeFirst, removeSecond = args
+                inRun = classMask & ~single
+                removed = 0
+                if removeFirst is True:
+                    removed |= inRun & ~ends
+                if removeSecond is True:
+                    removed |= inRun & ~starts
+                mark = '.'
+            if removed:
+                for s in members:
+                    masks[s] &= ~removed
+                masks[mark] = masks.get(mark, 0) | removed
+        return masks, numStrokes
+
+    def __call__(self, pattern):
+        '''
+        Runs the plan on one pattern, over its slots 1 to pattern.numSlots
+        as the Pattern methods do.
+        '''
+        numSlots = pattern.numSlots
+        key = (pattern.strokeKey, numSlots, 'Plan', self.key)
+        values = bali.analysisMemo.get(key)
+        if values is None:
+            masks, unused_numStrokes = self._transformedMasks(pattern)
+            window = (2 << numSlots) - 2 # slots 1 to numSlots, as in Pattern.iterateStrokes
+            values = []
+            for name, args in self.measures:
+                mask = masks.get(args[0], 0) & window
+                numberOfStroke = bali.popcount(mask)
+                if name == 'beatsInPattern':
+                    values.append(numberOfStroke if numberOfStroke else 0.0)
+                elif numberOfStroke == 0:
+                    values.append(0.0)
+                else:
+                    onBeat = bali.popcount(mask & bali.beatLevelMask(args[1], numSlots))
+                    values.append((onBeat * 100) / numberOfStroke)
+            values = tuple(values)
+            bali.analysisMemo.put(key, values)
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    def strokes(self, pattern):
+        '''
+        The strokes of pattern after the transforms of the plan.
+        '''
+        masks, numStrokes = self._transformedMasks(pattern)
+        strokes = [''] * numStrokes
+        for stroke, mask in masks.items():
+            while mask:
+                low = mask & -mask
+                strokes[low.bit_length() - 1] = stroke
+                mask ^= low
+        return strokes
+
+    # many patterns, on numpy arrays
+
+    def evaluate(self, patterns):
+        '''
+        Runs the plan on every pattern at once; patterns can be a list of
+        Patterns or a StrokeBatch.  Returns an array with one value per
+        pattern (one row per pattern if there are several measures).
+        '''
+        if not isinstance(patterns, StrokeBatch):
+            patterns = StrokeBatch(patterns)
+        batch = patterns
+        tokens = batch.tokens.copy()
+        for name, args in self.transforms:
+            runs = bali.StrokeRuns.fromTokens(tokens, batch.offsets, args[0])
+            if name == 'removeSingleStrokes':
+                tokens[runs.labels == bali.RunLabel.single] = ','
+            else:
+                unused, removeFirst, removeSecond = args
+                inRun = runs.runLength > 1
+                remove = numpy.zeros(len(tokens), dtype=bool)
+                if removeFirst is True:
+                    remove |= inRun & ~runs.isRunEnd
+                if removeSecond is True:
+                    remove |= inRun & ~runs.isRunStart
+                tokens[remove] = '.'
+
+        numPatterns = batch.numPatterns
+        patternIds = batch.patternIds
+        counted = {} # stroke -> (where it is, how many in each pattern)
+        columns = []
+        for name, args in self.measures:
+            if args[0] not in counted:
+                isStroke = batch.inWindow & (tokens == args[0])
+                counted[args[0]] = (isStroke, numpy.bincount(patternIds[isStroke],
+                                                             minlength=numPatterns))
+            isStroke, numberOfStroke = counted[args[0]]
+            if name == 'beatsInPattern':
+                column = numberOfStroke.astype(float)
+            else:
+                onBeat = numpy.bincount(patternIds[isStroke & batch.onBeat(args[1])],
+                                        minlength=numPatterns)
+                column = numpy.zeros(numPatterns)
+                hasStroke = numberOfStroke > 0
+                column[hasStroke] = (onBeat[hasStroke] * 100) / numberOfStroke[hasStroke]
+            columns.append(column)
+        if len(columns) == 1:
+            return columns[0]
+        return numpy.column_stack(columns)
+
+
+class StrokeBatch(object):
+    '''
+    The strokes of many patterns concatenated into one numpy array, with
+    the pattern and slot of every stroke, so that any number of plans can
+    be evaluated on it without going back to the Patterns.
+
+    >>> import bali, pipeline
+    >>> fp = bali.FileParser()
+    >>> batch = pipeline.StrokeBatch(fp.taught[:3])
+    >>> batch
+    <pipeline.StrokeBatch 3 patterns, 51 strokes>
+    >>> batch.counts.tolist(), batch.offsets.tolist()
+    ([17, 17, 17], [0, 17, 34, 51])
+    >>> batch.patternIds[15:19].tolist(), batch.slot[15:19].tolist()
+    ([0, 0, 1, 1], [15, 16, 0, 1])
+
+    shuffled() gives a batch of scrambled copies of the patterns, the
+    strokes of each copy in a random order, as Pattern.shuffleStrokes does
+    for one pattern:
+
+    >>> import numpy
+    >>> scrambled = batch.shuffled(4, numpy.random.default_rng(1))
+    >>> scrambled
+    <pipeline.StrokeBatch 12 patterns, 204 strokes>
+    >>> sorted(scrambled.strokes(5)) == sorted(fp.taught[2].strokes)
+    True
+    '''
+    def __init__(self, patterns=()):
+        patterns = list(patterns)
+        strokeLists = [p.strokeKey for p in patterns]
+        counts = numpy.array([len(strokes) for strokes in strokeLists], dtype=numpy.int64)
+        numSlots = numpy.array([p.numSlots for p in patterns], dtype=numpy.int64)
+        # the two marks make the array wide enough for the removed strokes
+        tokens = numpy.array([s for strokes in strokeLists for s in strokes] + [',', '.'])
+        self._setArrays(tokens[:int(counts.sum())], counts, numSlots)
+
+    @classmethod
+    def fromArrays(cls, tokens, counts, numSlots=None):
+        '''
+        Makes a batch from the concatenated tokens, the number of strokes
+        of each pattern, and the number of slots measured in each (by
+        default every stroke after the first).
+        '''
+        if numSlots is None:
+            numSlots = numpy.maximum(counts - 1, 0)
+        batch = cls.__new__(cls)
+        batch._setArrays(tokens, counts, numSlots)
+        return batch
+
+    def _setArrays(self, tokens, counts, numSlots):
+        self.tokens = tokens
+        self.counts = counts
+        self.numSlots = numSlots
+        self.offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=self.offsets[1:])
+        self.patternIds = numpy.repeat(numpy.arange(len(counts)), counts)
+        self.slot = numpy.arange(len(tokens)) - numpy.repeat(self.offsets[:-1], counts)
+        self._inWindow = None
+        self._onBeat = {}
+
+    @property
+    def numPatterns(self):
+        return len(self.counts)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        return '<pipeline.StrokeBatch %d patterns, %d strokes>' % (self.numPatterns, len(self))
+
+    @property
+    def inWindow(self):
+        '''
+        True for the strokes that the measures count: slots 1 to the
+        numSlots of their pattern, as in Pattern.iterateStrokes.
+        '''
+        if self._inWindow is None:
+            self._inWindow = (self.slot >= 1) & (self.slot <= numpy.repeat(self.numSlots,
+                                                                           self.counts))
+        return self._inWindow
+
+    def onBeat(self, beatLevel):
+        '''
+        True for the strokes in the window that are on the beat at beatLevel.
+        Kept, like inWindow, for the other plans run on the same batch.
+        '''
+        mask = self._onBeat.get(beatLevel)
+        if mask is None:
+            mask = self._onBeat[beatLevel] = self.inWindow & (self.slot % int(beatLevel) == 0)
+        return mask
+
+    def strokes(self, index):
+        '''
+        The strokes of the pattern at index, as a list.
+        '''
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def shuffled(self, copies=1, randomGenerator=None):
+        '''
+        Returns a batch of copies times the patterns (all of the first copy,
+        then all of the second, ...), with the strokes of each pattern in a
+        random order drawn from randomGenerator, a numpy.random.Generator.
+        All the copies are shuffled by one sort.
+        '''
+        if randomGenerator is None:
+            randomGenerator = numpy.random.default_rng()
+        counts = numpy.tile(self.counts, copies)
+        tokens = numpy.tile(self.tokens, copies)
+        patternIds = numpy.repeat(numpy.arange(len(counts)), counts)
+        # a random key in [0, 1) added to the pattern number keeps every
+        # stroke in its own pattern and orders it randomly within it
+        order = numpy.argsort(patternIds + randomGenerator.random(len(tokens)))
+        return StrokeBatch.fromArrays(tokens[order], counts, numpy.tile(self.numSlots, copies))
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
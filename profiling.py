@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+Opt-in counters for the hot paths of the analyses: reading the files,
+parsing them, Pattern.strokes, the copies made by Pattern.remove*Strokes,
+and the metric loops.  For each one a Profile keeps the number of calls,
+the total wall time, and the number of memory blocks allocated (the change
+in sys.getallocatedblocks(), so memory that is freed again is not counted).
+
+Profiling is off unless it is turned on, either for a whole run by setting
+the environment variable BALI_PROFILE (a report is printed to stderr at exit):
+
+    BALI_PROFILE=1 python taught_statistics.py
+
+or for a block of code with the profile() context manager.  When it is
+off, each hot path costs one extra function call and a test of a global.
+'''
+from __future__ import print_function, absolute_import, division
+
+import atexit
+import contextlib
+import functools
+import os
+import sys
+import time
+
+activeProfile = None # the Profile being recorded into, or None when off
+
+
+class Counter(object):
+    '''
+    Calls, seconds, and allocated blocks of one hot path.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.allocations = 0
+
+    def __repr__(self):
+        return '<profiling.Counter %s: %d calls>' % (self.name, self.calls)
+
+
+class Profile(object):
+    '''
+    The counters of one profiling run, by name of hot path.
+
+    >>> import profiling
+    >>> prof = profiling.Profile()
+    >>> prof.record('strokes', 0.5, 10)
+    >>> prof.record('strokes', 0.25, -2)
+    >>> prof.counters['strokes'].calls, prof.counters['strokes'].seconds
+    (2, 0.75)
+    >>> prof.counters['strokes'].allocations
+    8
+    >>> prof.report()
+    hot path          calls   total s  per call ms  allocated blocks
+    strokes               2     0.750      375.000                 8
+    '''
+    def __init__(self):
+        self.counters = {}
+
+    def record(self, name, seconds, allocations):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = Counter(name)
+        counter.calls += 1
+        counter.seconds += seconds
+        counter.allocations += allocations
+
+    def report(self, file=None):
+        '''
+        Prints one line per hot path, slowest first, to file (default stdout).
+        '''
+        if file is None:
+            file = sys.stdout
+        print('%-16s %6s %9s %12s %17s' % ('hot path', 'calls', 'total s',
+                                           'per call ms', 'allocated blocks'), file=file)
+        for c in sorted(self.counters.values(), key=lambda c: -c.seconds):
+            print('%-16s %6d %9.3f %12.3f %17d' % (c.name, c.calls, c.seconds,
+                                                   1000 * c.seconds / c.calls,
+                                                   c.allocations), file=file)
+
+
+def hotPath(name):
+    '''
+    Decorator that counts every call of the function under name while a
+    Profile is active.  Nested hot paths are each counted in full.
+
+    >>> import profiling
+    >>> @profiling.hotPath('double')
+    ... def double(x):
+    ...     return 2 * x
+    >>> double(2)
+    4
+    >>> with profiling.profile(report=False) as prof:
+    ...     double(3)
+    ...     double(4)
+    6
+    8
+    >>> prof.counters['double'].calls
+    2
+    >>> double(5)
+    10
+    >>> prof.counters['double'].calls
+    2
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **keywords):
+            if activeProfile is None:
+                return function(*args, **keywords)
+            prof = activeProfile
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return function(*args, **keywords)
+            finally:
+                prof.record(name, time.perf_counter() - start,
+                            sys.getallocatedblocks() - blocks)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def timed(name):
+    '''
+    Counts the block of code inside the with statement under name, for hot
+    paths that are not whole functions.
+
+    >>> import profiling
+    >>> with profiling.profile(report=False) as prof:
+    ...     with profiling.timed('sum'):
+    ...         total = sum(range(10))
+    >>> prof.counters['sum'].calls
+    1
+    '''
+    if activeProfile is None:
+        yield
+        return
+    prof = activeProfile
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.record(name, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+
+
+@contextlib.contextmanager
+def profile(report=True, file=None):
+    '''
+    Records the hot paths run inside the with statement into a new Profile,
+    and prints its report at the end if report is True.
+
+    >>> import bali, profiling
+    >>> bali.analysisMemo.clear() # so that the analyses are not already memoized
+    >>> with profiling.profile(report=False) as prof:
+    ...     fp = bali.FileParser()
+    ...     unused = fp.taught[4].removeSingleStrokes('e').percentOnBeat('e')
+    >>> sorted(prof.counters)
+    ['file read', 'parseTaught', 'percentOnBeat', 'remove copy', 'strokes']
+    >>> prof.counters['parseTaught'].calls
+    1
+    '''
+    global activeProfile # pylint: disable=global-statement
+    previous = activeProfile
+    prof = activeProfile = Profile()
+    try:
+        yield prof
+    finally:
+        activeProfile = previous
+        if report:
+            prof.report(file)
+
+
+if os.environ.get('BALI_PROFILE'):
+    activeProfile = Profile()
+    atexit.register(activeProfile.report, sys.stderr)
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+'''
+A reproducible report of every hypothesis in hypotheses.registry on the
+taught and on the transcribed patterns: the observed weighted percentage,
+the total weight (number of strokes measured), quantiles of the
+permutation null distribution, and the p-value.  Run it as
+
+    python -m bali report --permutations 10000 --seed 0 --workers 4 --table
+
+The batches of scrambled corpora are divided among the worker processes.
+Each batch is drawn from its own generator, seeded with the seed and the
+number of the batch (hypotheses.BatchEngine.nullDistribution), so the
+numbers of a hypothesis depend neither on the number of workers nor on
+which other hypotheses are run with it.
+
+Each result is also written to a cache directory, under a key made of the
+hash of the corpus file it was computed on, bali.analysisVersion, the spec
+of the hypothesis, the seed, and the number of permutations, so running the
+report again only computes what has changed, and a change to what the
+analyses measure never brings back old results.
+'''
+from __future__ import print_function, absolute_import, division
+
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
+import json
+import math
+import os
+
+import numpy # @UnresolvedImport
+
+import bali
+import cli
+import hypotheses
+
+kinds = ('taught', 'transcribed')
+defaultQuantiles = (0.05, 0.5, 0.95)
+_cacheFormat = 2 # change when the layout of a cached row changes
+
+
+def corpusHash(fileParser, kind):
+    '''
+    The hash of the taught or the transcribed lines of fileParser.
+
+    >>> import bali, report
+    >>> fp = bali.FileParser()
+    >>> len(report.corpusHash(fp, 'taught'))
+    16
+    >>> report.corpusHash(fp, 'taught') == report.corpusHash(fp, 'transcribed')
+    False
+    '''
+    lines = getattr(fileParser.fileReader, kind)
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()[:16]
+
+
+class ResultCache(object):
+    '''
+    Report rows kept as one JSON file each in directory.
+
+    >>> import os, tempfile, report
+    >>> cache = report.ResultCache(os.path.join(tempfile.mkdtemp(), 'cache'))
+    >>> key = cache.key('0123', ('h', 'Lanang', 'e', 'double', False, ()), 'taught', 1, 100,
+    ...                 (0.5,))
+    >>> cache.get(key) is None
+    True
+    >>> cache.put(key, {'observed': 56.8})
+    >>> cache.get(key)
+    {'observed': 56.8}
+    >>> cache.stats()
+    {'hits': 1, 'misses': 1}
+
+    Results from an earlier version of the analyses are not found:
+
+    >>> import bali
+    >>> bali.analysisVersion -= 1
+    >>> cache.get(cache.key('0123', ('h', 'Lanang', 'e', 'double', False, ()), 'taught', 1,
+    ...                     100, (0.5,))) is None
+    True
+    >>> bali.analysisVersion += 1
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(corpusHash, spec, kind, seed, permutations, quantiles):
+        text = json.dumps([_cacheFormat, bali.analysisVersion, corpusHash, spec, kind, seed,
+                           permutations, list(quantiles)])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        try:
+            with io.open(self._path(key), encoding='utf-8') as f:
+                row = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    def put(self, key, row):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self._path(key)
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with io.open(temporary, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(row, sort_keys=True, default=cli._jsonDefault))
+        os.replace(temporary, path) # never leave half a file under the key
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def _nullJob(corpus, permutations, seed, job):
+    '''
+    Computes the batches start to stop of the null distributions of the
+    hypotheses called names on the patterns of kind (in a worker process or not).
+    '''
+    kind, names, start, stop = job
+    patterns = getattr(cli._parserFor(corpus), kind)
+    engine = hypotheses.BatchEngine(hypotheses.registry.select(names))
+    return engine.nullDistribution(patterns, permutations, seed, batches=range(start, stop))
+
+
+def _row(hypothesis, kind, patterns, observed, weight, null, permutations, seed, quantiles):
+    if math.isnan(observed) or permutations == 0:
+        pValue = float('nan')
+    else:
+        pValue = (hypotheses.countExceedances(null, observed) + 1) / (permutations + 1)
+    finite = null[~numpy.isnan(null)]
+    if len(finite):
+        nullQuantiles = numpy.quantile(finite, quantiles).tolist()
+    else:
+        nullQuantiles = [float('nan')] * len(quantiles)
+    return {'hypothesis': hypothesis.name,
+            'kind': kind,
+            'patterns': sum(1 for p in patterns if p.drumType == hypothesis.drumType),
+            'observed': observed,
+            'weight': weight,
+            'nullQuantiles': nullQuantiles,
+            'pValue': pValue,
+            'permutations': permutations,
+            'seed': seed}
+
+
+def runReport(corpus=None, names=None, kinds=kinds, permutations=1000, seed=0,
+              quantiles=defaultQuantiles, workers=1, cache=None):
+    '''
+    Returns a list of report rows (dicts), one for each hypothesis (by
+    default every one in hypotheses.registry) on each kind of pattern.
+    cache is a ResultCache or the name of its directory; with None
+    nothing is cached.  Results with a seed of None are never cached, since
+    they cannot be reproduced.
+
+    >>> import os, tempfile, report
+    >>> cache = report.ResultCache(tempfile.mkdtemp())
+    >>> rows = report.runReport(names=['percentOffBeatLanangTGuntang'], kinds=['taught'],
+    ...                         permutations=200, seed=1, cache=cache)
+    >>> row = rows[0]
+    >>> row['hypothesis'], row['kind'], row['weight'], row['pValue']
+    ('percentOffBeatLanangTGuntang', 'taught', 111.0, 0.004975...)
+    >>> round(row['observed'], 2), [round(q) for q in row['nullQuantiles']]
+    (97.3, [69, 75, 81])
+
+    The second time, the row comes from the cache:
+
+    >>> rows == report.runReport(names=['percentOffBeatLanangTGuntang'], kinds=['taught'],
+    ...                          permutations=200, seed=1, cache=cache)
+    True
+    >>> cache.stats()
+    {'hits': 1, 'misses': 1}
+    '''
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    if seed is None:
+        cache = None
+    selected = hypotheses.registry.select(names)
+    fp = cli.fileParser(corpus)
+    hashes = dict((kind, corpusHash(fp, kind)) for kind in kinds)
+    rows = {}
+    missing = collections.OrderedDict() # kind -> hypotheses to compute
+    jobs = []
+    for kind in kinds:
+        missing[kind] = []
+        for h in selected:
+            if cache is not None:
+                row = cache.get(cache.key(hashes[kind], h.spec, kind, seed, permutations,
+                                          quantiles))
+                if row is not None:
+                    rows[kind, h.name] = row
+                    continue
+            missing[kind].append(h)
+        if not missing[kind]:
+            continue
+        # the batches of scrambled corpora, divided among the workers
+        numStrokes = sum(len(p.strokeKey) for p in getattr(fp, kind))
+        numBatches = -(-permutations // hypotheses.nullBatchSize(numStrokes))
+        bounds = numpy.linspace(0, numBatches, max(1, min(workers, numBatches)) + 1).astype(int)
+        names = [h.name for h in missing[kind]]
+        jobs.extend((kind, names, int(start), int(stop))
+                    for start, stop in zip(bounds[:-1], bounds[1:]))
+
+    job = functools.partial(_nullJob, corpus, permutations, seed)
+    if workers <= 1 or len(jobs) <= 1:
+        nulls = [job(j) for j in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                        workers, initializer=cli._initWorker, initargs=(corpus,)) as executor:
+            nulls = list(executor.map(job, jobs))
+
+    for kind, computed in missing.items():
+        if not computed:
+            continue
+        patterns = getattr(fp, kind)
+        engine = hypotheses.BatchEngine(computed)
+        observed = engine.evaluate(patterns)
+        weights = engine.weights(patterns)
+        null = numpy.hstack([n for j, n in zip(jobs, nulls) if j[0] == kind])
+        for i, h in enumerate(computed):
+            row = _row(h, kind, patterns, observed[h.name], weights[h.name], null[i],
+                       permutations, seed, quantiles)
+            rows[kind, h.name] = row
+            if cache is not None:
+                cache.put(cache.key(hashes[kind], h.spec, kind, seed, permutations,
+                                    quantiles), row)
+    return [rows[kind, h.name] for kind in kinds for h in selected]
+
+
+def formatReport(rows, quantiles=defaultQuantiles):
+    '''
+    Returns the rows as a table, one line per row.
+
+    >>> import report
+    >>> rows = [{'hypothesis': 'percentOffBeatLanangTGuntang', 'kind': 'taught',
+    ...          'observed': 97.297, 'weight': 111.0, 'nullQuantiles': [66.1, 75.0, 82.5],
+    ...          'pValue': 0.00498, 'permutations': 200}]
+    >>> print(report.formatReport(rows))
+    hypothesis                               kind        observed  weight  null 5%  null 50%  null 95%  p-value  perms
+    percentOffBeatLanangTGuntang             taught         97.30     111    66.10     75.00     82.50   0.0050    200
+    '''
+    quantileNames = ['null %g%%' % (100 * q) for q in quantiles]
+    lines = ['%-40s %-11s %8s %7s %s %8s %6s' % (
+                    'hypothesis', 'kind', 'observed', 'weight',
+                    ' '.join('%8s' % n for n in quantileNames), 'p-value', 'perms')]
+    for row in rows:
+        lines.append('%-40s %-11s %8.2f %7d %s %8.4f %6d' % (
+                    row['hypothesis'], row['kind'], row['observed'], row['weight'],
+                    ' '.join('%8.2f' % v for v in row['nullQuantiles']),
+                    row['pValue'], row['permutations']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+'''
+A small HTTP server (asyncio, standard library only) that keeps one parsed
+corpus in memory and answers queries about it in JSON, run as
+``python -m bali serve --port 8000``.
+
+Queries are GETs, with the options in the query string:
+
+* /motif?strokes=e+e+T&kind=taught&drum=Lanang
+* /metric?name=percentOnBeat&stroke=T&beatLevel=guntang&kind=taught
+* /between?start=61&end=66&drum=Lanang (seconds or mm:ss:cc time stamps)
+* /permute?hypothesis=percentOffBeatLanangTGuntang&seed=1 -- run in a process pool
+* /stats -- cache statistics and the corpus version
+* /reload -- re-read the corpus files (FileParser.reloadTranscribed); a POST,
+  since it changes what the server holds
+
+Every query response is kept in a least-recently-used cache keyed by the
+query and the version of the corpus (a hash of its files), so repeated
+queries are answered without recomputing and reloading a changed corpus
+never serves stale answers.
+'''
+from __future__ import print_function, absolute_import, division
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import json
+import sys
+import urllib.parse
+
+import bali
+import cli
+import hypotheses
+
+
+class ResponseCache(object):
+    '''
+    A least-recently-used cache of at most maxSize responses.
+
+    >>> import server
+    >>> cache = server.ResponseCache(maxSize=2)
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> cache.stats()
+    {'size': 2, 'maxSize': 2, 'hits': 1, 'misses': 1, 'hitRate': 0.5}
+    '''
+    def __init__(self, maxSize=256):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries),
+                'maxSize': self.maxSize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else None}
+
+
+class QueryError(bali.BaliException):
+    pass
+
+
+class CorpusServer(object):
+    '''
+    Holds a parsed corpus and answers queries about it.
+
+    respond() gives the (status, JSON object) for a request without going
+    through a socket:
+
+    >>> import asyncio, server
+    >>> cs = server.CorpusServer()
+    >>> status, body = asyncio.run(cs.respond('GET', '/motif?strokes=e+e+T&kind=taught'))
+    >>> status, body['count'], body['results'][0]
+    (200, 60, {'kind': 'taught', 'index': 2, 'slot': 3, 'beat': 0.75})
+
+    The second time, the answer comes from the cache:
+
+    >>> status, body = asyncio.run(cs.respond('GET', '/motif?kind=taught&strokes=e+e+T'))
+    >>> cs.cache.stats()['hits']
+    1
+
+    >>> asyncio.run(cs.respond('GET', '/metric?name=percentOnBeat&stroke=T'
+    ...                                '&beatLevel=guntang&kind=taught&limit=1'))
+    (200, {'count': 1, 'results': [{'kind': 'taught', 'index': 0, 'percentOnBeat': 0.0}]})
+    >>> asyncio.run(cs.respond('GET', '/between?start=61&end=61.2&drum=Lanang&limit=1'))
+    (200, {'count': 1, 'results': [{'kind': 'transcribed', 'index': 18, 'improv': 'Batel', ...}]})
+    >>> asyncio.run(cs.respond('GET', '/metric?name=nothing'))
+    (400, {'error': "Unknown metric 'nothing'; use one of ..."})
+    >>> asyncio.run(cs.respond('GET', '/nowhere'))
+    (404, {'error': 'No such query: /nowhere'})
+    >>> asyncio.run(cs.respond('GET', '/reload'))
+    (405, {'error': '/reload takes POST'})
+
+    Permutation tests run in a pool of worker processes:
+
+    >>> status, body = asyncio.run(cs.respond('GET',
+    ...                   '/permute?hypothesis=percentOffBeatLanangTGuntang&seed=1'))
+    >>> body['results'][0]['significant'], body['results'][0]['permutations']
+    (True, 300)
+    >>> cs.close()
+    '''
+    def __init__(self, corpus=None, workers=None, cacheSize=256):
+        self.corpus = corpus
+        self.workers = workers
+        self.fileParser = cli.fileParser(corpus)
+        self.fileParser.taught # pylint: disable=pointless-statement
+        self.fileParser.transcribed # pylint: disable=pointless-statement
+        self.version = self._corpusVersion()
+        self.cache = ResponseCache(cacheSize)
+        self._pool = None
+        self.routes = {'/motif': self.motif,
+                       '/metric': self.metric,
+                       '/between': self.between,
+                       '/permute': self.permute,
+                       '/stats': self.stats,
+                       '/reload': self.reload,
+                       }
+        self.postRoutes = frozenset(['/reload'])
+
+    def _corpusVersion(self):
+        reader = self.fileParser.fileReader
+        h = hashlib.sha1()
+        for lines in (reader.taught, reader.transcribed):
+            h.update('\n'.join(lines).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()[:12]
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                                self.workers, initializer=cli._initWorker,
+                                initargs=(self.corpus,))
+        return self._pool
+
+    def close(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    async def respond(self, method, target):
+        '''
+        Returns (HTTP status, JSON-able dict) for one request.
+        '''
+        url = urllib.parse.urlsplit(target)
+        handler = self.routes.get(url.path)
+        if handler is None:
+            return 404, {'error': 'No such query: ' + url.path}
+        methods = ('POST',) if url.path in self.postRoutes else ('GET', 'HEAD')
+        if method not in methods:
+            return 405, {'error': '{0} takes {1}'.format(url.path, ' or '.join(methods))}
+        params = dict(urllib.parse.parse_qsl(url.query))
+        cacheable = url.path not in ('/stats', '/reload')
+        key = (self.version, url.path, tuple(sorted(params.items())))
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return 200, cached
+        try:
+            body = await handler(params)
+        except (bali.BaliException, ValueError, KeyError) as e:
+            return 400, {'error': str(e).strip('"')}
+        if cacheable:
+            self.cache.put(key, body)
+        return 200, body
+
+    @staticmethod
+    def _results(records, params):
+        limit = int(params['limit']) if 'limit' in params else None
+        results = list(r for unused_i, r in zip(range(limit or sys.maxsize), records))
+        return {'count': len(results), 'results': results}
+
+    async def motif(self, params):
+        patterns = cli.selectPatterns(self.fileParser, params.get('kind', 'all'),
+                                      params.get('drum'))
+        motif = bali.strokeVocabulary.tokenize(params['strokes'])
+        return self._results(cli.motifRecords(patterns, motif), params)
+
+    async def metric(self, params):
+        name = params['name']
+        if name not in cli.metrics:
+            raise QueryError('Unknown metric {0!r}; use one of {1}'.format(
+                                            name, ', '.join(sorted(cli.metrics))))
+        options = {'stroke': params.get('stroke', 'e'),
+                   'beatLevel': bali.BeatLevel[params.get('beatLevel', 'double')]}
+        metricArgs = tuple(options[n] for n in cli.metrics[name])
+        patterns = cli.selectPatterns(self.fileParser, params.get('kind', 'all'),
+                                      params.get('drum'))
+
+        def records():
+            for p in patterns:
+                record = cli.patternId(p)
+                record[name] = getattr(p, name)(*metricArgs)
+                yield record
+
+        return json.loads(json.dumps(self._results(records(), params),
+                                     default=cli._jsonDefault))
+
+    async def between(self, params):
+        start = cli._timeArgument(params['start'])
+        end = cli._timeArgument(params['end'])
+        return self._results(cli.betweenRecords(self.fileParser, start, end,
+                                                params.get('drum')), params)
+
+    async def permute(self, params):
+        hypothesis = hypotheses.registry.select([params['hypothesis']])[0]
+        seed = int(params['seed']) if 'seed' in params else None
+        job = functools.partial(cli.permuteJob, self.corpus,
+                                float(params.get('alpha', 0.05)),
+                                int(params.get('maxPermutations', 1000000)),
+                                seed, (hypothesis.name,))
+        loop = asyncio.get_running_loop()
+        return {'results': await loop.run_in_executor(self.pool, job)}
+
+    async def stats(self, params):
+        return {'version': self.version, 'cache': self.cache.stats()}
+
+    async def reload(self, params):
+        '''
+        Re-reads the corpus files.  The worker processes are shut down, so
+        /permute runs on the new corpus from then on.
+
+        >>> import asyncio, server
+        >>> cs = server.CorpusServer()
+        >>> pool = cs.pool
+        >>> status, body = asyncio.run(cs.respond('POST', '/reload'))
+        >>> status, body['added'], body['removed'], body['changed']
+        (200, 0, 0, 0)
+        >>> cs.pool is pool
+        False
+        >>> cs.close()
+        '''
+        # the workers hold the corpus they read when they started, so
+        # start new ones (jobs already running finish in the old ones)
+        self.close(wait=False)
+        self.fileParser.fileReader.clear()
+        changes = self.fileParser.reloadTranscribed()
+        self.fileParser.taughtPatterns = []
+        self.fileParser.taught # pylint: disable=pointless-statement
+        self.version = self._corpusVersion()
+        return {'version': self.version,
+                'added': len(changes.added),
+                'removed': len(changes.removed),
+                'changed': len(changes.changed)}
+
+    async def handleConnection(self, reader, writer):
+        '''
+        Reads one HTTP request from reader and writes the response to writer.
+
+        >>> import asyncio, server
+        >>> cs = server.CorpusServer()
+        >>> async def send(request):
+        ...     reader = asyncio.StreamReader()
+        ...     reader.feed_data(request)
+        ...     reader.feed_eof()
+        ...     writer = FakeWriter()
+        ...     await cs.handleConnection(reader, writer)
+        ...     return b''.join(writer.written).decode('utf-8')
+        >>> class FakeWriter(object):
+        ...     def __init__(self):
+        ...         self.written = []
+        ...     def write(self, data):
+        ...         self.written.append(data)
+        ...     async def drain(self):
+        ...         pass
+        ...     def close(self):
+        ...         pass
+        >>> print(asyncio.run(send(b'garbage\\r\\n\\r\\n')))
+        HTTP/1.1 400 Bad Request
+        Content-Type: application/json; charset=utf-8
+        Content-Length: 29
+        Connection: close
+        <BLANKLINE>
+        {"error": "Bad request line"}
+        '''
+        method = None
+        try:
+            requestLine = (await reader.readline()).decode('latin-1').strip()
+            while (await reader.readline()).strip():
+                pass # headers are not used
+            try:
+                method, target, unused_version = requestLine.split(' ', 2)
+            except ValueError:
+                status, body = 400, {'error': 'Bad request line'}
+            else:
+                status, body = await self.respond(method, target)
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            writer.write(('HTTP/1.1 {0} {1}\r\n'
+                          'Content-Type: application/json; charset=utf-8\r\n'
+                          'Content-Length: {2}\r\n'
+                          'Connection: close\r\n\r\n').format(
+                                status, _reasons.get(status, ''), len(payload)).encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, ready=None):
+        '''
+        Serves requests until cancelled.  If ready is given it is called with
+        the port actually listened on (useful with port=0).
+
+        >>> import asyncio, server
+        >>> cs = server.CorpusServer()
+        >>> async def fetchOnce():
+        ...     started = asyncio.get_running_loop().create_future()
+        ...     task = asyncio.ensure_future(cs.serve(port=0, ready=started.set_result))
+        ...     port = await started
+        ...     reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        ...     writer.write(b'GET /stats HTTP/1.1\\r\\nHost: localhost\\r\\n\\r\\n')
+        ...     response = await reader.read()
+        ...     task.cancel()
+        ...     return response
+        >>> response = asyncio.run(fetchOnce())
+        >>> print(response.decode('utf-8'))
+        HTTP/1.1 200 OK
+        Content-Type: application/json; charset=utf-8
+        Content-Length: ...
+        Connection: close
+        <BLANKLINE>
+        {"version": "...", "cache": {"size": 0, ...}}
+        '''
+        srv = await asyncio.start_server(self.handleConnection, host, port)
+        if ready is not None:
+            ready(srv.sockets[0].getsockname()[1])
+        try:
+            async with srv:
+                await srv.serve_forever()
+        finally:
+            self.close()
+
+
+_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def serve(corpus=None, host='127.0.0.1', port=8000, workers=None, cacheSize=256):
+    '''
+    Loads the corpus and serves it until interrupted.
+    '''
+    cs = CorpusServer(corpus, workers, cacheSize)
+    print('Serving corpus {0} on http://{1}:{2}/'.format(cs.version, host, port),
+          file=sys.stderr)
+    try:
+        asyncio.run(cs.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
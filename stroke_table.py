@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+'''
+A long-form ("one row per stroke") columnar table of every stroke in a
+FileParser, for analysis outside of the Pattern objects (numpy, pandas, R...).
+
+The table is built in one pass: the strokes of all the patterns are
+concatenated once and every per-pattern value (drum type, teacher, section...)
+is spread over its strokes with numpy.repeat.  String columns are stored as
+categorical codes into a sorted array of categories, so that the whole table
+saves to (and loads from) a plain .npz file without pickling.
+'''
+from __future__ import print_function, absolute_import, division
+
+import bali
+import numpy # @UnresolvedImport
+
+# column name -> True if categorical (codes into .categories[name])
+columnNames = (('patternId', False),
+               ('corpus', True),
+               ('strokeIndex', False),
+               ('tick', False),
+               ('beat', False),
+               ('beatLevels', False),
+               ('stroke', True),
+               ('drumType', True),
+               ('teacher', True),
+               ('session', True),
+               ('section', True),
+               ('timestamp', False),
+               )
+
+
+class StrokeTable(object):
+    '''
+    One row per stroke of every taught and transcribed pattern.
+
+    Columns (all numpy arrays of the same length):
+
+    * patternId -- taught patterns are numbered first (by indexInFile), then
+      transcribed patterns continue from there
+    * corpus -- 'taught' or 'transcribed'
+    * strokeIndex -- position in Pattern.strokes (0 is the stroke before the first beat)
+    * tick -- position in sixteenths; for transcribed patterns counted from the
+      start of the ImprovInGong.  A transcribed pattern that continues
+      another starts with the other's last stroke (the (x) before its first
+      beat, on the same tick), so that stroke is only in the table once: the
+      row with strokeIndex 0 is left out for every transcribed pattern but
+      the first of its ImprovInGong
+    * beat -- strokeIndex / 4, as in Pattern.iterateStrokes
+    * beatLevels -- the sum of every BeatLevel the stroke falls on, so that
+      ``beatLevels & bali.BeatLevel.guntang`` selects strokes on a guntang beat
+    * stroke, drumType, teacher, session, section -- categorical; the teacher
+      of a transcribed pattern is its player, the section its ImprovInGong's
+      type of gong
+    * timestamp -- onset in seconds (FileParser.strokeOnsets); nan for taught
+      patterns and for improvisations with too few timestamps
+
+    >>> import bali, stroke_table
+    >>> fp = bali.FileParser()
+    >>> table = stroke_table.StrokeTable(fp)
+    >>> continued = [p for p in fp.transcribed if p.firstTick > 0]
+    >>> len(table) == sum(len(p.strokes) for p in fp.taught + fp.transcribed) - len(continued)
+    True
+    >>> row = table.row(len(fp.taught[0].strokes))
+    >>> row['patternId'], row['corpus'], row['drumType'], row['teacher']
+    (1, 'taught', 'Lanang', 'Pak Tama')
+    >>> table.decode('stroke')[:8].tolist()
+    ['e', '_', 'e', '_', 'e', '_', 'e', '_']
+
+    Beat levels are bit flags:
+
+    >>> table['beatLevels'][:5].tolist()
+    [31, 1, 3, 1, 7]
+    >>> onGuntang = (table['beatLevels'] & bali.BeatLevel.guntang) != 0
+    >>> table['beat'][onGuntang][:4].tolist()
+    [0.0, 1.0, 2.0, 3.0]
+
+    Transcribed strokes carry their time and their place in the improvisation:
+
+    >>> trans = table['patternId'] == len(fp.taught) + 19
+    >>> int(fp.transcribed[19].firstTick)
+    615
+    >>> table['tick'][trans][:3].tolist()
+    [616, 617, 618]
+    >>> [round(t, 2) for t in table['timestamp'][trans][:3].tolist()]
+    [61.08, 61.16, 61.23]
+    >>> table.row(trans.argmax())['section']
+    'Batel'
+
+    so no two strokes of one drum in an improvisation share a tick, except
+    in the four together blocks whose wadon line is longer than the lanang
+    line it is timed by:
+
+    >>> import numpy
+    >>> keys = set()
+    >>> for i in numpy.flatnonzero(table['corpus'] == table.code('corpus', 'transcribed')):
+    ...     p = fp.transcribed[table['patternId'][i] - len(fp.taught)]
+    ...     keys.add((id(p.improvInGong), p.drumType, int(table['tick'][i])))
+    >>> len(table) - sum(len(p.strokes) for p in fp.taught) - len(keys)
+    4
+
+    Selecting with categories goes through the codes:
+
+    >>> isKom = table['stroke'] == table.code('stroke', 'o')
+    >>> int(isKom.sum()) == sum(p.strokes[1:].count('o') for p in continued) + sum(
+    ...     p.strokes.count('o') for p in fp.taught + fp.transcribed if p not in continued)
+    True
+    '''
+    def __init__(self, fileParser=None, columns=None, categories=None):
+        self.columns = {}
+        self.categories = {}
+        if columns is not None:
+            self.columns = dict(columns)
+            self.categories = dict(categories or {})
+            return
+        if fileParser is None:
+            fileParser = bali.FileParser()
+        self._build(fileParser)
+
+    def __len__(self):
+        return len(self.columns['patternId'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return '<stroke_table.StrokeTable %d strokes>' % len(self)
+
+    def _build(self, fileParser):
+        taught = fileParser.taught
+        transcribed = fileParser.transcribed
+        patterns = taught + transcribed
+
+        strokeLists = [p.strokes for p in patterns]
+        counts = numpy.array([len(s) for s in strokeLists], dtype=numpy.int64)
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1])).astype(numpy.int64)
+        total = int(counts.sum())
+
+        def spread(perPattern, dtype=None):
+            return numpy.repeat(numpy.asarray(perPattern, dtype=dtype), counts)
+
+        strokeIndex = numpy.arange(total, dtype=numpy.int64) - numpy.repeat(starts, counts)
+        strokeIndex = strokeIndex.astype(numpy.int32)
+        firstTicks = [0] * len(taught) + [p.firstTick for p in transcribed]
+
+        beatLevels = numpy.zeros(total, dtype=numpy.uint8)
+        for level in bali.BeatLevel:
+            beatLevels[strokeIndex % int(level) == 0] |= int(level)
+
+        timestamp = numpy.full(total, numpy.nan)
+        numTaughtStrokes = int(counts[:len(taught)].sum())
+        onsets = fileParser.strokeOnsets
+        if onsets is not None and len(onsets) == total - numTaughtStrokes:
+            timestamp[numTaughtStrokes:] = onsets
+
+        sessions = []
+        sections = []
+        for p in transcribed:
+            improv = p.improvInGong
+            if improv is None:
+                sessions.append('')
+                sections.append('')
+                continue
+            sections.append(improv.typeOfGong)
+            try:
+                sessions.append(improv.parentSubsessionByPlayer.parentSession.nameOfPlayers)
+            except AttributeError:
+                sessions.append('')
+
+        self.columns['patternId'] = spread(numpy.arange(len(patterns)), numpy.int32)
+        self.columns['strokeIndex'] = strokeIndex
+        self.columns['tick'] = (spread(firstTicks, numpy.int64) + strokeIndex).astype(numpy.int32)
+        self.columns['beat'] = strokeIndex * 0.25
+        self.columns['beatLevels'] = beatLevels
+        self.columns['timestamp'] = timestamp
+
+        self._addCategorical('corpus',
+                             spread(['taught'] * len(taught) + ['transcribed'] * len(transcribed)))
+        self._addCategorical('stroke',
+                             numpy.array([s for strokes in strokeLists for s in strokes]))
+        self._addCategorical('drumType', spread([p.drumType for p in patterns]))
+        self._addCategorical('teacher', spread([p.teacher or '' for p in taught]
+                                               + [p.player for p in transcribed]))
+        self._addCategorical('session', spread([''] * len(taught) + sessions))
+        self._addCategorical('section', spread([''] * len(taught) + sections))
+
+        # the (x) of a pattern that continues another is that one's last stroke
+        continues = spread([False] * len(taught) + [p.firstTick > 0 for p in transcribed], bool)
+        keep = ~(continues & (strokeIndex == 0))
+        for name in self.columns:
+            self.columns[name] = self.columns[name][keep]
+
+    def _addCategorical(self, name, values):
+        categories, codes = numpy.unique(values, return_inverse=True)
+        self.categories[name] = categories
+        self.columns[name] = codes.astype(numpy.int16)
+
+    def code(self, name, value):
+        '''
+        Returns the integer code of value in the categorical column name,
+        or -1 (which matches no row) if value never occurs.
+
+        >>> import stroke_table
+        >>> table = stroke_table.StrokeTable()
+        >>> table.code('drumType', 'Wadon') >= 0
+        True
+        >>> table.code('drumType', 'Kendang')
+        -1
+        '''
+        categories = self.categories[name]
+        i = int(numpy.searchsorted(categories, value))
+        if i < len(categories) and categories[i] == value:
+            return i
+        return -1
+
+    def decode(self, name):
+        '''
+        Returns the column name with categorical codes replaced by their values.
+        '''
+        if name in self.categories:
+            return self.categories[name][self.columns[name]]
+        return self.columns[name]
+
+    def row(self, index):
+        '''
+        Returns a dict of one row, with categorical values decoded.
+        '''
+        row = {}
+        for name, isCategorical in columnNames:
+            value = self.columns[name][index]
+            if isCategorical:
+                value = self.categories[name][value]
+            row[name] = value.item()
+        return row
+
+    def save(self, path):
+        '''
+        Saves the table as an uncompressed .npz file: one array per column,
+        plus 'categories_<name>' for every categorical column.
+
+        >>> import os, tempfile, stroke_table
+        >>> table = stroke_table.StrokeTable()
+        >>> path = os.path.join(tempfile.mkdtemp(), 'strokes.npz')
+        >>> table.save(path)
+        >>> loaded = stroke_table.StrokeTable.load(path)
+        >>> len(loaded) == len(table)
+        True
+        >>> bool((loaded.decode('teacher') == table.decode('teacher')).all())
+        True
+        '''
+        arrays = dict(self.columns)
+        for name, categories in self.categories.items():
+            arrays['categories_' + name] = categories
+        numpy.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads a table saved with save().
+        '''
+        columns = {}
+        categories = {}
+        with numpy.load(path, allow_pickle=False) as data:
+            for key in data.files:
+                if key.startswith('categories_'):
+                    categories[key[len('categories_'):]] = data[key]
+                else:
+                    columns[key] = data[key]
+        return cls(columns=columns, categories=categories)
+
+    def toDataFrame(self):
+        '''
+        Returns the table as a pandas DataFrame with categorical columns as
+        pandas Categoricals.  Requires pandas.
+        '''
+        import pandas # @UnresolvedImport
+        data = {}
+        for name, isCategorical in columnNames:
+            if isCategorical:
+                data[name] = pandas.Categorical.from_codes(self.columns[name],
+                                                           self.categories[name])
+            else:
+                data[name] = self.columns[name]
+        return pandas.DataFrame(data, columns=[name for name, unused in columnNames])
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
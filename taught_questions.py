@@ -4,6 +4,7 @@ from __future__ import print_function, absolute_import, division
 
 #from pprint import pprint as print
 import bali, itertools
+import hypotheses
 fp = bali.FileParser()
 
 class PercentList(list):
@@ -58,13 +59,8 @@ def percentOnBeatLanangEDouble():
     >>> percentList.weighedTotalPercentage()
     56.8...
     '''
-    lanangPatterns = fp.separatePatternsByDrum()[0]
-    percents = PercentList()
-    for pattern in lanangPatterns:
-        percent = pattern.percentOnBeat('e')
-        weight = pattern.beatsInPattern('e')
-        percents.append((percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOnBeatLanangEDouble']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 '''
@@ -91,14 +87,8 @@ def percentOnBeatLanangEDoubleSingle():
     >>> percentList.denom()
     96.0
     '''
-    lanangPatterns = fp.separatePatternsByDrum()[0]
-    percents = PercentList()
-    for pattern in lanangPatterns:
-        pattern = pattern.removeConsecutiveStrokes('e', True, True)
-        percent = pattern.percentOnBeat('e', bali.BeatLevel.double)
-        weight = pattern.beatsInPattern('e')
-        percents.append((percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOnBeatLanangEDoubleSingle']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 def percentOffBeatWadonODoubleSingle():
@@ -123,14 +113,8 @@ def percentOffBeatWadonODoubleSingle():
     65
 
     '''
-    wadonPatterns = fp.separatePatternsByDrum()[1]
-    percents = PercentList()
-    for pattern in wadonPatterns:
-        pattern = pattern.removeConsecutiveStrokes('o', True, True)
-        percent = pattern.percentOnBeat('o', bali.BeatLevel.double)
-        weight = pattern.beatsInPattern('o')
-        percents.append((100 - percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOffBeatWadonODoubleSingle']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 '''
@@ -155,15 +139,8 @@ def percentOffBeatLanangEGuntangSecondDouble():
     >>> percentList.denom()
     83.0
     '''
-    lanangPatterns = fp.separatePatternsByDrum()[0]
-    percents = PercentList()
-    for pattern in lanangPatterns:
-        pattern = pattern.removeSingleStrokes('e')
-        pattern = pattern.removeConsecutiveStrokes('e')
-        percent = pattern.percentOnBeat('e', bali.BeatLevel.guntang)
-        weight = pattern.beatsInPattern('e')
-        percents.append((100 - percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOffBeatLanangEGuntangSecondDouble']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 def percentOnBeatWadonOGuntangSecondDouble():
@@ -183,15 +160,8 @@ def percentOnBeatWadonOGuntangSecondDouble():
     >>> percentList.denom()
     29.0
     '''
-    wadonPatterns = fp.separatePatternsByDrum()[1]
-    percents = PercentList()
-    for pattern in wadonPatterns:
-        pattern = pattern.removeSingleStrokes('o')
-        pattern = pattern.removeConsecutiveStrokes('o')
-        percent = pattern.percentOnBeat('o', bali.BeatLevel.guntang)
-        weight = pattern.beatsInPattern('o')
-        percents.append((percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOnBeatWadonOGuntangSecondDouble']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 '''
@@ -222,13 +192,8 @@ def percentOffBeatLanangTGuntang():
     >>> percentList.denom()
     111.0
     '''
-    lanangPatterns = fp.separatePatternsByDrum()[0]
-    percents = PercentList()
-    for pattern in lanangPatterns:
-        percent = pattern.percentOnBeat('T', bali.BeatLevel.guntang)
-        weight = pattern.beatsInPattern('T')
-        percents.append((100 - percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOffBeatLanangTGuntang']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 def percentOnBeatWadonDGuntang():
@@ -253,15 +218,8 @@ def percentOnBeatWadonDGuntang():
     
     Great confirmation of a null hypothesis: 25%
     '''
-    
-    wadonPatterns = fp.separatePatternsByDrum()[1]
-    percents = PercentList()
-    for pattern in wadonPatterns:
-        pattern = pattern.removeConsecutiveStrokes('Dd')
-        percent = pattern.percentOnBeat('D', bali.BeatLevel.guntang)
-        weight = pattern.beatsInPattern('D')
-        percents.append((percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOnBeatWadonDGuntang']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 def whenLanangOffTList(beatDivision='first'):
@@ -3,7 +3,11 @@
 from __future__ import print_function, absolute_import, division
 
 #from pprint import pprint as print
-import bali, itertools
+import bali, itertools, math, random
+import numpy # @UnresolvedImport
+import hypotheses
+import pipeline
+import profiling
 fp = bali.FileParser()
 
 class PercentList(list):
@@ -95,126 +99,292 @@ def createRandomPatterns(numberOfPatterns):
     return randomPatternsList
         
 '''
-Testing all the above theories with scrambled patterns
+Sequential Monte Carlo testing: rather than a fixed number of scrambled patterns,
+keep drawing batches of scrambled corpora until the p-value is clearly above or
+below alpha.
 '''
 
-'''
-What percentage of Lanang is on the beat with nothing changed? With scrambled strokes?
-'''
-
-def percentOnBeatLanangEDoubleScrambled():
+@profiling.hotPath('metric loop')
+def weighedPercentOnBeat(patterns, drumType='Lanang', typeOfStroke='e',
+                         beatLevel=bali.BeatLevel.double, offBeat=False, transform=None):
     '''
-    Returns a PercentList for a lanang peng for every pattern, at beat level double
-    
-    With scrambled strokes
+    Returns the weighed total percentage of typeOfStroke that lands on the beat
+    (or off the beat if offBeat is True) in all patterns of the given drumType.
+    This is the number the functions in taught_questions compute, but for
+    any list of patterns, so it can be used as the statistic of
+    sequentialPermutationTest.
     
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
+    If transform is given it is called on each pattern before measuring it.
+    Patterns with the same strokes are measured once and weighted by how
+    many of them there are (bali.StrokeSequences).
     
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOnBeatLanangEDoubleScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOnBeatLanangEDoubleScrambled()[1]
-    >>> percentList.weighedTotalPercentage() < 58.6
-    True
-    
-    >>> len(beatTheory) < 40
-    True 
-    
-    a bad threshold
-  
+    >>> import bali, taught_statistics
+    >>> fp = bali.FileParser()
+    >>> taught_statistics.weighedPercentOnBeat(fp.taught, 'Lanang', 'e')
+    56.8...
+    >>> taught_statistics.weighedPercentOnBeat(fp.taught, 'Lanang', 'T',
+    ...                                        bali.BeatLevel.guntang, offBeat=True)
+    97.2...
+    >>> taught_statistics.weighedPercentOnBeat(fp.taught, 'Wadon', 'o', offBeat=True,
+    ...     transform=lambda p: p.removeConsecutiveStrokes('o', True, True))
+    90.7...
     '''
-    randomPatterns = createRandomPatterns(100)
     percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Lanang':
-            percent = pattern.percentOnBeat('e')
-            weight = pattern.beatsInPattern('e')
-            if percent >= 58.6:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((percent, weight))
-    return (percents, beatTheory)
-
+    sequences = bali.StrokeSequences(p for p in patterns if p.drumType == drumType)
+    for pattern, count in sequences:
+        if transform is not None:
+            pattern = transform(pattern)
+        percent = pattern.percentOnBeat(typeOfStroke, beatLevel)
+        weight = pattern.beatsInPattern(typeOfStroke)
+        if offBeat:
+            percent = 100 - percent
+        percents.append((percent, weight * count))
+    return percents.weighedTotalPercentage()
+
+
+class SequentialTestResult(object):
+    '''
+    The running result of a sequentialPermutationTest: how many scrambled
+    corpora were drawn and how many of them were at least as extreme as
+    the observed value.
+    
+    >>> import taught_statistics
+    >>> result = taught_statistics.SequentialTestResult(75.0, alpha=0.05)
+    >>> result.permutations = 300
+    >>> result.exceedances = 0
+    >>> result.pValue
+    0.0033...
+    >>> [round(x, 4) for x in result.confidenceInterval()]
+    [0.0, 0.0216]
+    >>> result.significant
+    True
+    >>> result
+    <taught_statistics.SequentialTestResult p=0.0033 after 300 permutations: significant>
 
-'''
-Testing that peng strokes occur on the beat in lanang and kom strokes occur off
-the beat in wadon, after removing all double strokes. With scrambled patterns.
-'''
+    >>> result.exceedances = 15
+    >>> result.significant is None
+    True
+    '''
+    def __init__(self, observed, alpha=0.05, confidence=0.99):
+        self.observed = observed
+        self.alpha = alpha
+        self.confidence = confidence
+        self.permutations = 0
+        self.exceedances = 0
+
+    @property
+    def pValue(self):
+        '''
+        The Monte Carlo p-value, (exceedances + 1) / (permutations + 1),
+        which never reports an impossible p of zero.
+        '''
+        return (self.exceedances + 1) / (self.permutations + 1)
 
-def percentOnBeatLanangEDoubleSingleScrambled():
+    def confidenceInterval(self):
+        '''
+        Returns the Wilson score interval (low, high) at self.confidence for
+        the true proportion of scrambled corpora at least as extreme as observed.
+        '''
+        n = self.permutations
+        if n == 0:
+            return (0.0, 1.0)
+        z = _normalQuantile(0.5 + self.confidence / 2)
+        pHat = self.exceedances / n
+        center = (pHat + z * z / (2 * n)) / (1 + z * z / n)
+        halfWidth = (z * math.sqrt(pHat * (1 - pHat) / n + z * z / (4 * n * n))
+                     / (1 + z * z / n))
+        return (max(0.0, center - halfWidth), min(1.0, center + halfWidth))
+
+    @property
+    def significant(self):
+        '''
+        True if the whole confidence interval is below alpha, False if it is
+        entirely above alpha, and None if no decision can be made yet.
+        '''
+        low, high = self.confidenceInterval()
+        if high < self.alpha:
+            return True
+        elif low > self.alpha:
+            return False
+        else:
+            return None
+
+    def __repr__(self):
+        decision = {True: 'significant', False: 'not significant', None: 'undecided'}
+        return '<{0}.{1} p={2:.4f} after {3} permutations: {4}>'.format(
+                    self.__module__, self.__class__.__name__, self.pValue,
+                    self.permutations, decision[self.significant])
+
+
+def _normalQuantile(p):
     '''
-    Returns PercentList for on-beats for peng strokes for all lanang patterns, 
-    at beat level double
+    Inverse of the standard normal cumulative distribution, by bisection on math.erf.
     
-    Only looks at single strokes
+    >>> import taught_statistics
+    >>> round(taught_statistics._normalQuantile(0.995), 3)
+    2.576
+    '''
+    low, high = -10.0, 10.0
+    for unused_i in range(100):
+        mid = (low + high) / 2
+        if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def sequentialPermutationTest(statistic, patterns=None, alpha=0.05, confidence=0.99,
+                              alternative='greater', batchSize=100, maxPermutations=1000000,
+                              seed=None):
+    '''
+    Tests whether statistic(patterns) is significantly larger (or smaller if
+    alternative is 'less') than the same statistic on corpora whose patterns
+    have had their strokes scrambled.
     
-    With scrambled strokes. 
+    Scrambled corpora are drawn in batches; after each batch the confidence
+    interval of the p-value is checked against alpha and the test stops as
+    soon as it is clearly on one side.  Each batch is twice as big as the
+    one before, so clear-cut hypotheses stop after a few hundred permutations
+    while borderline ones continue up to maxPermutations.
     
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
+    Returns a SequentialTestResult; its .permutations attribute tells how
+    many scrambled corpora were used.
     
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOnBeatLanangEDoubleSingleScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOnBeatLanangEDoubleSingleScrambled()[1]
+    Lanang tuts are off the beat at the guntang level far more than chance:
     
-    Want the weighed average to be less than 68.7%, which was the threshold without scrambled
-    patterns
-    >>> percentList.weighedTotalPercentage() < 68.7
+    >>> import bali, functools, taught_statistics
+    >>> fp = bali.FileParser()
+    >>> lanangPatterns = fp.separatePatternsByDrum()[0]
+    >>> offBeatT = functools.partial(taught_statistics.weighedPercentOnBeat,
+    ...                              drumType='Lanang', typeOfStroke='T',
+    ...                              beatLevel=bali.BeatLevel.guntang, offBeat=True)
+    >>> result = taught_statistics.sequentialPermutationTest(offBeatT, lanangPatterns, seed=1)
+    >>> result.significant
     True
- 
-    >>> len(beatTheory) < 25
+    >>> result.permutations
+    300
+    >>> result.observed
+    97.2...
+    
+    Wadon dags, on the other hand, are not on the beat at the guntang level
+    more often than chance, and the test soon says so:
+    
+    >>> onBeatD = functools.partial(taught_statistics.weighedPercentOnBeat,
+    ...                             drumType='Wadon', typeOfStroke='D',
+    ...                             beatLevel=bali.BeatLevel.guntang)
+    >>> wadonPatterns = fp.separatePatternsByDrum()[1]
+    >>> result = taught_statistics.sequentialPermutationTest(onBeatD, wadonPatterns, seed=1)
+    >>> result.significant
+    False
+    >>> result.permutations < 1000
     True
-    
-    #bad threshold
     '''
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Lanang':
-            pattern = pattern.removeConsecutiveStrokes('e', True, True)
-            percent = pattern.percentOnBeat('e', bali.BeatLevel.double)
-            weight = pattern.beatsInPattern('e')
-            if percent >= 68.7:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((percent, weight)) 
-    return (percents, beatTheory)
+    if patterns is None:
+        patterns = fp.taught
+    if alternative not in ('greater', 'less'):
+        raise bali.BaliException("alternative must be 'greater' or 'less'")
+    randomGenerator = random.Random(seed)
+    result = SequentialTestResult(statistic(patterns), alpha, confidence)
+    while result.permutations < maxPermutations:
+        thisBatch = min(batchSize, maxPermutations - result.permutations)
+        for unused_i in range(thisBatch):
+            scrambled = [p.shuffleStrokes(randomGenerator) for p in patterns]
+            nullValue = statistic(scrambled)
+            if alternative == 'greater' and nullValue >= result.observed:
+                result.exceedances += 1
+            elif alternative == 'less' and nullValue <= result.observed:
+                result.exceedances += 1
+        result.permutations += thisBatch
+        if result.significant is not None:
+            break
+        batchSize *= 2
+    return result
 
 
-def percentOffBeatWadonODoubleSingleScrambled():
-    '''
-    Returns PercentList for off-beats for kom strokes for all wadon patterns, 
-    at beat level double
-    
-    Only looks at single strokes
-    
-    With scrambled strokes
-    
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
+'''
+Testing all the above theories with scrambled patterns.  Each function gives
+the statistic of one of the hypotheses in hypotheses.registry on many
+scrambled copies of the taught patterns (hypotheses.BatchEngine.nullDistribution),
+to compare with the same statistic on the patterns as they were taught
+(taught_questions).  The copies are drawn from seed, so the same seed
+always gives the same numbers.
+'''
 
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOffBeatWadonODoubleSingleScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOffBeatWadonODoubleSingleScrambled()[1]
-    
-    Want weighed average to be less than 90.7%, which is the threshold without scrambled patterns
-    >>> percentList.weighedTotalPercentage() < 90.7
+def scrambledNull(name, permutations=100, seed=0, patterns=None):
+    '''
+    Returns a numpy array of the statistic of the hypothesis called name in
+    hypotheses.registry on each of permutations scrambled copies of patterns
+    (by default the taught patterns).
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.scrambledNull('percentOffBeatLanangTGuntang', 10, seed=1)
+    >>> null.shape
+    (10,)
+    >>> bool((null == taught_statistics.scrambledNull('percentOffBeatLanangTGuntang', 10,
+    ...                                                 seed=1)).all())
     True
+    '''
+    if patterns is None:
+        patterns = fp.taught
+    engine = hypotheses.BatchEngine([hypotheses.registry[name]])
+    return engine.nullDistribution(patterns, permutations, seed)[0]
 
-    >>> len(beatTheory) < 10
-    True
-    
-    pretty good
+'''
+What percentage of Lanang is on the beat with nothing changed? With scrambled strokes?
+'''
+
+def percentOnBeatLanangEDoubleScrambled(permutations=100, seed=0):
     '''
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Wadon':
-            pattern = pattern.removeConsecutiveStrokes('o', True, True)
-            percent = pattern.percentOnBeat('o', bali.BeatLevel.double)
-            weight = pattern.beatsInPattern('o')
-            if percent < 9.3:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((100 - percent, weight))
-    return (percents, beatTheory)
+    Returns the weighed percentage of lanang pengs on the beat at beat level
+    double in each of permutations scrambled copies of the taught patterns.
+
+    Only one in a hundred scrambled corpora is as much on the beat as the
+    taught patterns (56.8%):
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOnBeatLanangEDoubleScrambled()
+    >>> len(null), round(float(null.mean()), 1)
+    (100, 50.3)
+    >>> int((null >= 56.8).sum())
+    1
+    '''
+    return scrambledNull('percentOnBeatLanangEDouble', permutations, seed)
+
+
+'''
+Testing that peng strokes occur on the beat in lanang and kom strokes occur off
+the beat in wadon, after removing all double strokes. With scrambled patterns.
+'''
+
+def percentOnBeatLanangEDoubleSingleScrambled(permutations=100, seed=0):
+    '''
+    Returns the weighed percentage of single lanang pengs on the beat at
+    beat level double in each of permutations scrambled copies of the taught
+    patterns.
+
+    No scrambled corpus comes near the 68.7% of the taught patterns:
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOnBeatLanangEDoubleSingleScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 68.7).sum())
+    (52.5, 0)
+    '''
+    return scrambledNull('percentOnBeatLanangEDoubleSingle', permutations, seed)
+
+
+def percentOffBeatWadonODoubleSingleScrambled(permutations=100, seed=0):
+    '''
+    Returns the weighed percentage of single wadon koms off the beat at beat
+    level double in each of permutations scrambled copies of the taught
+    patterns.
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOffBeatWadonODoubleSingleScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 90.7).sum())
+    (49.0, 0)
+    '''
+    return scrambledNull('percentOffBeatWadonODoubleSingle', permutations, seed)
 
 
 '''
@@ -222,82 +392,35 @@ Testing that lanang peng strokes are off the beat and wadon kom strokes are on t
 beat when single and the first of all double strokes are removed, at beat level guntang
 '''
 
-def percentOffBeatLanangEGuntangSecondDoubleScrambled():
+def percentOffBeatLanangEGuntangSecondDoubleScrambled(permutations=100, seed=0):
     '''
-    Returns PercentList for off-beats for a peng for all lanang patterns, at beat level guntang,
-    after removing single strokes and then first of consecutive strokes
-    
-    With scrambled strokes
-    
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
-    
-    This produced a lot of scrambled patterns that beat the theory because they had very few peng
-    strokes left after removing single and first of consecutive strokes
-    
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOffBeatLanangEGuntangSecondDoubleScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOffBeatLanangEGuntangSecondDoubleScrambled()[1]
-    
-    Want weighed average to be less than 75.9%, which is the average without scrambled patterns
-    >>> percentList.weighedTotalPercentage() < 75.9
-    True
-    
-    >>> len(beatTheory) < 20
-    True
+    Returns the weighed percentage of lanang pengs off the beat at beat level
+    guntang, after removing single strokes and then the first of consecutive
+    strokes, in each of permutations scrambled copies of the taught patterns.
+
+    Few pengs are left after removing all those strokes, so scrambled
+    corpora often do as well as the taught patterns (75.9%):
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOffBeatLanangEGuntangSecondDoubleScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 75.9).sum())
+    (72.1, 26)
     '''
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Lanang':
-            pattern = pattern.removeSingleStrokes('e')
-            pattern = pattern.removeConsecutiveStrokes('e')
-            percent = pattern.percentOnBeat('e', bali.BeatLevel.guntang)
-            weight = pattern.beatsInPattern('e')
-            if percent > 75.9:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((100 - percent, weight))
-    return (percents, beatTheory)
+    return scrambledNull('percentOffBeatLanangEGuntangSecondDouble', permutations, seed)
 
 
-def percentOnBeatWadonOGuntangSecondDoubleScrambled():
+def percentOnBeatWadonOGuntangSecondDoubleScrambled(permutations=100, seed=0):
     '''
-    Returns PercentList for on-beats for a kom for all wadon pattern, at beat level guntang,
-    after removing all single strokes and the first of all double strokes
-    
-    With scrambled strokes
-    
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
-    
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOnBeatWadonOGuntangSecondDoubleScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOnBeatWadonOGuntangSecondDoubleScrambled()[1]
-    
-    Want weighed average to be less than 62%, which is the threshold without scrambled patterns
-    >>> percentList.weighedTotalPercentage() < 62
-    True
-    
-    >>> beatTheory
-    
-    
-    >>> len(beatTheory) < 30
-    True
-    
-    this is a bad threshold
+    Returns the weighed percentage of wadon koms on the beat at beat level
+    guntang, after removing all single strokes and the first of all double
+    strokes, in each of permutations scrambled copies of the taught patterns.
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOnBeatWadonOGuntangSecondDoubleScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 62).sum())
+    (27.5, 0)
     '''
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Wadon':
-            pattern = pattern.removeSingleStrokes('o')
-            pattern = pattern.removeConsecutiveStrokes('o')
-            percent = pattern.percentOnBeat('o', bali.BeatLevel.guntang)
-            weight = pattern.beatsInPattern('o')
-            if percent >= 62:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((percent, weight))
-    return (percents, beatTheory)
+    return scrambledNull('percentOnBeatWadonOGuntangSecondDouble', permutations, seed)
 
 '''
 Dag and tut strokes
@@ -307,141 +430,112 @@ Wadon breaks the rules more, so we are testing in which beat subdivisions
 and part of the gong cycle the rules are broken more
 '''
 
-def percentOffBeatLanangTGuntangScrambled():
+def percentOffBeatLanangTGuntangScrambled(permutations=100, seed=0):
     '''
-    Returns PercentList for off-beats for a lanang tut strokes for all lanang patterns, 
-    at beat level guntang. 
-    With scrambled strokes
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
-    
-    Gives us what percent tut strokes land on beat subdivisions 1 and 3 as opposed to
-    2 and 4
-    
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOffBeatLanangTGuntangScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOffBeatLanangTGuntangScrambled()[1]
-    >>> percentList.weighedTotalPercentage() < 97.2
-    True
+    Returns the weighed percentage of lanang tuts off the beat at beat level
+    guntang (on subdivisions 1 and 3 as opposed to 2 and 4) in each of
+    permutations scrambled copies of the taught patterns.
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOffBeatLanangTGuntangScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 97.2).sum())
+    (74.9, 0)
+    '''
+    return scrambledNull('percentOffBeatLanangTGuntang', permutations, seed)
 
-    >>> len(beatTheory) < 10
-    True
+
+def percentOnBeatWadonDGuntangScrambled(permutations=100, seed=0):
     '''
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Lanang':
-            percent = pattern.percentOnBeat('T', bali.BeatLevel.guntang)
-            weight = pattern.beatsInPattern('T')
-            if percent < 2.8:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((100 - percent, weight))
-    return (percents, beatTheory)
-
-
-def percentOnBeatWadonDGuntangScrambled():
-    '''
-    Returns PercentList for on-beats for dag strokes for all wadon patterns, 
-    at beat level guntang. 
-    First of all double strokes removed.
-    Gives us what percent dag strokes land on beat subdivisions 2 and 4 as opposed to
-    1 and 3
-    With scrambled strokes
-    If a certain scrambled pattern beat the theory, it was added to beatTheory
-    
-    >>> import bali, taught_questions, taught_statistics
-    >>> percentList = taught_statistics.percentOnBeatWadonDGuntangScrambled()[0]
-    >>> beatTheory = taught_statistics.percentOnBeatWadonDGuntangScrambled()[1]
-    >>> percentList.weighedTotalPercentage() < 30
-    True
-    
-    >>> len(beatTheory) < 20
-    True
+    Returns the weighed percentage of wadon dags on the beat at beat level
+    guntang (on subdivisions 2 and 4 as opposed to 1 and 3), first of all
+    double strokes removed, in each of permutations scrambled copies of the
+    taught patterns.
+
+    The taught patterns (26%) are no different from scrambled ones:
+
+    >>> import taught_statistics
+    >>> null = taught_statistics.percentOnBeatWadonDGuntangScrambled()
+    >>> round(float(null.mean()), 1), int((null >= 26).sum())
+    (26.0, 55)
     '''
-    
-    randomPatterns = createRandomPatterns(100)
-    percents = PercentList()
-    beatTheory = []
-    for pattern in randomPatterns:
-        if pattern.drumType == 'Wadon':
-            pattern = pattern.removeConsecutiveStrokes('Dd')
-            percent = pattern.percentOnBeat('D', bali.BeatLevel.guntang)
-            weight = pattern.beatsInPattern('D')
-            if percent >= 26:
-                beatTheory.append(pattern.drumPattern)
-            percents.append((percent, weight))
-    return (percents, beatTheory)
-
-
-def whenLanangOffTListScrambled(beatDivision='first'):
-    '''
-    Returns distribution of which half of the gong lanang tuts land in
-    when they're on the first or third division of the beat
-    In dictionary form.
-    With scrambled strokes
-    
-    >>> import bali, taught_questions, taught_statistics
-    
-    Testing when beatDivision is first
-    
-    >>> (taught_statistics.whenLanangOffTListScrambled()['first half']) / (taught_statistics.whenLanangOffTListScrambled()['second half'])
-    
-    
+    return scrambledNull('percentOnBeatWadonDGuntang', permutations, seed)
+
+
+def _scrambledHalves(drumType, typeOfStroke, divisions, permutations, seed):
+    '''
+    Counts, in each of permutations scrambled copies of the taught patterns
+    of drumType, the strokes of typeOfStroke (after removing the first of
+    consecutive ones) that land on one of divisions of the beat (1 to 3)
+    in the first and in the second half of the gong.  This is what
+    Pattern.whenLanangOffT and Pattern.whenWadonOffD count in one
+    pattern, done for every copy at once on a pipeline.StrokeBatch.
+    '''
+    patterns = [p for p in fp.taught if p.drumType == drumType]
+    batch = pipeline.StrokeBatch(patterns).shuffled(permutations,
+                                                     numpy.random.default_rng(seed))
+    runs = bali.StrokeRuns.fromTokens(batch.tokens, batch.offsets, typeOfStroke)
+    # removeConsecutiveStrokes keeps only the last stroke of every run
+    counted = (runs.runLength > 0) & runs.isRunEnd & batch.inWindow
+    counted &= numpy.isin(batch.slot % 4, divisions)
+    firstHalf = 2 * batch.slot < numpy.repeat(batch.numSlots, batch.counts)
+    copy = batch.patternIds // max(1, len(patterns))
+    return {'first half': numpy.bincount(copy[counted & firstHalf], minlength=permutations),
+            'second half': numpy.bincount(copy[counted & ~firstHalf], minlength=permutations)}
+
+
+def whenLanangOffTListScrambled(beatDivision='first', permutations=100, seed=0):
+    '''
+    Returns how many lanang tuts land in each half of the gong when they're
+    on the first (or third) division of the beat, first of all double
+    strokes removed: a dictionary of numpy arrays with the count in each of
+    permutations scrambled copies of the taught patterns.
+
+    >>> import taught_statistics
+    >>> dist = taught_statistics.whenLanangOffTListScrambled()
+    >>> len(dist['first half'])
+    100
+
+    Testing when beatDivision is first: in scrambled patterns the tuts are
+    about even between the halves
+
+    >>> round(float(dist['first half'].sum() / dist['second half'].sum()), 2)
+    1.02
+
     Testing when beatDivision is third
-    
-    >>> (taught_statistics.whenLanangOffTListScrambled('third')['first half']) / (taught_statistics.whenLanangOffTListScrambled('third')['second half'])
 
+    >>> dist = taught_statistics.whenLanangOffTListScrambled('third')
+    >>> round(float(dist['first half'].sum() / dist['second half'].sum()), 2)
+    1.03
     '''
-    
-    randomPatterns = createRandomPatterns(100)
-    dist = {'first half': 0, 'second half': 0}
-    if beatDivision == 'first':
-        for pattern in randomPatterns:
-            if pattern.drumType == 'Lanang':
-                dist['first half'] += pattern.whenLanangOffT()['first half']
-                dist['second half'] += pattern.whenLanangOffT()['second half']
-    elif beatDivision == 'third':
-        for pattern in randomPatterns:
-            if pattern.drumType == 'Lanang':
-                dist['first half'] += pattern.whenLanangOffT('third')['first half']
-                dist['second half'] += pattern.whenLanangOffT('third')['second half']        
-    return dist 
-
-
-
-def whenWadonOffDListScrambled(beatDivision='first'):
-    '''
-    Returns distribution of which half of the gong wadon dags land in
-    when they're on the first or third division of the beat. 
-    In dictionary form.
-    With scrambled strokes
-    
-    >>> import bali, taught_questions, taught_statistics
-    
+    divisions = {'first': (1,), 'third': (3,)}[beatDivision]
+    return _scrambledHalves('Lanang', 'T', divisions, permutations, seed)
+
+
+def whenWadonOffDListScrambled(beatDivision='first', permutations=100, seed=0):
+    '''
+    Returns how many wadon dags land in each half of the gong when they're
+    on the first (or third) division of the beat, first of all double
+    strokes removed: a dictionary of numpy arrays with the count in each of
+    permutations scrambled copies of the taught patterns.  As in
+    Pattern.whenWadonOffD, 'first' counts both the first and the third
+    division.
+
+    >>> import taught_statistics
+
     Testing when beatDivision is first
-    
-    >>> (taught_statistics.whenWadonOffDListScrambled()['first half']) / (taught_statistics.whenWadonOffDListScrambled()['second half'])
 
-    
+    >>> dist = taught_statistics.whenWadonOffDListScrambled()
+    >>> round(float(dist['first half'].sum() / dist['second half'].sum()), 2)
+    1.05
+
     Testing when beatDivision is third
-    
-    >>> (taught_statistics.whenWadonOffDListScrambled('third')['first half']) / (taught_statistics.whenWadonOffDListScrambled('third')['second half'])
 
+    >>> dist = taught_statistics.whenWadonOffDListScrambled('third')
+    >>> round(float(dist['first half'].sum() / dist['second half'].sum()), 2)
+    1.1
     '''
-    
-    randomPatterns = createRandomPatterns(100)
-    dist = {'first half': 0, 'second half': 0}
-    if beatDivision == 'first':
-        for pattern in randomPatterns:
-            if pattern.drumType == 'Wadon':
-                dist['first half'] += pattern.whenWadonOffD()['first half']
-                dist['second half'] += pattern.whenWadonOffD()['second half']
-    elif beatDivision == 'third':
-        for pattern in randomPatterns:
-            if pattern.drumType == 'Wadon':
-                dist['first half'] += pattern.whenWadonOffD('third')['first half']
-                dist['second half'] += pattern.whenWadonOffD('third')['second half']
-    return dist 
+    divisions = {'first': (1, 3), 'third': (3,)}[beatDivision]
+    return _scrambledHalves('Wadon', 'Dd', divisions, permutations, seed)
 
 
 
@@ -467,14 +561,8 @@ def percentOffBeatLanangTDouble():
     >>> percentList.denom()
     111.0
     '''
-    lanangPatterns = fp.separatePatternsByDrum()[0]
-    percents = PercentList()
-    for i in range(len(lanangPatterns)):
-        pattern = lanangPatterns[i]
-        percent = pattern.percentOnBeat('T', bali.BeatLevel.double)
-        weight = pattern.beatsInPattern('T')
-        percents.append((100 - percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOffBeatLanangTDouble']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 def percentOnBeatWadonDDouble():
@@ -495,14 +583,8 @@ def percentOnBeatWadonDDouble():
     
     Close to null hypothesis
     '''
-    wadonPatterns = fp.separatePatternsByDrum()[1]
-    percents = PercentList()
-    for i in range(len(wadonPatterns)):
-        pattern = wadonPatterns[i]
-        percent = pattern.percentOnBeat('D', bali.BeatLevel.double)
-        weight = pattern.beatsInPattern('D')
-        percents.append((percent, weight))
-    return percents
+    hypothesis = hypotheses.registry['percentOnBeatWadonDDouble']
+    return PercentList(hypothesis.percents(fp.taught))
 
 
 
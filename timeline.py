@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+'''
+Rolling-window statistics along the strokes of one improvisation, to see
+how a drummer's playing changes through a performance: the percentage of
+a type of stroke on the beat, or the number of double strokes per beat, in
+a window that slides from the first stroke to the last.
+
+A Timeline lays the consecutive patterns of one drum end to end, each
+measured over slots 1 to numSlots as in Pattern.iterateStrokes.  Every
+statistic is a ratio of two counts of strokes, and every count is kept as
+a cumulative sum over the timeline, so the count in any window is the
+difference of two entries.  Windows can be given in strokes, beats, or
+seconds; the whole series takes time in proportion to the number of
+strokes however wide the windows are (for windows in beats or seconds
+the start of each window is found by a binary search of the sorted
+positions).
+
+>>> import bali, timeline
+>>> fp = bali.FileParser()
+>>> improv = fp.sessions[0].subsessionsByPlayer[0].improvsInGong[0]
+>>> line = timeline.Timeline.fromImprov(improv)
+>>> line
+<timeline.Timeline Lanang: 38 patterns, 1263 strokes>
+>>> onBeat = line.percentOnBeat('e', size=32, by='beats')
+>>> onBeat
+<timeline.RollingSeries percentOnBeat by beats: 1263 windows>
+>>> doubles = line.doubleStrokeDensity('e', size=32, by='beats')
+>>> for i in range(159, len(line), 160):
+...     print(onBeat.positions[i], round(onBeat.values[i], 1), round(doubles.values[i], 2))
+40.25 47.1 0.19
+80.25 57.1 0.28
+120.25 71.4 0.16
+160.25 52.6 0.19
+200.25 59.1 0.41
+240.25 66.7 0.22
+280.25 69.2 0.03
+'''
+from __future__ import print_function, absolute_import, division
+
+import numpy # @UnresolvedImport
+
+import bali
+
+units = ('strokes', 'beats', 'seconds')
+
+
+class RollingSeries(object):
+    '''
+    The value of a statistic in the window that ends at each stroke of a
+    Timeline:
+
+    * positions -- where each window ends, in the unit of the window
+      (the number of strokes, beats, or the onset in seconds)
+    * values -- the statistic in each window (nan if it is undefined there)
+    * complete -- True where the window lies wholly within the timeline,
+      False for the windows at the start that are cut short by it
+    '''
+    def __init__(self, name, by, positions, values, complete):
+        self.name = name
+        self.by = by
+        self.positions = positions
+        self.values = values
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return '<timeline.RollingSeries %s by %s: %d windows>' % (self.name, self.by, len(self))
+
+
+class Timeline(object):
+    '''
+    The strokes of consecutive patterns of one drum laid end to end.  Each
+    pattern gives its slots 1 to numSlots (the stroke before the first beat
+    is the last stroke of the pattern before).  For each stroke:
+
+    * tokens -- the stroke
+    * slot -- its slot within its pattern, for finding the beats
+    * patternIndex -- which of patterns it is in
+    * beats -- the beat it falls at, counting from the start of the timeline:
+      every pattern starts on a whole beat, after the last beat of the pattern
+      before, and its slot n falls n / 4 beats later
+    * seconds -- its onset, or None if any of the patterns has no onsets
+
+    >>> import bali, timeline
+    >>> fp = bali.FileParser()
+    >>> line = timeline.Timeline(fp.taught[1:3])
+    >>> line
+    <timeline.Timeline Lanang: 2 patterns, 32 strokes>
+    >>> ''.join(line.tokens[:16]) == ''.join(fp.taught[1].strokes[1:])
+    True
+    >>> line.slot[14:18].tolist(), line.beats[14:18].tolist()
+    ([15, 16, 1, 2], [3.75, 4.0, 4.25, 4.5])
+    >>> line.seconds is None
+    True
+
+    A pattern of 31 slots still takes up eight beats, so the beats of the
+    patterns after it stay in step with their slots:
+
+    >>> line = timeline.Timeline(fp.transcribed[3:6])
+    >>> [p.numSlots for p in line.patterns]
+    [32, 31, 32]
+    >>> line.slot[62:65].tolist(), line.beats[62:65].tolist()
+    ([31, 1, 2], [15.75, 16.25, 16.5])
+    >>> bool((line.beats % 1 == line.slot % 4 / 4).all())
+    True
+    '''
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        numSlots = numpy.array([p.numSlots for p in self.patterns], dtype=numpy.int64)
+        counts = numpy.array([len(p.strokeKey) for p in self.patterns], dtype=numpy.int64)
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        # every stroke of the patterns, with the one before the first beat, for the runs
+        self._allTokens = numpy.array([s for p in self.patterns for s in p.strokeKey] or [''])
+        self._allTokens = self._allTokens[:int(offsets[-1])]
+        self._offsets = offsets
+
+        starts = numpy.zeros(len(numSlots) + 1, dtype=numpy.int64)
+        numpy.cumsum(numSlots, out=starts[1:])
+        self.patternIndex = numpy.repeat(numpy.arange(len(numSlots)), numSlots)
+        self.slot = numpy.arange(int(starts[-1])) - starts[self.patternIndex] + 1
+        self._select = offsets[self.patternIndex] + self.slot
+        self.tokens = self._allTokens[self._select]
+        firstBeats = numpy.zeros(len(numSlots) + 1, dtype=numpy.int64)
+        numpy.cumsum(-(-numSlots // 4), out=firstBeats[1:]) # whole beats of each pattern
+        self.beats = firstBeats[self.patternIndex] + self.slot / 4
+
+        self.seconds = None
+        if self.patterns and all(isinstance(p, bali.Transcribed) and p.fileParser is not None
+                                 for p in self.patterns):
+            self.seconds = numpy.concatenate([p.onsets[1:n + 1]
+                                              for p, n in zip(self.patterns, numSlots.tolist())])
+        self._runs = {}
+
+    @classmethod
+    def fromImprov(cls, improv, drumType=None):
+        '''
+        The timeline of the patterns of drumType in an ImprovInGong, in the
+        order they are played.  drumType may be left out if only one drum
+        plays in it.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> together = fp.sessions[0].subsessionsByPlayer[-1].improvsInGong[0]
+        >>> timeline.Timeline.fromImprov(together, 'Wadon')
+        <timeline.Timeline Wadon: 25 patterns, 824 strokes>
+        >>> timeline.Timeline.fromImprov(together)
+        Traceback (most recent call last):
+        bali.BaliException: Both drums play in <bali.ImprovInGong Batel>; give a drumType
+        '''
+        drumTypes = sorted(set(p.drumType for p in improv.patterns))
+        if drumType is None:
+            if len(drumTypes) > 1:
+                raise bali.BaliException('Both drums play in %r; give a drumType' % improv)
+            return cls(improv.patterns)
+        return cls(p for p in improv.patterns if p.drumType == drumType)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        drumTypes = '/'.join(sorted(set(p.drumType for p in self.patterns)))
+        return '<timeline.Timeline %s: %d patterns, %d strokes>' % (drumTypes,
+                                                                   len(self.patterns), len(self))
+
+    def runLabels(self, typeOfStroke='e'):
+        '''
+        The bali.RunLabel of each stroke among the runs of typeOfStroke.
+        As in Pattern.removeConsecutiveStrokes, a run never continues from
+        one pattern into the next.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> line = timeline.Timeline([fp.taught[4]])
+        >>> [bali.RunLabel(x).name for x in line.runLabels('e')[:4]]
+        ['firstOfDouble', 'secondOfDouble', 'none', 'single']
+        '''
+        labels = self._runs.get(typeOfStroke)
+        if labels is None:
+            runs = bali.StrokeRuns.fromTokens(self._allTokens, self._offsets, typeOfStroke)
+            labels = self._runs[typeOfStroke] = runs.labels[self._select]
+        return labels
+
+    def isStroke(self, typeOfStroke='e'):
+        '''
+        True for each stroke of typeOfStroke (or of any stroke in it, so
+        'Dd' takes in both D and d).
+        '''
+        return self.runLabels(typeOfStroke) != bali.RunLabel.none
+
+    def onBeat(self, beatLevel=bali.BeatLevel.double):
+        '''
+        True for each stroke that falls on a beat of beatLevel.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> timeline.Timeline([fp.taught[1]]).onBeat('guntang')[:8].tolist()
+        [False, False, False, True, False, False, False, True]
+        '''
+        if isinstance(beatLevel, str):
+            beatLevel = bali.BeatLevel[beatLevel]
+        return self.slot % int(beatLevel) == 0
+
+    def positions(self, by='strokes'):
+        '''
+        Where each stroke is on the timeline in strokes (counting from 1),
+        beats, or seconds.
+        '''
+        if by == 'strokes':
+            return numpy.arange(1, len(self) + 1)
+        if by == 'beats':
+            return self.beats
+        if by == 'seconds':
+            if self.seconds is None:
+                raise bali.BaliException('These patterns have no onsets to measure seconds by')
+            return self.seconds
+        raise bali.BaliException('Unknown window unit %r: choose from %s'
+                                 % (by, ', '.join(units)))
+
+    def windowStarts(self, size, by='strokes'):
+        '''
+        Returns (starts, complete): the window ending at stroke i holds the
+        strokes starts[i] to i, those less than size strokes, beats, or
+        seconds before it, and complete[i] is False if it is cut short by
+        the start of the timeline.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> line = timeline.Timeline(fp.taught[1:3])
+        >>> starts, complete = line.windowStarts(1, by='beats')
+        >>> starts[:6].tolist(), complete[:6].tolist()
+        ([0, 0, 0, 0, 1, 2], [False, False, False, True, True, True])
+        >>> line.windowStarts(4)[0][:6].tolist()
+        [0, 0, 0, 0, 1, 2]
+        >>> line.windowStarts(1, by='bars')
+        Traceback (most recent call last):
+        bali.BaliException: Unknown window unit 'bars': choose from strokes, beats, seconds
+        '''
+        positions = self.positions(by)
+        if by == 'seconds':
+            # onsets are not evenly spaced, so search for each start
+            starts = numpy.searchsorted(positions, positions - size, side='right')
+            complete = positions - size >= positions[0] if len(positions) else positions > 0
+            return starts, complete
+        if by == 'beats':
+            # a pattern of a part of a beat leaves a gap, so search here too
+            if size * 4 < 1:
+                raise bali.BaliException('A window must hold at least one stroke')
+            starts = numpy.searchsorted(positions, positions - size + 1e-9, side='right')
+            return starts, positions - size >= -1e-9
+        # strokes are evenly spaced: a window of size holds the last `width`
+        # strokes, so its start is found without searching
+        width = int(numpy.ceil(size))
+        if width < 1:
+            raise bali.BaliException('A window must hold at least one stroke')
+        ends = numpy.arange(len(positions))
+        return numpy.maximum(ends - width + 1, 0), ends + 1 >= width
+
+    def rolling(self, numerator, denominator=None, size=64, by='strokes', name='rolling'):
+        '''
+        Returns a RollingSeries of the ratio of the number of strokes where
+        numerator is True to the number where denominator is True (by
+        default, all of them) in each window of size strokes, beats, or
+        seconds.  Windows where the denominator counts nothing are nan.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> line = timeline.Timeline([fp.taught[1]])
+        >>> series = line.rolling(line.isStroke('e'), size=4)
+        >>> ''.join(line.tokens)
+        '__ee_e_e_e_e_eT_'
+        >>> series.values.tolist()
+        [0.0, 0.0, 0.333..., 0.5, 0.5, 0.75, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.25]
+        >>> int(series.complete.sum())
+        13
+        '''
+        starts, complete = self.windowStarts(size, by)
+        top = _windowSums(numerator, starts)
+        if denominator is None:
+            bottom = (numpy.arange(len(starts)) + 1 - starts).astype(float)
+        else:
+            bottom = _windowSums(denominator, starts)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            values = numpy.where(bottom > 0, top / numpy.where(bottom > 0, bottom, 1), numpy.nan)
+        return RollingSeries(name, by, self.positions(by), values, complete)
+
+    def percentOnBeat(self, typeOfStroke='e', beatLevel=bali.BeatLevel.double,
+                      size=64, by='strokes'):
+        '''
+        The rolling Pattern.percentOnBeat: the percent of the strokes of
+        typeOfStroke in each window that fall on a beat of beatLevel.  Over
+        a window as long as the whole timeline it is the weighted percent
+        of all its patterns together.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> improv = fp.sessions[0].subsessionsByPlayer[0].improvsInGong[0]
+        >>> line = timeline.Timeline.fromImprov(improv)
+        >>> whole = line.percentOnBeat('e', size=len(line))
+        >>> round(float(whole.values[-1]), 4)
+        61.6667
+        >>> weighted = sum(p.percentOnBeat('e') * p.beatsInPattern('e') for p in improv.patterns)
+        >>> round(weighted / sum(p.beatsInPattern('e') for p in improv.patterns), 4)
+        61.6667
+
+        Windows can be in seconds:
+
+        >>> series = line.percentOnBeat('e', size=10, by='seconds')
+        >>> round(float(series.positions[-1]), 2), round(float(series.values[-1]), 1)
+        (113.02, 55.0)
+        '''
+        isStroke = self.isStroke(typeOfStroke)
+        series = self.rolling(isStroke & self.onBeat(beatLevel), isStroke, size, by,
+                              name='percentOnBeat')
+        series.values *= 100
+        return series
+
+    def doubleStrokeDensity(self, typeOfStroke='e', size=64, by='strokes'):
+        '''
+        The number of double strokes of typeOfStroke (runs of exactly two,
+        whose first stroke bali.StrokeRuns labels RunLabel.firstOfDouble) per
+        beat in each window.
+        A double counts in the window that holds its first stroke.
+
+        >>> import bali, timeline
+        >>> fp = bali.FileParser()
+        >>> line = timeline.Timeline([fp.taught[4]])
+        >>> ''.join(line.tokens)
+        'eeTe____ee_e_e__'
+        >>> series = line.doubleStrokeDensity('e', size=1, by='beats')
+        >>> series.values[series.complete].tolist()
+        [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0]
+        '''
+        firsts = self.runLabels(typeOfStroke) == bali.RunLabel.firstOfDouble
+        series = self.rolling(firsts, None, size, by, name='doubleStrokeDensity')
+        series.values *= 4 # from doubles per slot to doubles per beat
+        return series
+
+
+def _windowSums(indicator, starts):
+    '''
+    The number of True values of indicator from starts[i] to i, for each
+    i, from one cumulative sum.
+    '''
+    cumulative = numpy.zeros(len(indicator) + 1, dtype=numpy.int64)
+    numpy.cumsum(indicator, out=cumulative[1:])
+    return (cumulative[1:] - cumulative[starts]).astype(float)
+
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()
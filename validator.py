@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+'''
+Checks the taught and transcribed pattern files for malformed lines in one
+pass over each file, without building any Pattern objects, and reports every
+problem with the line number it is on.
+
+The checks are:
+
+* unknownStroke -- a drum line token that is not a drum stroke in bali.strokeVocabulary
+* unknownGongStroke -- a gong line token that is not a gong stroke or beat number
+* missingPrefix -- a drum line that does not start with the (x) stroke before the first beat
+* cycleLength -- a taught gong line that does not end in its number of beats,
+  or whose number of slots is not four per beat
+* strokeCount -- a drum line whose number of strokes does not fit the number
+  of beats at the end of the gong line
+* lengthMismatch -- a drum line whose number of strokes does not fit the
+  number of slots in the gong line (checked where the gong line has no beat count)
+* implausibleTime -- a time stamp less than bali.minSecondsPerSlot a slot after
+  the one before it in the same improvisation, as when seconds are written
+  where centiseconds belong
+'''
+from __future__ import print_function, absolute_import, division
+
+import io
+import os
+import re
+
+import bali
+
+vocabulary = bali.strokeVocabulary
+gongStrokes = frozenset(s.symbol for s in vocabulary if 'Gong' in s.drums)
+drumStrokes = frozenset(s.symbol for s in vocabulary
+                        if 'Lanang' in s.drums or 'Wadon' in s.drums)
+
+_titleRe = re.compile(r'(\d+:\d+|time$|\*)')
+
+
+class Diagnostic(object):
+    '''
+    One problem found by the validator.
+
+    >>> import validator
+    >>> d = validator.Diagnostic('all_patterns.txt', 12, 'unknownStroke', "unknown stroke 'x'")
+    >>> d
+    <validator.Diagnostic all_patterns.txt:12 unknownStroke>
+    >>> print(d)
+    all_patterns.txt:12: unknownStroke: unknown stroke 'x'
+    '''
+    def __init__(self, fileName, lineNumber, check, message):
+        self.fileName = fileName
+        self.lineNumber = lineNumber
+        self.check = check
+        self.message = message
+
+    def __repr__(self):
+        return '<validator.Diagnostic %s:%d %s>' % (self.fileName, self.lineNumber, self.check)
+
+    def __str__(self):
+        return '%s:%d: %s: %s' % (self.fileName, self.lineNumber, self.check, self.message)
+
+
+def gongSlots(gongLine):
+    '''
+    Returns the slots of a gong line after its (x) prefix, split by
+    bali.strokeVocabulary: 'pu-' is two slots and a beat number (even 10 or
+    more) is one.
+
+    >>> import validator
+    >>> validator.gongSlots('(G)- - - pu- - - G')
+    ['-', '-', '-', 'pu', '-', '-', '-', 'G']
+    >>> len(validator.gongSlots('(4)- ● - 1 - ● - 2 - ● - 3 - ● – 4'))
+    16
+    >>> validator.gongSlots('(10)- ● - 9 - ● – 10')
+    ['-', '●', '-', '9', '-', '●', '-', '10']
+    '''
+    return vocabulary.gongTokens(gongLine)
+
+
+def _checkGong(gongLine, lineNumber, fileName, requireBeatCount, diagnostics):
+    '''
+    Checks one gong line; returns (number of slots, number of beats or None).
+    '''
+    slots = gongSlots(gongLine)
+    for slot in slots:
+        if slot not in gongStrokes and not slot.isdigit():
+            diagnostics.append(Diagnostic(fileName, lineNumber, 'unknownGongStroke',
+                                          'unknown gong stroke %r' % slot))
+    beats = None
+    if slots and slots[-1].isdigit():
+        beats = int(slots[-1])
+        if len(slots) != beats * 4:
+            diagnostics.append(Diagnostic(fileName, lineNumber, 'cycleLength',
+                                          'gong line of %d beats has %d slots, not %d'
+                                          % (beats, len(slots), beats * 4)))
+    elif requireBeatCount:
+        diagnostics.append(Diagnostic(fileName, lineNumber, 'cycleLength',
+                                      'gong line does not end in its number of beats'))
+    return len(slots), beats
+
+
+def _checkDrums(drumLine, lineNumber, fileName, gong, diagnostics):
+    '''
+    Checks one drum line against the gong line before it: gong is
+    (number of slots, number of beats or None), or None if there was no gong line.
+    '''
+    if not (drumLine.startswith('(') and drumLine[2:3] == ')'):
+        diagnostics.append(Diagnostic(fileName, lineNumber, 'missingPrefix',
+                                      'drum line does not start with (x)'))
+    tokens = vocabulary.drumTokens(drumLine)
+    for token in tokens:
+        if token not in drumStrokes:
+            diagnostics.append(Diagnostic(fileName, lineNumber, 'unknownStroke',
+                                          'unknown stroke %r' % token))
+    if gong is None:
+        return
+    numSlots, beats = gong
+    if beats is not None:
+        if len(tokens) != beats * 4 + 1:
+            diagnostics.append(Diagnostic(fileName, lineNumber, 'strokeCount',
+                                          '%d strokes for %d beats; expected %d'
+                                          % (len(tokens), beats, beats * 4 + 1)))
+    elif len(tokens) != numSlots + 1:
+        diagnostics.append(Diagnostic(fileName, lineNumber, 'lengthMismatch',
+                                      '%d strokes for a gong line of %d slots; expected %d'
+                                      % (len(tokens), numSlots, numSlots + 1)))
+
+
+def _checkTime(seconds, lineNumber, fileName, lastStamp, slots):
+    '''
+    Returns an implausibleTime Diagnostic if a time stamp of seconds comes
+    too soon after lastStamp, (seconds, lineNumber, slots), for the slots
+    played in between, or None.
+
+    >>> import validator
+    >>> print(validator._checkTime(0.11, 13, 'all_patterns.txt', (0.08, 9, 0), 32))
+    all_patterns.txt:13: implausibleTime: 0.03 seconds for the 32 slots since line 9
+    >>> validator._checkTime(11.0, 13, 'all_patterns.txt', (8.0, 9, 0), 32) is None
+    True
+    '''
+    lastSeconds, lastLine, lastSlots = lastStamp
+    if (seconds - lastSeconds) / (slots - lastSlots) >= bali.minSecondsPerSlot:
+        return None
+    return Diagnostic(fileName, lineNumber, 'implausibleTime',
+                      '%.2f seconds for the %d slots since line %d'
+                      % (seconds - lastSeconds, slots - lastSlots, lastLine))
+
+
+def validateTaught(lines, fileName='taught_patterns.txt'):
+    '''
+    Checks the lines of a taught patterns file: blocks of title, gong line,
+    drum line, and comments, separated by blank lines.  Returns a list of
+    Diagnostics (see iterateTaught).
+
+    >>> import validator
+    >>> lines = ['Lanang Dasar', '(4)- ● - 1 - ● - 2 - ● - 3 - ● – 4',
+    ...          '(e)_ e _ e _ e _ e _ e _ e _ e _ x', '',
+    ...          'Wadon', '(4)- ● - 1 - ● - 2 - ● - 3 - ● – 4', 'o _ o _', '']
+    >>> for d in validator.validateTaught(lines):
+    ...     print(d)
+    taught_patterns.txt:3: unknownStroke: unknown stroke 'x'
+    taught_patterns.txt:7: missingPrefix: drum line does not start with (x)
+    taught_patterns.txt:7: strokeCount: 4 strokes for 4 beats; expected 17
+    '''
+    return list(iterateTaught(lines, fileName))
+
+
+def iterateTaught(lines, fileName='taught_patterns.txt'):
+    '''
+    Yields the Diagnostics of validateTaught as each line is checked, so
+    lines can be an open file.
+    '''
+    lineInBlock = 0
+    gong = None
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        if line == '':
+            lineInBlock = 0
+            gong = None
+            continue
+        diagnostics = []
+        if lineInBlock == 1:
+            gong = _checkGong(line, lineNumber, fileName, True, diagnostics)
+        elif lineInBlock == 2:
+            _checkDrums(line, lineNumber, fileName, gong, diagnostics)
+        lineInBlock += 1
+        for d in diagnostics:
+            yield d
+
+
+def validateTranscribed(lines, fileName='all_patterns.txt'):
+    '''
+    Checks the lines of a transcription file, following its headings and
+    time blocks the way FileParser.parseTranscribed does.  Returns a list of
+    Diagnostics (see iterateTranscribed).
+
+    >>> import validator
+    >>> lines = ['===== Pak Cok and Pak Dewa', '==== together',
+    ...          '=== Lanang - Pak Cok; Wadon - Pak Dewa', '== Batel', '',
+    ...          '00:06:13', '(G)- - - pu- - - G', '(l)_ r e e T e T e',
+    ...          '` ` ` o d D _ _', '',
+    ...          '00:07:13', '(G)- - - pu- - - G', '(l)_ r e e T e T', '(o)o Q o _ _ _ _ o']
+    >>> for d in validator.validateTranscribed(lines):
+    ...     print(d)
+    all_patterns.txt:9: missingPrefix: drum line does not start with (x)
+    all_patterns.txt:9: lengthMismatch: 8 strokes for a gong line of 8 slots; expected 9
+    all_patterns.txt:13: lengthMismatch: 8 strokes for a gong line of 8 slots; expected 9
+    all_patterns.txt:14: unknownStroke: unknown stroke 'Q'
+    '''
+    return list(iterateTranscribed(lines, fileName))
+
+
+def iterateTranscribed(lines, fileName='all_patterns.txt'):
+    '''
+    Yields the Diagnostics of validateTranscribed as each line is checked,
+    so lines can be an open file.
+    '''
+    isTogether = False
+    gong = None
+    drumsSeen = 0
+    slots = 0 # slots of the gong lines so far in this improvisation
+    lastStamp = None # (seconds, lineNumber, slots) of its latest time stamp
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        drumsInBlock = 2 if isTogether else 1
+        if gong is None or drumsSeen and _titleRe.match(line):
+            seconds = bali.secondsFromTimestamp(line)
+            if seconds is not None and (lastStamp is None or seconds > lastStamp[0]):
+                if lastStamp is not None and slots > lastStamp[2]:
+                    d = _checkTime(seconds, lineNumber, fileName, lastStamp, slots)
+                    if d is not None:
+                        yield d
+                lastStamp = (seconds, lineNumber, slots)
+        if line.startswith('='):
+            if len(line) - len(line.lstrip('=')) == 4:
+                isTogether = 'together' in line.lower()
+            gong = None
+            slots = 0
+            lastStamp = None
+        elif line == '':
+            if drumsSeen >= drumsInBlock:
+                gong = None
+        elif line.startswith('(G)'):
+            diagnostics = []
+            gong = _checkGong(line, lineNumber, fileName, False, diagnostics)
+            slots += gong[0]
+            drumsSeen = 0
+            for d in diagnostics:
+                yield d
+        elif gong is None:
+            continue # title or comment
+        elif drumsSeen and _titleRe.match(line):
+            gong = None
+        elif drumsSeen < drumsInBlock:
+            diagnostics = []
+            _checkDrums(line, lineNumber, fileName, gong, diagnostics)
+            drumsSeen += 1
+            for d in diagnostics:
+                yield d
+
+
+def validateCorpus(fileReader=None):
+    '''
+    Checks both files of a FileReader (by default the files that come with
+    this package), or every file of a bali.CorpusReader, and returns all the
+    Diagnostics, taught files first (see iterateCorpus).
+
+    >>> import validator
+    >>> diagnostics = validator.validateCorpus()
+    >>> diagnostics[0]
+    <validator.Diagnostic all_patterns.txt:13 implausibleTime>
+    >>> sorted(set(d.check for d in diagnostics))
+    ['implausibleTime', 'lengthMismatch', 'missingPrefix', 'unknownStroke']
+    >>> [d.lineNumber for d in diagnostics if d.check == 'implausibleTime']
+    [13, 33, 49, 57]
+    >>> print([d for d in diagnostics if d.check == 'unknownStroke'][0])
+    all_patterns.txt:437: unknownStroke: unknown stroke 'p'
+    '''
+    return list(iterateCorpus(fileReader))
+
+
+def iterateCorpus(fileReader=None):
+    '''
+    Yields the Diagnostics of validateCorpus as each line is checked; the
+    files of a bali.CorpusReader are read a line at a time.
+
+    >>> import validator
+    >>> next(validator.iterateCorpus())
+    <validator.Diagnostic all_patterns.txt:13 implausibleTime>
+    '''
+    if fileReader is None:
+        fileReader = bali.FileReader()
+    if len(fileReader.taughtFiles) == 1 and len(fileReader.transcribedFiles) == 1:
+        for d in iterateTaught(fileReader.taught, os.path.basename(fileReader._taught)):
+            yield d
+        for d in iterateTranscribed(fileReader.transcribed,
+                                    os.path.basename(fileReader._transcribed)):
+            yield d
+        return
+
+    # a bali.CorpusReader: check each file on its own so line numbers are right
+    for iterate, paths in ((iterateTaught, fileReader.taughtFiles),
+                           (iterateTranscribed, fileReader.transcribedFiles)):
+        for path in paths:
+            with io.open(path, encoding='utf-8') as f:
+                for d in iterate(f, os.path.basename(path)):
+                    yield d
+
+if __name__ == '__main__':
+    import music21
+    music21.mainTest()